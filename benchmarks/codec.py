@@ -0,0 +1,221 @@
+"""
+Encode / decode speed of the wire types, precompiled codecs against the
+previous per field struct.pack implementation.
+
+python -m benchmarks.codec [--iterations N]
+"""
+from __future__ import annotations
+
+import argparse
+import struct
+import timeit
+from dataclasses import astuple
+from typing import Callable
+
+from pyaccsharedmemory import (ACC_RAIN_INTENSITY, ACC_SESSION_TYPE,
+                               ACC_TRACK_GRIP_STATUS, CarDamage, Wheels)
+
+from benchmarks.samples import (make_car_info, make_pit_stop, make_telemetry,
+                                make_telemetry_rt, make_tyre_sets)
+from modules.Common import CarInfo, PitStop
+from modules.Telemetry import Telemetry, TelemetryRT
+from modules.TyreSets import TyreSetData, TyresSetData
+
+
+def legacy_telemetry_to_bytes(self: Telemetry) -> bytes:
+
+    driver_bytes = self.driver.encode("utf-8")
+
+    buffer = [
+        struct.pack("!B", len(driver_bytes)),
+        driver_bytes,
+        struct.pack("!i", self.lap),
+        struct.pack("!f", self.fuel),
+        struct.pack("!f", self.fuel_per_lap),
+        struct.pack("!f", self.fuel_estimated_laps),
+        struct.pack("!4f", *astuple(self.pad_wear)),
+        struct.pack("!4f", *astuple(self.disc_wear)),
+        struct.pack("!i", self.lap_time),
+        struct.pack("!i", self.best_time),
+        struct.pack("!i", self.previous_time),
+        struct.pack("!?", self.in_pit),
+        struct.pack("!?", self.in_pit_lane),
+        struct.pack("!B", self.session.value),
+        struct.pack("!i", self.driver_stint_time_left),
+        struct.pack("!4f", *astuple(self.tyre_pressure)),
+        struct.pack("!4f", *astuple(self.tyre_temp)),
+        struct.pack("!4f", *astuple(self.brake_temp)),
+        struct.pack("!?", self.has_wet_tyres),
+        struct.pack("!f", self.session_left),
+        struct.pack("!B", self.grip.value),
+        struct.pack("!B", self.front_pad),
+        struct.pack("!B", self.rear_pad),
+        struct.pack("!5f", *astuple(self.damage)),
+        struct.pack("!B", self.condition.value),
+        struct.pack("!4f", *astuple(self.suspension_damage)),
+        struct.pack("!i", self.current_sector_index),
+        struct.pack("!i", self.last_sector_time),
+        struct.pack("!?", self.is_lap_valid),
+        struct.pack("!f", self.air_temp),
+        struct.pack("!f", self.road_temp),
+        struct.pack("!f", self.wind),
+        struct.pack("!i", self.driver_stint_total_time_left),
+        struct.pack("!i", self.current_tyreset),
+    ]
+
+    return b"".join(buffer)
+
+
+def legacy_telemetry_from_bytes(data: bytes) -> Telemetry:
+
+    lenght = data[0]
+    data = data[:1 + lenght + Telemetry.byte_size - 1]
+    raw_data = struct.unpack(
+        f"!{lenght}s i 11f 3i 2? B i 12f ? f B 2B 5f B 4f 2i ? 3f 2i",
+        data[1:])
+
+    rest = raw_data[1:]
+    return Telemetry(
+        raw_data[0].decode("utf-8"), rest[0], rest[1], rest[2], rest[3],
+        Wheels(*rest[4:8]), Wheels(*rest[8:12]), rest[12], rest[13],
+        rest[14], rest[15], rest[16], ACC_SESSION_TYPE(rest[17]), rest[18],
+        Wheels(*rest[19:23]), Wheels(*rest[23:27]), Wheels(*rest[27:31]),
+        rest[31], rest[32], ACC_TRACK_GRIP_STATUS(rest[33]), rest[34],
+        rest[35], CarDamage(*rest[36:41]), ACC_RAIN_INTENSITY(rest[41]),
+        Wheels(*rest[42:46]), *rest[46:54])
+
+
+def legacy_telemetry_rt_to_bytes(self: TelemetryRT) -> bytes:
+
+    return struct.pack("!3f i f", *astuple(self))
+
+
+def legacy_telemetry_rt_from_bytes(data: bytes) -> TelemetryRT:
+
+    return TelemetryRT(*struct.unpack("!3f i f", data[:20]))
+
+
+def legacy_car_info_to_bytes(self: CarInfo) -> bytes:
+
+    return struct.pack("!6f i", *astuple(self))
+
+
+def legacy_car_info_from_bytes(data: bytes) -> CarInfo:
+
+    return CarInfo(*struct.unpack("!6f i", data[:28]))
+
+
+def legacy_pit_stop_to_bytes(self: PitStop) -> bytes:
+
+    buffer = []
+    buffer.append(struct.pack("!8s", self.timestamp.encode("utf-8")))
+    buffer.append(struct.pack("!f", self.fuel))
+    buffer.append(struct.pack("!i", self.tyre_set))
+    buffer.append(struct.pack("!3s", self.tyre_compound.encode("utf-8")))
+    buffer.append(struct.pack("!4f", *self.tyre_pressures))
+    buffer.append(struct.pack("!i", self.driver_offset))
+    buffer.append(struct.pack("!i", self.brake_pad))
+    buffer.append(struct.pack("!?", self.repairs_bodywork))
+    buffer.append(struct.pack("!?", self.repairs_suspension))
+
+    return b"".join(buffer)
+
+
+def legacy_pit_stop_from_bytes(data: bytes) -> PitStop:
+
+    temp_data = struct.unpack("! 8s f i 3s 4f 2i 2?", data[:PitStop.byte_size])
+
+    return PitStop(temp_data[0].decode("utf-8"), temp_data[1], temp_data[2],
+                   temp_data[3].decode("utf-8"), tuple(temp_data[4:8]),
+                   *temp_data[8:12])
+
+
+def legacy_tyre_set_to_bytes(self: TyreSetData) -> bytes:
+
+    buffer = [
+        struct.pack("!3f", *self.treadIMO),
+        struct.pack("!f", self.grain),
+        struct.pack("!f", self.blister),
+        struct.pack("!f", self.marble),
+        struct.pack("!f", self.flatspot),
+    ]
+
+    return b"".join(buffer)
+
+
+def legacy_tyres_set_to_bytes(self: TyresSetData) -> bytes:
+
+    return b"".join(legacy_tyre_set_to_bytes(tyre)
+                    for tyre in (self.FL, self.FR, self.RL, self.RR))
+
+
+def legacy_tyres_set_from_bytes(data: bytes) -> TyresSetData:
+
+    temp = []
+    for index in range(4):
+        raw_data = struct.unpack("!3f 4f", data[index * 28:index * 28 + 28])
+        temp.append(TyreSetData(raw_data[0:3], *raw_data[3:7]))
+
+    return TyresSetData(*temp)
+
+
+def ops(function: Callable, iterations: int) -> float:
+
+    return iterations / timeit.timeit(function, number=iterations)
+
+
+def compare(name: str, legacy: Callable, new: Callable,
+            iterations: int) -> None:
+
+    legacy_ops = ops(legacy, iterations)
+    new_ops = ops(new, iterations)
+    print(f"{name:<24} {legacy_ops:>12,.0f} {new_ops:>12,.0f}"
+          f" {new_ops / legacy_ops:>7.2f}x")
+
+
+def run(iterations: int) -> None:
+
+    telemetry = make_telemetry()
+    telemetry_rt = make_telemetry_rt()
+    car_info = make_car_info()
+    pit_stop = make_pit_stop()
+    tyres_set = make_tyre_sets(1)[0]
+
+    cases = (
+        ("Telemetry", telemetry, legacy_telemetry_to_bytes,
+         legacy_telemetry_from_bytes, lambda d: Telemetry.from_bytes(d)),
+        ("TelemetryRT", telemetry_rt, legacy_telemetry_rt_to_bytes,
+         legacy_telemetry_rt_from_bytes, TelemetryRT.from_bytes),
+        ("CarInfo", car_info, legacy_car_info_to_bytes,
+         legacy_car_info_from_bytes, CarInfo.from_bytes),
+        ("PitStop", pit_stop, legacy_pit_stop_to_bytes,
+         legacy_pit_stop_from_bytes, PitStop.from_bytes),
+        ("TyresSetData", tyres_set, legacy_tyres_set_to_bytes,
+         legacy_tyres_set_from_bytes, TyresSetData.from_bytes),
+    )
+
+    print(f"{'ops/s':<24} {'legacy':>12} {'codec':>12} {'speedup':>8}")
+    for name, message, legacy_encode, legacy_decode, decode in cases:
+
+        data = message.to_bytes()
+        assert data == legacy_encode(message), name
+
+        compare(f"{name} encode", lambda: legacy_encode(message),
+                message.to_bytes, iterations)
+        compare(f"{name} decode", lambda: legacy_decode(data),
+                lambda: decode(data), iterations)
+
+    tyre_sets = make_tyre_sets(50)
+    compare("50 TyresSetData encode",
+            lambda: struct.pack("!B", len(tyre_sets)) + b"".join(
+                legacy_tyres_set_to_bytes(tyre) for tyre in tyre_sets),
+            lambda: TyresSetData.list_to_bytes(tyre_sets), iterations // 50)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    run(args.iterations)
@@ -0,0 +1,124 @@
+"""
+Size of the TCP packets compressed with and without the preset dictionary
+of modules.Compression, and cost of a room broadcast compressed once
+against once per member.
+
+--train prints a dictionary built from sample packets, the way ZDICT was
+made. A new dictionary must be a new COMPRESSION flag, peers of different
+versions would not understand each other.
+
+python -m benchmarks.compression [--members N] [--train]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import zlib
+from typing import Callable, List
+
+from benchmarks.samples import (make_car_info, make_pit_stop, make_telemetry,
+                                make_tyre_sets, tyre_sets_payload)
+from modules.Common import PacketType
+from modules.Compression import (COMPRESSION_LEVEL, ZDICT, compress,
+                                 decompress)
+
+TRAINING_SEED = 0
+# Pit stops of the strategy history in the dictionary
+TRAINING_STRATEGIES = 8
+REPEAT = 2000
+
+
+def strategy_history(count: int) -> bytes:
+
+    return (PacketType.StategyHistory.to_bytes() + bytes((count,)) +
+            b"".join(make_pit_stop().to_bytes() for _ in range(count)))
+
+
+def train() -> bytes:
+    """
+    Dictionary from sample packets, the most common shapes at the end
+    where they are the cheapest to reference
+    """
+
+    random.seed(TRAINING_SEED)
+    return (PacketType.Telemetry.to_bytes() + make_telemetry().to_bytes() +
+            strategy_history(TRAINING_STRATEGIES))
+
+
+def zlib_size(data: bytes) -> int:
+
+    return len(zlib.compress(data, COMPRESSION_LEVEL))
+
+
+def timed(function: Callable[[], None]) -> float:
+    """
+    µs per call
+    """
+
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        function()
+
+    return (time.perf_counter() - start) / REPEAT * 1e6
+
+
+def sizes() -> None:
+
+    packets = (
+        ("ServerData", PacketType.ServerData.to_bytes()
+         + make_car_info().to_bytes()),
+        ("Strategy", PacketType.Strategy.to_bytes()
+         + make_pit_stop().to_bytes()),
+        ("Telemetry", PacketType.Telemetry.to_bytes()
+         + make_telemetry().to_bytes()),
+        ("StategyHistory 5", strategy_history(5)),
+        ("StategyHistory 50", strategy_history(50)),
+        ("TyreSets", PacketType.TyreSets.to_bytes()
+         + tyre_sets_payload(make_tyre_sets())),
+    )
+
+    for name, packet in packets:
+
+        compressed = compress(packet)
+        assert compressed is None or decompress(compressed) == packet
+        sent = packet if compressed is None else compressed
+        print(f"{name:<18} {len(packet):>6} B, zlib {zlib_size(packet):>6} B,"
+              f" sent {len(sent):>6} B"
+              f" ({'as is' if compressed is None else 'compressed'})")
+
+
+def fan_out(members: int) -> None:
+
+    packet = strategy_history(20)
+    users: List[bytes] = []
+
+    def once() -> None:
+        compressed = compress(packet)
+        users.clear()
+        users.extend(compressed for _ in range(members))
+
+    def each() -> None:
+        users.clear()
+        users.extend(compress(packet) for _ in range(members))
+
+    print(f"StategyHistory 20 to {members} members: compressed once"
+          f" {timed(once):.1f}µs, per member {timed(each):.1f}µs")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--train", action="store_true")
+    args = parser.parse_args()
+
+    if args.train:
+        dictionary = train()
+        for index in range(0, len(dictionary), 16):
+            print(f"    {dictionary[index:index+16]!r}")
+
+    else:
+        print(f"Dictionary of {len(ZDICT)} bytes")
+        sizes()
+        fan_out(args.members)
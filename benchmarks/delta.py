@@ -0,0 +1,140 @@
+"""
+Uplink bytes of the Telemetry stream with keyframe + delta encoding against
+full frames, on a simulated stint (on track then stopped in the pit), and
+the frames still rebuilt with random datagram loss. TelemetryRT is shown
+too, its deltas don't save anything on track and it is sent without.
+
+python -m benchmarks.delta [--frames N] [--loss L]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+from dataclasses import replace
+from typing import Iterator, List
+
+from pyaccsharedmemory import Wheels
+
+from benchmarks.samples import make_telemetry, make_telemetry_rt
+from modules.Client import TELEMETRY_KEYFRAME_INTERVAL, TELEMETRY_STREAMS
+from modules.Delta import DeltaDecoder, DeltaEncoder
+from modules.Telemetry import TelemetryRT
+
+# A TelemetryRT keyframe every 2s, were it sent with deltas
+TELEMETRY_RT_KEYFRAME_INTERVAL = 20
+
+
+def drift(wheels: Wheels, step: float) -> Wheels:
+
+    return Wheels(*(value + random.uniform(-step, step)
+                    for value in (wheels.front_left, wheels.front_right,
+                                  wheels.rear_left, wheels.rear_right)))
+
+
+def telemetry_stint(frames: int, on_track: bool) -> Iterator[bytes]:
+    """
+    Telemetry every 0.5s, what changes on track is the wear, temperatures,
+    pressures, fuel and the timers
+    """
+
+    telemetry = make_telemetry()
+    for _ in range(frames):
+
+        if on_track:
+            telemetry = replace(
+                telemetry,
+                fuel=telemetry.fuel - 0.01,
+                fuel_estimated_laps=telemetry.fuel_estimated_laps - 0.005,
+                pad_wear=drift(telemetry.pad_wear, 1e-5),
+                disc_wear=drift(telemetry.disc_wear, 1e-5),
+                lap_time=telemetry.lap_time + 500,
+                tyre_pressure=drift(telemetry.tyre_pressure, 0.01),
+                tyre_temp=drift(telemetry.tyre_temp, 0.1),
+                brake_temp=drift(telemetry.brake_temp, 5),
+                session_left=telemetry.session_left - 500,
+                driver_stint_time_left=telemetry.driver_stint_time_left - 500,
+                driver_stint_total_time_left=(
+                    telemetry.driver_stint_total_time_left - 500))
+
+        else:
+            telemetry = replace(
+                telemetry,
+                brake_temp=drift(telemetry.brake_temp, 1),
+                session_left=telemetry.session_left - 500)
+
+        yield telemetry.to_bytes()
+
+
+def telemetry_rt_stint(frames: int, on_track: bool) -> Iterator[bytes]:
+
+    telemetry = make_telemetry_rt()
+    for _ in range(frames):
+
+        if on_track:
+            telemetry = TelemetryRT(random.random(), random.random(),
+                                    random.uniform(-1, 1),
+                                    random.randint(2, 7),
+                                    random.uniform(80, 280))
+
+        yield telemetry.to_bytes()
+
+
+def run(name: str, payloads: List[bytes], stream, interval: int,
+        loss: float) -> None:
+
+    key_packet, delta_packet, layout, _ = stream
+    encoder = DeltaEncoder(layout, key_packet, delta_packet, interval)
+    decoder = DeltaDecoder(layout)
+
+    full = 0
+    encoded = 0
+    rebuilt = 0
+    delivered = 0
+    for payload in payloads:
+
+        packet = encoder.encode(payload)
+        full += 1 + len(payload)
+        encoded += len(packet)
+
+        if random.random() < loss:
+            continue
+
+        delivered += 1
+        if packet[0] == key_packet.value:
+            result = decoder.keyframe(packet[1:])
+
+        else:
+            result = decoder.decode(packet[1:])
+
+        if result is not None:
+            assert result == payload
+            rebuilt += 1
+
+    print(f"{name:<22} {full / len(payloads):>6.1f} -> "
+          f"{encoded / len(payloads):>6.1f} B/frame"
+          f" ({(1 - encoded / full) * 100:>4.1f}% less),"
+          f" keyframes {encoder.keyframes:>5}, rebuilt {rebuilt}/{delivered}"
+          f" delivered frames")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=10_000)
+    parser.add_argument("--loss", type=float, default=0.05,
+                        help="Share of the datagrams lost, 0 to 1")
+    args = parser.parse_args()
+    frames = args.frames
+    loss = args.loss
+
+    telemetry_stream, telemetry_rt_stream = TELEMETRY_STREAMS
+
+    print(f"{frames} frames, {loss * 100:.0f}% loss")
+    for on_track in (True, False):
+
+        where = "on track" if on_track else "in pit"
+        run(f"Telemetry {where}", list(telemetry_stint(frames, on_track)),
+            telemetry_stream, TELEMETRY_KEYFRAME_INTERVAL, loss)
+        run(f"TelemetryRT {where}",
+            list(telemetry_rt_stint(frames, on_track)),
+            telemetry_rt_stream, TELEMETRY_RT_KEYFRAME_INTERVAL, loss)
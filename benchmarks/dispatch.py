@@ -0,0 +1,89 @@
+"""
+Per packet dispatch cost, PacketDispatcher table against the previous
+PacketType.from_bytes + if/elif chain of TCP_Server.decode_data.
+
+python -m benchmarks.dispatch [--packets N]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import timeit
+
+from modules.Common import PacketType
+from modules.Dispatch import PacketDispatcher
+
+
+def handler(data: bytes) -> None:
+    pass
+
+
+def legacy_decode_data(data: bytes) -> None:
+
+    packet = PacketType.from_bytes(data)
+
+    if packet == PacketType.Connect:
+        handler(data)
+
+    elif packet == PacketType.SmData:
+        handler(data)
+
+    elif packet == PacketType.Strategy:
+        handler(data)
+
+    elif packet == PacketType.StrategyOK:
+        handler(data)
+
+    elif packet == PacketType.TyreSets:
+        handler(data)
+
+    else:
+        pass
+
+
+def run(packet_count: int) -> None:
+
+    # Unknown packets log a warning in both implementations
+    logging.disable(logging.WARNING)
+
+    dispatcher = PacketDispatcher("benchmark", handler)
+    for packet in (PacketType.Connect, PacketType.SmData,
+                   PacketType.Strategy, PacketType.StrategyOK,
+                   PacketType.TyreSets):
+        dispatcher.register(packet, handler)
+
+    random.seed(4269)
+    for name, types in (
+            ("first branch", [PacketType.Connect]),
+            ("last branch", [PacketType.TyreSets]),
+            ("server mix", [PacketType.SmData] * 8
+             + [PacketType.Strategy, PacketType.StrategyOK]),
+            ("unknown type", [PacketType.Telemetry])):
+
+        packets = [random.choice(types).to_bytes() + b"\x00" * 32
+                   for _ in range(packet_count)]
+
+        def legacy() -> None:
+            for packet in packets:
+                legacy_decode_data(packet)
+
+        def table() -> None:
+            dispatch = dispatcher.dispatch
+            for packet in packets:
+                dispatch(packet)
+
+        legacy_ns = timeit.timeit(legacy, number=1) / packet_count * 1e9
+        table_ns = timeit.timeit(table, number=1) / packet_count * 1e9
+        print(f"{name:<14} legacy {legacy_ns:>7.0f} ns/packet,"
+              f" table {table_ns:>5.0f} ns/packet,"
+              f" {legacy_ns / table_ns:>5.1f}x")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--packets", type=int, default=200_000)
+    args = parser.parse_args()
+
+    run(args.packets)
@@ -0,0 +1,215 @@
+"""
+UDP relay throughput and latency of the twisted and asyncio engines of the
+headless server, under the same load.
+
+For each engine a headless_server.py is started with --engine, load
+processes then join rooms with a few UDP clients each, the first of each
+room (its telemetry source, see modules.Election) sends TelemetryRT flat
+out or at --rate datagrams/s per load process. Every datagram carries
+its send time (CLOCK_MONOTONIC, shared by the processes) so the clients
+receiving it back from their room measure the relay latency.
+
+python -m benchmarks.engines [--engines twisted,asyncio] [--rooms N]
+                             [--members N] [--loaders N] [--rate N]
+                             [--duration S]
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks.samples import make_telemetry_rt
+from modules.Codec import UDP_HEADER
+from modules.Common import PacketType
+
+TCP_PORT = 14269
+UDP_PORT = 14270
+STARTUP_DELAY = 2
+SEND_TIME = struct.Struct("!q")
+# Keep the latency of one relayed datagram out of LATENCY_SAMPLING
+LATENCY_SAMPLING = 8
+
+
+def load(rooms: List[str], members: int, duration: float, rate: float,
+         barrier, results) -> None:
+    """
+    Send TelemetryRT from the first member of rooms and time the relayed
+    ones
+    """
+
+    payload = make_telemetry_rt().to_bytes()
+    packet = PacketType.TelemetryRT.to_bytes()
+    size = len(packet) + UDP_HEADER.size + len(payload) + SEND_TIME.size
+
+    sockets = []
+    for room in rooms:
+
+        token = room.encode("utf-8")
+        hello = PacketType.ConnectUDP.to_bytes() + bytes((len(token),)) \
+            + token
+
+        for _ in range(members):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect(("127.0.0.1", UDP_PORT))
+            sock.send(hello)
+            sock.setblocking(False)
+            sockets.append(sock)
+
+    latencies = []
+
+    def drain(timed: bool) -> int:
+
+        received = 0
+        for sock in sockets:
+
+            while True:
+                try:
+                    datagram = sock.recv(2048)
+
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+
+                # Not the heartbeats of the server
+                if len(datagram) != size or datagram[:1] != packet:
+                    continue
+
+                received += 1
+                if timed and received % LATENCY_SAMPLING == 0:
+                    sent_ns, = SEND_TIME.unpack_from(datagram,
+                                                     size - SEND_TIME.size)
+                    latencies.append(time.monotonic_ns() - sent_ns)
+
+        return received
+
+    barrier.wait()
+    time.sleep(0.5)
+    drain(False)
+
+    # The other members would stand by
+    senders = sockets[::members]
+    # Time between two rounds over the senders, 0 is flat out
+    period = len(senders) / rate if rate else 0
+
+    sent = 0
+    sequence = 0
+    received = 0
+    start = time.perf_counter()
+    end = start + duration
+    next_round = start
+    while True:
+
+        now = time.perf_counter()
+        if now >= end:
+            break
+
+        if now >= next_round:
+            next_round += period
+            sequence = (sequence + 1) % (1 << 16)
+
+            for sender, sock in enumerate(senders):
+                header = UDP_HEADER.pack(sender, sequence,
+                                         int(now * 1000) % (1 << 32))
+                try:
+                    sock.send(packet + header + payload +
+                              SEND_TIME.pack(time.monotonic_ns()))
+                    sent += 1
+
+                except (BlockingIOError, ConnectionRefusedError):
+                    pass
+
+        received += drain(True)
+
+    results.put((sent, received, latencies))
+
+
+def percentile(values: List[int], fraction: float) -> float:
+    """
+    Value in ms below which fraction of the values are
+    """
+
+    if not values:
+        return 0
+
+    index = min(len(values) - 1, int(len(values) * fraction))
+    return values[index] / 1e6
+
+
+def run(engine: str, rooms: int, members: int, loaders: int, rate: float,
+        duration: float) -> Dict[str, float]:
+
+    server = subprocess.Popen(
+        [sys.executable, "headless_server.py", "-t", str(TCP_PORT),
+         "-u", str(UDP_PORT), "-e", engine],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(STARTUP_DELAY)
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(loaders)
+    results = context.Queue()
+    names = [f"team {index}" for index in range(rooms)]
+
+    processes = []
+    for index in range(loaders):
+        process = context.Process(
+            target=load, args=(names[index::loaders], members, duration,
+                               rate, barrier, results))
+        process.start()
+        processes.append(process)
+
+    sent = 0
+    received = 0
+    latencies = []
+    for _ in processes:
+        loader_sent, loader_received, loader_latencies = results.get()
+        sent += loader_sent
+        received += loader_received
+        latencies.extend(loader_latencies)
+
+    for process in processes:
+        process.join()
+
+    server.send_signal(signal.SIGINT)
+    server.wait()
+
+    latencies.sort()
+    return {
+        "sent": sent / duration,
+        "relayed": received / duration,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "p999": percentile(latencies, 0.999),
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engines", default="twisted,asyncio")
+    parser.add_argument("--rooms", type=int, default=32)
+    parser.add_argument("--members", type=int, default=4)
+    parser.add_argument("--loaders", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Datagrams/s per load process, 0 is flat out")
+    parser.add_argument("--duration", type=float, default=5)
+    args = parser.parse_args()
+
+    load_rate = f"{args.rate:,.0f}/s" if args.rate else "flat out"
+    print(f"{multiprocessing.cpu_count()} cores, {args.rooms} rooms of"
+          f" {args.members} clients, {args.loaders} load processes sending"
+          f" {load_rate}")
+
+    for engine in args.engines.split(","):
+
+        result = run(engine, args.rooms, args.members, args.loaders,
+                     args.rate, args.duration)
+        print(f"{engine:<8} sent {result['sent']:>9,.0f}/s, relayed"
+              f" {result['relayed']:>10,.0f} datagrams/s, latency p50"
+              f" {result['p50']:>6.2f}ms p99 {result['p99']:>7.2f}ms"
+              f" p99.9 {result['p999']:>7.2f}ms")
@@ -0,0 +1,62 @@
+"""
+Throughput of FrameDecoder on a stream cut at random places like TCP can.
+
+python -m benchmarks.framing [--frames N]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import List
+
+from benchmarks.samples import tcp_packets
+from modules.Framing import FrameDecoder, frame
+
+
+def fragment(stream: bytes, max_chunk: int) -> List[bytes]:
+
+    chunks = []
+    offset = 0
+    while offset < len(stream):
+        size = random.randint(1, max_chunk)
+        chunks.append(stream[offset:offset+size])
+        offset += size
+
+    return chunks
+
+
+def run(frame_count: int) -> None:
+
+    random.seed(4269)
+    packets = tcp_packets(frame_count)
+    stream = b"".join(frame(packet) for packet in packets)
+
+    print(f"{frame_count} frames, {len(stream) / 1e6:.2f} MB")
+
+    for max_chunk in (16, 256, 1460, 8192, 65536):
+
+        chunks = fragment(stream, max_chunk)
+        decoder = FrameDecoder()
+
+        received = 0
+        start = time.perf_counter()
+        for chunk in chunks:
+            for packet in decoder.feed(chunk):
+                received += 1
+        elapsed = time.perf_counter() - start
+
+        assert received == frame_count and decoder.pending == 0
+
+        print(f"chunks <= {max_chunk:>5} B: {len(chunks):>8} chunks,"
+              f" {frame_count / elapsed:>12,.0f} frames/s,"
+              f" {len(stream) / elapsed / 1e6:>8.1f} MB/s")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=100_000)
+    args = parser.parse_args()
+
+    run(args.frames)
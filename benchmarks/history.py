@@ -0,0 +1,101 @@
+"""
+Cost of the strategy history log of modules.History: records appended per
+second by the reactor, time of a commit (the flush to disk in the thread),
+time to read the log back when the server restarts and to compact it.
+
+The log holds --strategies pit stops in --rooms rooms and --churn users
+joining then leaving, the records compaction drops.
+
+python -m benchmarks.history [--strategies N] [--rooms N] [--churn N]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.samples import make_pit_stop
+from twisted.internet import task
+
+from modules.History import (RECORD_JOIN, RECORD_LEAVE, RECORD_STRATEGY,
+                             HistoryLog, _string)
+
+# Records appended then flushed to disk in one commit
+SYNCED_APPENDS = 200
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--strategies", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--churn", type=int, default=20000)
+    args = parser.parse_args()
+
+    # The log tells about every read and compaction
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        path = os.path.join(directory, "history.log")
+        # Commits are run by hand
+        clock = task.Clock()
+        history = HistoryLog(path, clock)
+
+        start = time.perf_counter()
+        for _ in range(SYNCED_APPENDS):
+            history.strategy("sync", 1, make_pit_stop())
+
+        elapsed = time.perf_counter() - start
+        print(f"Append: {SYNCED_APPENDS / elapsed:.0f} records/s"
+              f" ({elapsed / SYNCED_APPENDS * 1e6:.0f}µs each)")
+
+        start = time.perf_counter()
+        history.commit()
+        history.job.result()
+        elapsed = time.perf_counter() - start
+        print(f"Commit of {SYNCED_APPENDS} records:"
+              f" {elapsed * 1000:.1f}ms")
+        history.close()
+
+        # Written without the commits and compactions of HistoryLog, the
+        # log a long session without restart would leave
+        history = HistoryLog(path, clock)
+        file = history.file
+        for index in range(args.strategies):
+            room = _string(f"room {index % args.rooms}")
+            file.write(history._record(RECORD_STRATEGY,
+                                       room + make_pit_stop().to_bytes()))
+
+        for index in range(args.churn):
+            room = _string(f"room {index % args.rooms}")
+            user = _string(f"user {index}") + bytes((index % 256,))
+            file.write(history._record(RECORD_JOIN, room + user))
+            file.write(history._record(RECORD_LEAVE, room + user))
+
+        history.close()
+        size = os.path.getsize(path)
+
+        written = SYNCED_APPENDS + args.strategies + 2 * args.churn
+        start = time.perf_counter()
+        history = HistoryLog(path, clock)
+        elapsed = time.perf_counter() - start
+        print(f"Restart with {written} records ({size} bytes), compacted"
+              f" to {history.records}: {elapsed * 1000:.1f}ms")
+
+        # Compacted when read, restart from the compacted log
+        history.close()
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        history = HistoryLog(path, clock)
+        elapsed = time.perf_counter() - start
+        print(f"Restart compacted, {history.records} records ({size}"
+              f" bytes): {elapsed * 1000:.1f}ms")
+        history.close()
+
+
+if __name__ == "__main__":
+
+    main()
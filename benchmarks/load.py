@@ -0,0 +1,681 @@
+"""
+Synthetic load on a running headless server, to size it.
+
+Load processes start simulated clients in rooms of a few members. Every
+client does the real Connect over TCP and ConnectUDP, then follows the
+phases of a scenario: the drivers of each room send SmData over TCP and
+Telemetry / TelemetryRT over UDP at the rates of the phase, a random member
+of each room sends Strategy / StrategyOK / TyreSets bursts. Every packet
+ends with its send time and phase, the members receiving it back from the
+room measure the relay latency and the drops of each phase. With --pid (or
+--spawn, which starts the server) the CPU and RSS of the server and its
+workers are read from /proc (Linux). The server sends the SmData of a
+driver once per car info tick (modules.Server.CAR_INFO_INTERVAL): above
+that rate the missing ones are coalesced, not lost, and their latency
+includes the wait for the tick. Only one driver of a room streams its
+telemetry, the others stand by like the app does.
+
+A scenario is a json file (see benchmarks/scenarios) with the "rooms" and
+"members" of each room, how many times to "repeat" its "phases" and the
+phases. A phase only gives what changes from the previous one:
+
+    name            shown in the report
+    duration        seconds
+    drivers         members of each room sending SmData and telemetry
+    driver          first of them, the next ones follow
+    sm_data         SmData/s of a driver, same for telemetry, telemetry_rt
+    burst_interval  mean seconds between two bursts of a room, 0 for none
+    burst_strategies, burst_tyre_sets
+                    Strategy and TyreSets of a burst, it ends with a
+                    StrategyOK
+
+python -m benchmarks.load [scenario] [--host HOST] [--tcp-port PORT]
+                          [--udp-port PORT] [--pid PID | --spawn ENGINE|split]
+                          [--processes N] [--rooms N] [--members N]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import signal
+import struct
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from twisted.internet import reactor, task
+from twisted.internet.endpoints import TCP4ClientEndpoint, connectProtocol
+from twisted.internet.interfaces import IDelayedCall
+from twisted.internet.protocol import DatagramProtocol, Protocol
+
+from benchmarks.samples import (make_car_info, make_pit_stop, make_telemetry,
+                                make_telemetry_rt, make_tyre_sets,
+                                tyre_sets_payload)
+from modules.Client import room_bytes
+from modules.Common import PacketType
+from modules.Election import STANDBY_INTERVAL
+from modules.Framing import FrameDecoder, frame
+from modules.Heartbeat import HEARTBEAT_INTERVAL
+from modules.Sequence import StreamSender
+
+SCENARIOS = os.path.join(os.path.dirname(__file__), "scenarios")
+DEFAULT_SCENARIO = os.path.join(SCENARIOS, "race.json")
+# Send time (CLOCK_MONOTONIC ns, shared by the processes) and phase at the
+# end of every packet sent
+TRAILER = struct.Struct("!qH")
+# Seconds to connect and get the room state before the first phase
+CONNECT_DELAY = 3
+# Seconds waiting for the packets in flight after the last phase
+GRACE = 1
+STARTUP_DELAY = 2
+# Seconds between two RSS samples of the server
+USAGE_INTERVAL = 0.5
+PHASE_DEFAULTS = {
+    "name": "",
+    "duration": 10,
+    "drivers": 1,
+    "driver": 0,
+    "sm_data": 2,
+    "telemetry": 2,
+    "telemetry_rt": 10,
+    "burst_interval": 0,
+    "burst_strategies": 1,
+    "burst_tyre_sets": 1,
+}
+# Name of the relayed packets by the type they come back with
+RELAYED = {
+    PacketType.ServerData.value: "SmData",
+    PacketType.Strategy.value: "Strategy",
+    PacketType.StrategyOK.value: "StrategyOK",
+    PacketType.TyreSets.value: "TyreSets",
+    PacketType.Telemetry.value: "Telemetry",
+    PacketType.TelemetryRT.value: "TelemetryRT",
+}
+
+
+def load_scenario(path: str, rooms: Optional[int] = None,
+                  members: Optional[int] = None) -> dict:
+    """
+    Read a scenario, every phase with all its values
+    """
+
+    with open(path, encoding="utf-8") as file:
+        scenario = json.load(file)
+
+    phases = []
+    current = dict(PHASE_DEFAULTS)
+    for phase in scenario["phases"] * scenario.get("repeat", 1):
+
+        unknown = set(phase) - set(current)
+        if unknown:
+            raise ValueError(f"Unknown phase keys {sorted(unknown)}")
+
+        current = {**current, **phase}
+        phases.append(current)
+
+    scenario["phases"] = phases
+    scenario["rooms"] = rooms or scenario.get("rooms", 8)
+    scenario["members"] = members or scenario.get("members", 4)
+
+    return scenario
+
+
+def latency_bucket(latency_ns: int) -> int:
+    """
+    Latency in µs, 10µs resolution under 10ms then 1ms
+    """
+
+    latency_us = max(0, latency_ns // 1000)
+    if latency_us < 10_000:
+        return latency_us // 10 * 10
+
+    return latency_us // 1000 * 1000
+
+
+def percentile(buckets: Counter, fraction: float) -> float:
+    """
+    Latency in ms below which fraction of the packets are
+    """
+
+    total = sum(buckets.values())
+    if total == 0:
+        return 0
+
+    seen = 0
+    for latency_us in sorted(buckets):
+        seen += buckets[latency_us]
+        if seen >= total * fraction:
+            return latency_us / 1000
+
+    return max(buckets) / 1000
+
+
+def new_phase_stats() -> Dict[str, Counter]:
+
+    return {"sent": Counter(), "expected": Counter(), "received": Counter(),
+            "tcp": Counter(), "udp": Counter()}
+
+
+class LoadTCP(Protocol):
+
+    def __init__(self, client: LoadClient) -> None:
+
+        self.client = client
+        self.decoder = FrameDecoder()
+
+    def connectionMade(self) -> None:
+
+        client = self.client
+        name = client.name.encode("utf-8")
+        self.transport.write(frame(
+            PacketType.Connect.to_bytes() + bytes((len(name),)) + name +
+            bytes((client.driver_id,)) + room_bytes(client.room.name)))
+
+    def dataReceived(self, data: bytes) -> None:
+
+        for packet in self.decoder.feed(data):
+
+            if packet[0] == PacketType.ConnectionReply.value:
+                self.client.on_connection_reply(bool(packet[1]))
+
+            else:
+                self.client.load.received(packet[0], packet, "tcp")
+
+
+class LoadUDP(DatagramProtocol):
+
+    def __init__(self, client: LoadClient) -> None:
+
+        self.client = client
+        self.hello = (PacketType.ConnectUDP.to_bytes() +
+                      room_bytes(client.room.name))
+        self.hello_call = task.LoopingCall(self.say_hello)
+
+    def startProtocol(self) -> None:
+
+        load = self.client.load
+        self.transport.connect(load.host, load.udp_port)
+        # Like the app, it also keeps the server from evicting the client
+        self.hello_call.start(HEARTBEAT_INTERVAL)
+
+    def say_hello(self) -> None:
+
+        self.transport.write(self.hello)
+
+    def datagramReceived(self, datagram: bytes, addr) -> None:
+
+        if not datagram:
+            return
+
+        if datagram[0] == PacketType.TelemetrySource.value:
+            self.client.standby = datagram[1:2] == b"\x00"
+
+        elif datagram[0] == PacketType.UDP_RENEW.value:
+            self.say_hello()
+
+        else:
+            self.client.load.received(datagram[0], datagram, "udp")
+
+    def connectionRefused(self) -> None:
+
+        pass
+
+
+class LoadClient:
+    """
+    Simulated app, one member of a room
+    """
+
+    def __init__(self, load: Load, room: LoadRoom, index: int) -> None:
+
+        self.load = load
+        self.room = room
+        self.name = f"{room.name} member {index}"
+        self.driver_id = index
+        self.tcp: Optional[LoadTCP] = None
+        self.tcp_connected = False
+        self.udp = LoadUDP(self)
+        self.sender = StreamSender()
+        self.calls: List[task.LoopingCall] = []
+        # Another driver of the room is the telemetry source, like the app
+        # only claim it (see modules.Election)
+        self.standby = False
+        self.last_claim = 0.0
+
+        self.car_info = (PacketType.SmData.to_bytes() +
+                         make_car_info().to_bytes())
+        self.telemetry = make_telemetry(self.name).to_bytes()
+        self.telemetry_rt = make_telemetry_rt().to_bytes()
+
+    def connect(self) -> None:
+
+        endpoint = TCP4ClientEndpoint(reactor, self.load.host,
+                                      self.load.tcp_port, timeout=5)
+        deferred = connectProtocol(endpoint, LoadTCP(self))
+        deferred.addCallback(self._connected)
+        deferred.addErrback(lambda reason: self.on_connection_reply(False))
+        reactor.listenUDP(0, self.udp)
+
+    def _connected(self, protocol: LoadTCP) -> None:
+
+        self.tcp = protocol
+
+    def on_connection_reply(self, succes: bool) -> None:
+
+        self.tcp_connected = succes
+        if succes:
+            self.load.connected += 1
+
+        else:
+            self.load.failed += 1
+
+    def send_tcp(self, name: str, data: bytes) -> None:
+
+        if self.tcp is None or (self.standby and name == "SmData"):
+            return
+
+        self.load.sent(name, self.room.tcp_members())
+        self.tcp.transport.write(frame(data + self.load.trailer()))
+
+    def send_udp(self, packet: PacketType, payload: bytes) -> None:
+
+        if self.udp.transport is None:
+            return
+
+        if self.standby:
+            now = reactor.seconds()
+            if (packet != PacketType.Telemetry
+                    or now - self.last_claim < STANDBY_INTERVAL):
+                return
+
+            # Not relayed, not counted
+            self.last_claim = now
+
+        else:
+            self.load.sent(packet.name, len(self.room.members))
+
+        self.udp.transport.write(packet.to_bytes() + self.sender.header() +
+                                 payload + self.load.trailer())
+
+    def drive(self, phase: Optional[dict]) -> None:
+        """
+        Send the streams of a driver at the rates of phase, nothing when
+        phase is None
+        """
+
+        for call in self.calls:
+            if call.running:
+                call.stop()
+
+        self.calls = []
+        if phase is None:
+            return
+
+        streams = (
+            ("sm_data", self.send_tcp, "SmData", self.car_info),
+            ("telemetry", self.send_udp, PacketType.Telemetry,
+             self.telemetry),
+            ("telemetry_rt", self.send_udp, PacketType.TelemetryRT,
+             self.telemetry_rt),
+        )
+        for key, send, packet, payload in streams:
+
+            if phase[key] <= 0:
+                continue
+
+            call = task.LoopingCall(send, packet, payload)
+            self.calls.append(call)
+            # Spread the clients over the interval
+            interval = 1 / phase[key]
+            reactor.callLater(random.uniform(0, interval), self._start, call,
+                              interval)
+
+    def _start(self, call: task.LoopingCall, interval: float) -> None:
+
+        if call in self.calls:
+            call.start(interval)
+
+    def close(self) -> None:
+
+        self.drive(None)
+        if self.udp.hello_call.running:
+            self.udp.hello_call.stop()
+
+        if self.tcp is not None:
+            self.tcp.transport.loseConnection()
+
+        if self.udp.transport is not None:
+            self.udp.transport.stopListening()
+
+
+class LoadRoom:
+
+    def __init__(self, load: Load, name: str, members: int) -> None:
+
+        self.load = load
+        self.name = name
+        self.members = [LoadClient(load, self, index)
+                        for index in range(members)]
+        self.burst_call: Optional[IDelayedCall] = None
+
+    def tcp_members(self) -> int:
+
+        return sum(member.tcp_connected for member in self.members)
+
+    def start_phase(self, phase: Optional[dict]) -> None:
+        """
+        Follow phase, stop sending when it is None
+        """
+
+        if self.burst_call is not None and self.burst_call.active():
+            self.burst_call.cancel()
+
+        self.burst_call = None
+
+        drivers = set()
+        if phase is not None:
+            count = len(self.members)
+            drivers = {(phase["driver"] + index) % count
+                       for index in range(min(count, phase["drivers"]))}
+            self.schedule_burst(phase)
+
+        for index, member in enumerate(self.members):
+            member.drive(phase if index in drivers else None)
+
+    def schedule_burst(self, phase: dict) -> None:
+
+        if phase["burst_interval"] > 0:
+            delay = random.expovariate(1 / phase["burst_interval"])
+            self.burst_call = reactor.callLater(delay, self.burst, phase)
+
+    def burst(self, phase: dict) -> None:
+
+        member = random.choice(self.members)
+        for _ in range(phase["burst_strategies"]):
+            member.send_tcp("Strategy", PacketType.Strategy.to_bytes() +
+                            make_pit_stop().to_bytes())
+
+        for _ in range(phase["burst_tyre_sets"]):
+            member.send_tcp("TyreSets", PacketType.TyreSets.to_bytes() +
+                            tyre_sets_payload(make_tyre_sets()))
+
+        member.send_tcp("StrategyOK", PacketType.StrategyOK.to_bytes())
+        self.schedule_burst(phase)
+
+
+class Load:
+    """
+    Clients of one load process and the statistics of every phase
+    """
+
+    def __init__(self, host: str, tcp_port: int, udp_port: int,
+                 rooms: List[str], scenario: dict) -> None:
+
+        self.host = host
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.phases = scenario["phases"]
+        self.stats = [new_phase_stats() for _ in self.phases]
+        self.phase = 0
+        self.start = time.monotonic_ns()
+        self.connected = 0
+        self.failed = 0
+
+        self.rooms = [LoadRoom(self, name, scenario["members"])
+                      for name in rooms]
+
+    def trailer(self) -> bytes:
+
+        return TRAILER.pack(time.monotonic_ns(), self.phase)
+
+    def sent(self, name: str, receivers: int) -> None:
+
+        phase_stats = self.stats[self.phase]
+        phase_stats["sent"][name] += 1
+        phase_stats["expected"][name] += receivers
+
+    def received(self, packet: int, data: bytes, kind: str) -> None:
+
+        name = RELAYED.get(packet)
+        if name is None or len(data) < 1 + TRAILER.size:
+            return
+
+        sent_ns, phase = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+        # The last values of a room are sent again to joining members
+        if phase >= len(self.stats) or sent_ns < self.start:
+            return
+
+        phase_stats = self.stats[phase]
+        phase_stats["received"][name] += 1
+        phase_stats[kind][latency_bucket(time.monotonic_ns() - sent_ns)] += 1
+
+    def start_phase(self, index: Optional[int]) -> None:
+
+        phase = None
+        if index is not None:
+            self.phase = index
+            phase = self.phases[index]
+
+        for room in self.rooms:
+            room.start_phase(phase)
+
+    def run(self, barrier, results) -> None:
+        """
+        Connect, follow the phases then put the statistics in results
+        """
+
+        barrier.wait()
+        self.start = time.monotonic_ns()
+
+        for room in self.rooms:
+            for member in room.members:
+                member.connect()
+
+        offset = CONNECT_DELAY
+        for index, phase in enumerate(self.phases):
+            reactor.callLater(offset, self.start_phase, index)
+            offset += phase["duration"]
+
+        reactor.callLater(offset, self.start_phase, None)
+        reactor.callLater(offset + GRACE, self.finish, results)
+        reactor.run()
+
+    def finish(self, results) -> None:
+
+        for room in self.rooms:
+            for member in room.members:
+                member.close()
+
+        results.put((self.stats, self.connected, self.failed))
+        reactor.callLater(0.5, reactor.stop)
+
+
+def run_load(host: str, tcp_port: int, udp_port: int, rooms: List[str],
+             scenario: dict, barrier, results) -> None:
+
+    Load(host, tcp_port, udp_port, rooms, scenario).run(barrier, results)
+
+
+def server_pids(pid: int) -> List[int]:
+    """
+    pid and its children, the workers of a server
+    """
+
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as file:
+            return [pid] + [int(child) for child in file.read().split()]
+
+    except OSError:
+        return [pid]
+
+
+def server_usage(pid: int) -> Optional[Tuple[float, int]]:
+    """
+    CPU seconds and RSS bytes of a server and its workers, None without
+    /proc
+    """
+
+    cpu = 0
+    rss = 0
+    try:
+        for process in server_pids(pid):
+            with open(f"/proc/{process}/stat") as file:
+                # The command name can hold spaces, the fields are after it
+                fields = file.read().rsplit(")", 1)[1].split()
+
+            cpu += (int(fields[11]) + int(fields[12])) \
+                / os.sysconf("SC_CLK_TCK")
+            rss += int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+
+    except (OSError, IndexError, ValueError):
+        return None
+
+    return cpu, rss
+
+
+def watch_server(pid: Optional[int],
+                 phases: List[dict]) -> List[Optional[Tuple[float, float]]]:
+    """
+    CPU % and peak RSS (MB) of the server during each phase
+    """
+
+    time.sleep(CONNECT_DELAY)
+    usages = []
+    for phase in phases:
+
+        end = time.perf_counter() + phase["duration"]
+        start = server_usage(pid) if pid else None
+        if start is None:
+            time.sleep(phase["duration"])
+            usages.append(None)
+            continue
+
+        peak = start[1]
+        while time.perf_counter() < end:
+            time.sleep(min(USAGE_INTERVAL, max(0, end - time.perf_counter())))
+            usage = server_usage(pid)
+            if usage is not None:
+                peak = max(peak, usage[1])
+
+        usage = server_usage(pid) or start
+        usages.append(((usage[0] - start[0]) / phase["duration"] * 100,
+                       peak / 1e6))
+
+    return usages
+
+
+def report(scenario: dict, stats: List[Dict[str, Counter]],
+           usages: List[Optional[Tuple[float, float]]]) -> None:
+
+    for index, (phase, phase_stats, usage) in enumerate(
+            zip(scenario["phases"], stats, usages)):
+
+        duration = phase["duration"]
+        sent = sum(phase_stats["sent"].values())
+        relayed = sum(phase_stats["received"].values())
+        print(f"phase {index} {phase['name']!r}, {duration}s")
+        print(f"  relayed {relayed / duration:>10,.0f} msgs/s"
+              f" (sent {sent / duration:,.0f}/s)")
+
+        latencies = []
+        for kind in ("tcp", "udp"):
+            buckets = phase_stats[kind]
+            if buckets:
+                latencies.append(
+                    f"{kind} p50 {percentile(buckets, 0.5):.2f}ms"
+                    f" p99 {percentile(buckets, 0.99):.2f}ms"
+                    f" p99.9 {percentile(buckets, 0.999):.2f}ms")
+
+        print(f"  latency {' | '.join(latencies) or '-'}")
+
+        drops = []
+        for name, expected in sorted(phase_stats["expected"].items()):
+            lost = max(0, expected - phase_stats["received"][name])
+            drops.append(f"{name} {lost / expected * 100:.2f}%")
+
+        print(f"  drops   {', '.join(drops) or '-'}")
+
+        if usage is None:
+            print("  server  -")
+
+        else:
+            print(f"  server  CPU {usage[0]:.1f}%, RSS {usage[1]:.1f}MB")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scenario", nargs="?", default=DEFAULT_SCENARIO)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--tcp-port", type=int, default=4269)
+    parser.add_argument("--udp-port", type=int, default=4269)
+    server = parser.add_mutually_exclusive_group()
+    server.add_argument("--pid", type=int,
+                        help="Server process to report the CPU and RSS of")
+    server.add_argument("--spawn", choices=("twisted", "asyncio", "split"),
+                        help="Start a headless server with this engine,"
+                        " split is twisted with a UDP relay process")
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--rooms", type=int)
+    parser.add_argument("--members", type=int)
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario, args.rooms, args.members)
+
+    pid = args.pid
+    spawned = None
+    if args.spawn is not None:
+        engine = ["-s"] if args.spawn == "split" else ["-e", args.spawn]
+        spawned = subprocess.Popen(
+            [sys.executable, "headless_server.py", "-t", str(args.tcp_port),
+             "-u", str(args.udp_port), *engine],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        pid = spawned.pid
+        time.sleep(STARTUP_DELAY)
+
+    processes = min(args.processes, scenario["rooms"])
+    names = [f"load {index}" for index in range(scenario["rooms"])]
+    print(f"{scenario['rooms']} rooms of {scenario['members']} clients,"
+          f" {len(scenario['phases'])} phases, {processes} load processes")
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(processes + 1)
+    results = context.Queue()
+
+    workers = []
+    for index in range(processes):
+        process = context.Process(
+            target=run_load, args=(args.host, args.tcp_port, args.udp_port,
+                                   names[index::processes], scenario,
+                                   barrier, results))
+        process.start()
+        workers.append(process)
+
+    barrier.wait()
+    usages = watch_server(pid, scenario["phases"])
+
+    stats = [new_phase_stats() for _ in scenario["phases"]]
+    connected = 0
+    failed = 0
+    for _ in workers:
+        process_stats, process_connected, process_failed = results.get()
+        connected += process_connected
+        failed += process_failed
+        for total, phase_stats in zip(stats, process_stats):
+            for key, counter in phase_stats.items():
+                total[key].update(counter)
+
+    for process in workers:
+        process.join()
+
+    if spawned is not None:
+        spawned.send_signal(signal.SIGINT)
+        spawned.wait()
+
+    print(f"{connected} clients connected, {failed} failed")
+    report(scenario, stats, usages)
@@ -0,0 +1,258 @@
+"""
+Replay packet logs recorded by a headless server (--record) into a server.
+
+Every sender of the logs gets its own TCP connection or UDP socket and sends
+its packets again at their recorded time, sped up by --speed (0 replays as
+fast as possible). Logs of several workers are merged in time order.
+Starting after the beginning of a log (--start, found with its seek index)
+misses the Connect of the senders, one is made up from their room.
+
+python -m benchmarks.replay LOG [LOG ...] [--host HOST] [--tcp-port PORT]
+                            [--udp-port PORT] [--speed N] [--start S]
+                            [--end S] [--info]
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from twisted.internet import reactor
+from twisted.internet.endpoints import TCP4ClientEndpoint, connectProtocol
+from twisted.internet.protocol import DatagramProtocol, Protocol
+
+from modules.Client import room_bytes
+from modules.Common import PacketType
+from modules.Framing import frame
+from modules.Recorder import RECORD_TCP, PacketLog, Record
+
+# Records sent in a row at max speed before letting the reactor write them
+MAX_SPEED_BATCH = 256
+# Seconds given to the last packets to leave before disconnecting
+FLUSH_DELAY = 1
+
+
+class ReplayTCP(Protocol):
+    """
+    Connection of a TCP sender, what is received is thrown away
+    """
+
+    def __init__(self) -> None:
+
+        self.pending: Deque[bytes] = deque()
+
+    def connectionMade(self) -> None:
+
+        while self.pending:
+            self.transport.write(self.pending.popleft())
+
+    def send(self, data: bytes) -> None:
+
+        if self.transport is None:
+            self.pending.append(data)
+
+        else:
+            self.transport.write(data)
+
+    def close(self) -> None:
+
+        if self.transport is not None:
+            self.transport.loseConnection()
+
+
+class ReplayUDP(DatagramProtocol):
+
+    def __init__(self, host: str, port: int) -> None:
+
+        self.host = host
+        self.port = port
+
+    def startProtocol(self) -> None:
+
+        self.transport.connect(self.host, self.port)
+
+    def send(self, data: bytes) -> None:
+
+        self.transport.write(data)
+
+    def connectionRefused(self) -> None:
+
+        pass
+
+    def close(self) -> None:
+
+        self.transport.stopListening()
+
+
+def merged(logs: List[PacketLog], start: float,
+           end: Optional[float]) -> Iterator[Record]:
+    """
+    Records of every log in time order, start and end are from the start
+    of the first log
+    """
+
+    origin = min(packet_log.start for packet_log in logs)
+    streams = []
+    for packet_log in logs:
+        shift = packet_log.start - origin
+        streams.append(packet_log.records(
+            max(0, start - shift), None if end is None else end - shift))
+
+    return heapq.merge(*streams, key=lambda record: record.time)
+
+
+class Replayer:
+
+    def __init__(self, records: Iterator[Record], host: str, tcp_port: int,
+                 udp_port: int, speed: float) -> None:
+
+        self.records = records
+        self.host = host
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.speed = speed
+
+        self.senders: Dict[Tuple[int, str], object] = {}
+        # Driver ids given to the made up Connect of each room
+        self.driver_ids: Counter = Counter()
+        self.next: Optional[Record] = next(self.records, None)
+        self.first = self.next.time if self.next is not None else 0
+        self.started = 0
+        self.sent: Counter = Counter()
+        self.late = 0
+
+    def sender(self, record: Record):
+
+        key = (record.kind, record.sender)
+        sender = self.senders.get(key)
+        if sender is not None:
+            return sender
+
+        if record.kind == RECORD_TCP:
+            sender = ReplayTCP()
+            endpoint = TCP4ClientEndpoint(reactor, self.host, self.tcp_port)
+            connectProtocol(endpoint, sender)
+
+            if record.data[0] != PacketType.Connect.value:
+                self.driver_ids[record.room] += 1
+                name = f"replay {record.sender}".encode("utf-8")[:255]
+                sender.send(frame(
+                    PacketType.Connect.to_bytes() + bytes((len(name),)) +
+                    name + bytes((self.driver_ids[record.room] % 256,)) +
+                    room_bytes(record.room or "")))
+
+        else:
+            sender = ReplayUDP(self.host, self.udp_port)
+            reactor.listenUDP(0, sender)
+
+            if record.data[0] != PacketType.ConnectUDP.value:
+                sender.send(PacketType.ConnectUDP.to_bytes() +
+                            room_bytes(record.room or ""))
+
+        self.senders[key] = sender
+        return sender
+
+    def start(self) -> None:
+
+        self.started = time.perf_counter()
+        self.step()
+
+    def step(self) -> None:
+
+        batch = 0
+        while self.next is not None:
+
+            record = self.next
+            if self.speed > 0:
+                due = self.started + (record.time - self.first) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    reactor.callLater(delay, self.step)
+                    return
+
+                self.late = max(self.late, -delay)
+
+            elif batch == MAX_SPEED_BATCH:
+                reactor.callLater(0, self.step)
+                return
+
+            data = record.data
+            if record.kind == RECORD_TCP:
+                data = frame(data)
+
+            self.sender(record).send(data)
+            self.sent[record.kind] += 1
+            self.next = next(self.records, None)
+            batch += 1
+
+        self.report()
+        reactor.callLater(FLUSH_DELAY, self.stop)
+
+    def report(self) -> None:
+
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.sent.values())
+        print(f"Replayed {self.sent[RECORD_TCP]} TCP and"
+              f" {total - self.sent[RECORD_TCP]} UDP packets from"
+              f" {len(self.senders)} senders in {elapsed:.1f}s"
+              f" ({total / max(elapsed, 1e-9):,.0f} packets/s),"
+              f" at most {self.late * 1000:.1f}ms late")
+
+    def stop(self) -> None:
+
+        for sender in self.senders.values():
+            sender.close()
+
+        reactor.callLater(0.1, reactor.stop)
+
+
+def info(packet_log: PacketLog) -> None:
+
+    kinds: Counter = Counter()
+    rooms = set()
+    senders = set()
+    for record in packet_log.records():
+        kinds[record.kind] += 1
+        rooms.add(record.room)
+        senders.add(record.sender)
+
+    started = time.strftime("%Y-%m-%d %H:%M:%S",
+                            time.localtime(packet_log.wall_start))
+    print(f"{packet_log.path}: started {started}, lasts"
+          f" {packet_log.duration:.1f}s, {kinds[RECORD_TCP]} TCP and"
+          f" {sum(kinds.values()) - kinds[RECORD_TCP]} UDP packets,"
+          f" {len(rooms)} rooms, {len(senders)} senders,"
+          f" {len(packet_log.index)} index entries")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("logs", nargs="+")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--tcp-port", type=int, default=4269)
+    parser.add_argument("--udp-port", type=int, default=4269)
+    parser.add_argument("--speed", type=float, default=1,
+                        help="1 is real time, 0 as fast as possible")
+    parser.add_argument("--start", type=float, default=0,
+                        help="Seconds from the start of the logs")
+    parser.add_argument("--end", type=float)
+    parser.add_argument("--info", action="store_true",
+                        help="Describe the logs and exit")
+    args = parser.parse_args()
+
+    logs = [PacketLog(path) for path in args.logs]
+    if args.info:
+        for packet_log in logs:
+            info(packet_log)
+
+    else:
+        replayer = Replayer(merged(logs, args.start, args.end), args.host,
+                            args.tcp_port, args.udp_port, args.speed)
+        reactor.callWhenRunning(replayer.start)
+        reactor.run()
+
+    for packet_log in logs:
+        packet_log.close()
@@ -0,0 +1,127 @@
+"""
+Realistic packets for the benchmarks, built from the same classes the app
+send on the wire.
+"""
+from __future__ import annotations
+
+import random
+import zlib
+from typing import List
+
+from pyaccsharedmemory import (ACC_RAIN_INTENSITY, ACC_SESSION_TYPE,
+                               ACC_TRACK_GRIP_STATUS, CarDamage, Wheels)
+
+from modules.Common import CarInfo, PacketType, PitStop
+from modules.Telemetry import Telemetry, TelemetryRT
+from modules.TyreSets import TyreSetData, TyresSetData
+
+
+def _wheels(low: float, high: float) -> Wheels:
+
+    return Wheels(*(random.uniform(low, high) for _ in range(4)))
+
+
+def make_telemetry(driver: str = "Max Verstappen") -> Telemetry:
+
+    return Telemetry(
+        driver,
+        random.randint(0, 200),
+        random.uniform(0, 120),
+        random.uniform(2, 4),
+        random.uniform(0, 40),
+        _wheels(20, 29),
+        _wheels(30, 32),
+        random.randint(0, 120_000),
+        random.randint(90_000, 120_000),
+        random.randint(90_000, 120_000),
+        False,
+        False,
+        ACC_SESSION_TYPE.ACC_RACE,
+        random.randint(0, 3_600_000),
+        _wheels(26, 29),
+        _wheels(60, 100),
+        _wheels(200, 700),
+        False,
+        random.uniform(0, 86_400_000),
+        ACC_TRACK_GRIP_STATUS.ACC_OPTIMUM,
+        1,
+        1,
+        CarDamage(0, 0, 0, 0, 0),
+        ACC_RAIN_INTENSITY.ACC_NO_RAIN,
+        Wheels(0, 0, 0, 0),
+        random.randint(0, 2),
+        random.randint(20_000, 40_000),
+        True,
+        random.uniform(15, 30),
+        random.uniform(20, 45),
+        random.uniform(0, 10),
+        random.randint(0, 3_600_000),
+        random.randint(1, 50),
+    )
+
+
+def make_telemetry_rt() -> TelemetryRT:
+
+    return TelemetryRT(random.random(), random.random(),
+                       random.uniform(-1, 1), random.randint(0, 7),
+                       random.uniform(0, 280))
+
+
+def make_car_info() -> CarInfo:
+
+    return CarInfo(27.5, 27.4, 27.1, 27.2, random.uniform(0, 120), 120,
+                   random.randint(1, 50))
+
+
+def make_pit_stop() -> PitStop:
+
+    return PitStop("12:34:56", random.uniform(0, 120), random.randint(1, 50),
+                   "Dry", (27.5, 27.4, 27.1, 27.2))
+
+
+def make_tyre_sets(count: int = 50) -> List[TyresSetData]:
+
+    def tyre() -> TyreSetData:
+        return TyreSetData([random.uniform(2, 3) for _ in range(3)],
+                           random.random(), random.random(),
+                           random.random(), random.random())
+
+    return [TyresSetData(tyre(), tyre(), tyre(), tyre())
+            for _ in range(count)]
+
+
+def tyre_sets_payload(tyre_sets: List[TyresSetData]) -> bytes:
+    """
+    Compressed tyre sets payload as built by App.client_loop
+    """
+
+    return zlib.compress(TyresSetData.list_to_bytes(tyre_sets))
+
+
+def tcp_packets(count: int) -> List[bytes]:
+    """
+    Mix of packets (type byte included) as they go through TCP_Server
+    """
+
+    tyre_sets = (PacketType.TyreSets.to_bytes()
+                 + tyre_sets_payload(make_tyre_sets()))
+
+    packets = []
+    for index in range(count):
+
+        if index % 50 == 49:
+            packets.append(tyre_sets)
+
+        elif index % 10 == 9:
+            packets.append(PacketType.Strategy.to_bytes()
+                           + make_pit_stop().to_bytes())
+
+        elif index % 2:
+            packets.append(PacketType.Telemetry.to_bytes()
+                           + make_telemetry().to_bytes())
+
+        else:
+            packets.append(PacketType.SmData.to_bytes()
+                           + make_car_info().to_bytes())
+
+    return packets
@@ -0,0 +1,125 @@
+"""
+Scheduling cost of TCP_Server connections on a simulated clock, one
+LoopingCall per connection (previous server_loop at 10Hz) against the
+ConnectionScheduler of the factory.
+
+Each simulated second some connections log in, which queue a user list
+broadcast and a delayed strategy history send. Only the scheduling is
+measured, the work itself is a no-op in both cases. task.Clock keeps its
+calls in a sorted list, so the per connection timers grow a bit faster than
+on the real reactor heap.
+
+python -m benchmarks.scheduler [--seconds S]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import List
+
+from twisted.internet import task
+
+from modules.Server import USER_UPDATE, ConnectionScheduler
+
+STEP = 0.01
+LOGINS_PER_SECOND = 10
+
+
+class LegacyConnection:
+    """
+    Scheduling part of the previous TCP_Server.server_loop
+    """
+
+    def __init__(self, clock: task.Clock, q_in: List) -> None:
+
+        self.clock = clock
+        self.q_in = q_in
+        self.user_change = False
+        self.valid_user = False
+        self.sent_strat_history = False
+        self.timer = clock.seconds()
+
+        self.loop_call = task.LoopingCall(self.server_loop)
+        self.loop_call.clock = clock
+        self.loop_call.start(0.1)
+
+    def login(self) -> None:
+
+        self.valid_user = True
+        self.user_change = True
+        self.timer = self.clock.seconds()
+
+    def server_loop(self) -> None:
+
+        if self.user_change:
+            self.user_change = False
+
+        if (self.valid_user and not self.sent_strat_history
+                and self.clock.seconds() > self.timer + 0.5):
+            self.sent_strat_history = True
+
+        for element in self.q_in:
+            pass
+
+
+def noop() -> None:
+    pass
+
+
+def simulate(clock: task.Clock, seconds: int, login) -> float:
+
+    start = time.perf_counter()
+    steps_per_second = round(1 / STEP)
+    for second in range(seconds):
+        for step in range(steps_per_second):
+            if step < LOGINS_PER_SECOND:
+                login(second * LOGINS_PER_SECOND + step)
+            clock.advance(STEP)
+
+    return time.perf_counter() - start
+
+
+def legacy(connections: int, seconds: int) -> float:
+
+    clock = task.Clock()
+    users = [LegacyConnection(clock, []) for _ in range(connections)]
+
+    def login(index: int) -> None:
+        users[index % connections].login()
+
+    return simulate(clock, seconds, login)
+
+
+def scheduler(connections: int, seconds: int) -> float:
+
+    clock = task.Clock()
+    connection_scheduler = ConnectionScheduler(clock)
+
+    def login(index: int) -> None:
+        connection_scheduler.call_soon(USER_UPDATE, noop)
+        connection_scheduler.call_later(0.5, noop)
+
+    return simulate(clock, seconds, login)
+
+
+def run(seconds: int) -> None:
+
+    print(f"{LOGINS_PER_SECOND} logins/s, CPU time per simulated second")
+    for connections in (10, 100, 1000):
+
+        legacy_time = legacy(connections, seconds) / seconds
+        scheduler_time = scheduler(connections, seconds) / seconds
+
+        print(f"{connections:>5} connections: LoopingCall per connection"
+              f" {legacy_time * 1e3:>8.2f} ms,"
+              f" factory scheduler {scheduler_time * 1e3:>6.2f} ms")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=10,
+                        help="Simulated seconds")
+    args = parser.parse_args()
+
+    run(args.seconds)
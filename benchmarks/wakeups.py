@@ -0,0 +1,91 @@
+"""
+Idle cost of the networking: reactor wakeups per second and CPU usage of a
+server with connected but idle clients.
+
+--legacy adds the polling LoopingCalls the app used to run (10ms for the
+app, each client instance and UDP endpoint, 100ms for each TCP endpoint)
+to compare with the event driven version.
+
+python -m benchmarks.wakeups [--legacy] [--clients N] [--duration S]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from twisted.internet import reactor, task
+
+from modules.Client import ClientInstance
+from modules.Common import Channel, Credidentials
+from modules.Server import ServerInstance
+
+TCP_PORT = 14269
+UDP_PORT = 14270
+
+
+def legacy_polling(clients: int) -> None:
+
+    def poll() -> None:
+        pass
+
+    # App.client_loop, UDP_Server, then per client ClientInstance and UDPClient
+    for _ in range(2 + clients * 2):
+        task.LoopingCall(poll).start(0.01)
+
+    # TCP_Client and TCP_Server of each client
+    for _ in range(clients * 2):
+        task.LoopingCall(poll).start(0.1)
+
+
+def run(legacy: bool, clients: int, duration: float) -> None:
+
+    wakeups = 0
+    run_until_current = reactor.runUntilCurrent
+
+    def counting_run_until_current() -> None:
+        nonlocal wakeups
+        wakeups += 1
+        run_until_current()
+
+    reactor.runUntilCurrent = counting_run_until_current
+
+    ServerInstance(TCP_PORT, UDP_PORT)
+    for index in range(clients):
+        ClientInstance(Credidentials("127.0.0.1", TCP_PORT, UDP_PORT,
+                                     f"user {index}", index + 1),
+                       Channel(1024))
+
+    if legacy:
+        legacy_polling(clients)
+
+    start = {}
+
+    def begin() -> None:
+        nonlocal wakeups
+        wakeups = 0
+        start["cpu"] = time.process_time()
+        start["wall"] = time.perf_counter()
+
+    def end() -> None:
+        wall = time.perf_counter() - start["wall"]
+        cpu = time.process_time() - start["cpu"]
+        mode = "legacy polling" if legacy else "event driven"
+        print(f"{mode}, {clients} idle clients: {wakeups / wall:.1f}"
+              f" wakeups/s, CPU {cpu / wall * 100:.2f}%")
+        reactor.stop()
+
+    # Let the clients connect before measuring
+    reactor.callLater(1, begin)
+    reactor.callLater(1 + duration, end)
+    reactor.run()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--legacy", action="store_true")
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    run(args.legacy, args.clients, args.duration)
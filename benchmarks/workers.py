@@ -0,0 +1,151 @@
+"""
+UDP relay throughput of the headless server against its number of workers.
+
+For each worker count a headless_server.py is started with --workers, load
+processes then join rooms with a few UDP clients each and send TelemetryRT
+as fast as they can. The relayed datagrams/s is what the clients receive
+back, the fan-out of their room. Scaling needs as many free cores as the
+workers plus the load processes.
+
+python -m benchmarks.workers [--workers 1,2,4] [--rooms N] [--members N]
+                             [--loaders N] [--duration S]
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+from benchmarks.samples import make_telemetry_rt
+from modules.Common import PacketType
+
+TCP_PORT = 14269
+UDP_PORT = 14270
+STARTUP_DELAY = 2
+
+
+def load(rooms: List[str], members: int, duration: float,
+         barrier, results) -> None:
+    """
+    Send TelemetryRT from every member of rooms and count the relayed ones
+    """
+
+    datagram = PacketType.TelemetryRT.to_bytes() + \
+        make_telemetry_rt().to_bytes()
+
+    sockets = []
+    for room in rooms:
+
+        token = room.encode("utf-8")
+        hello = PacketType.ConnectUDP.to_bytes() + bytes((len(token),)) \
+            + token
+
+        for _ in range(members):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect(("127.0.0.1", UDP_PORT))
+            sock.send(hello)
+            sock.setblocking(False)
+            sockets.append(sock)
+
+    def drain() -> int:
+
+        received = 0
+        for sock in sockets:
+
+            while True:
+                try:
+                    sock.recv(2048)
+
+                except (BlockingIOError, ConnectionRefusedError):
+                    break
+
+                received += 1
+
+        return received
+
+    barrier.wait()
+    time.sleep(0.5)
+    drain()
+
+    sent = 0
+    received = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+
+        for sock in sockets:
+            try:
+                sock.send(datagram)
+                sent += 1
+
+            except (BlockingIOError, ConnectionRefusedError):
+                pass
+
+        received += drain()
+
+    results.put((sent, received))
+
+
+def run(workers: int, rooms: int, members: int, loaders: int,
+        duration: float) -> Tuple[float, float]:
+
+    server = subprocess.Popen(
+        [sys.executable, "headless_server.py", "-t", str(TCP_PORT),
+         "-u", str(UDP_PORT), "-w", str(workers)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(STARTUP_DELAY)
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(loaders)
+    results = context.Queue()
+    names = [f"team {index}" for index in range(rooms)]
+
+    processes = []
+    for index in range(loaders):
+        process = context.Process(
+            target=load, args=(names[index::loaders], members, duration,
+                               barrier, results))
+        process.start()
+        processes.append(process)
+
+    sent = 0
+    received = 0
+    for _ in processes:
+        loader_sent, loader_received = results.get()
+        sent += loader_sent
+        received += loader_received
+
+    for process in processes:
+        process.join()
+
+    server.send_signal(signal.SIGINT)
+    server.wait()
+
+    return sent / duration, received / duration
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--rooms", type=int, default=32)
+    parser.add_argument("--members", type=int, default=4)
+    parser.add_argument("--loaders", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{multiprocessing.cpu_count()} cores, {args.rooms} rooms of"
+          f" {args.members} clients, {args.loaders} load processes")
+
+    baseline = None
+    for workers in [int(value) for value in args.workers.split(",")]:
+
+        sent, relayed = run(workers, args.rooms, args.members, args.loaders,
+                            args.duration)
+        baseline = baseline or relayed
+        print(f"{workers:>2} workers: sent {sent:>10,.0f}/s, relayed"
+              f" {relayed:>10,.0f} datagrams/s ({relayed / baseline:.2f}x)")
@@ -5,7 +5,11 @@ from typing import List
 
 from twisted.internet import reactor
 
+from modules.AsyncServer import run_asyncio_server
+from modules.Metrics import serve_metrics
+from modules.Relay import SplitServer, relay_supported
 from modules.Server import ServerInstance
+from modules.Workers import WorkerPool, workers_supported
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO,
                     format="%(asctime)s.%(msecs)03d | %(name)s | %(message)s",
@@ -18,8 +22,10 @@ def headless(argv: List[str]) -> None:
     """
 
     try:
-        opts, args = getopt.getopt(argv[1:], "hu:t:p:",
-                                   ["help", "udp_port=", "tcp_port=", "port="])
+        opts, args = getopt.getopt(argv[1:], "hu:t:p:w:m:e:r:sd:",
+                                   ["help", "udp_port=", "tcp_port=", "port=",
+                                    "workers=", "metrics=", "engine=",
+                                    "record=", "split", "data="])
 
     except getopt.GetoptError as err:
 
@@ -28,10 +34,20 @@ def headless(argv: List[str]) -> None:
 
     tcp_port = 4269
     udp_port = 4269
+    workers = 1
+    metrics_port = None
+    engine = "twisted"
+    record = None
+    split = False
+    history = None
     for opt, arg in opts:
 
         if opt in ("-h", "--help"):
-            print(f"python {__file__} [-p <port> (default 4269)]")
+            print(f"python {__file__} [-p <port> (default 4269)]"
+                  " [-w <workers> (default 1)] [-m <metrics port>]"
+                  " [-e twisted|asyncio (default twisted)]"
+                  " [-r <packet log file>] [-s (UDP relay process)]"
+                  " [-d <strategy history file>]")
             sys.exit()
 
         elif opt in ("-p", "--port"):
@@ -62,9 +78,95 @@ def headless(argv: List[str]) -> None:
                 logging.warning(f"Invalid TCP port arg: {arg}")
                 sys.exit(1)
 
-    ServerInstance(tcp_port, udp_port)
-    logging.info("Running as headless server"
-                 f" with port TCP:{tcp_port} UDP:{udp_port}")
+        elif opt in ("-w", "--workers"):
+
+            if arg.isnumeric() and int(arg) > 0:
+                workers = int(arg)
+
+            else:
+                logging.warning(f"Invalid workers arg: {arg}")
+                sys.exit(1)
+
+        elif opt in ("-e", "--engine"):
+
+            if arg in ("twisted", "asyncio"):
+                engine = arg
+
+            else:
+                logging.warning(f"Invalid engine arg: {arg}")
+                sys.exit(1)
+
+        elif opt in ("-m", "--metrics"):
+
+            if arg.isnumeric():
+                metrics_port = int(arg)
+
+            else:
+                logging.warning(f"Invalid metrics port arg: {arg}")
+                sys.exit(1)
+
+        elif opt in ("-r", "--record"):
+            record = arg
+
+        elif opt in ("-s", "--split"):
+            split = True
+
+        elif opt in ("-d", "--data"):
+            history = arg
+
+    if workers > 1 and engine == "asyncio":
+        logging.warning("Workers run the twisted engine, running a single"
+                        " asyncio process")
+        workers = 1
+
+    if workers > 1 and not workers_supported():
+        logging.warning("Workers need SO_REUSEPORT, descriptor passing and"
+                        " a known twisted version, running a single"
+                        " process")
+        workers = 1
+
+    if split and (workers > 1 or engine == "asyncio"):
+        logging.warning("The UDP relay process only runs with a single"
+                        " twisted process, not splitting")
+        split = False
+
+    if split and not relay_supported():
+        logging.warning("The UDP relay process needs unix sockets, not"
+                        " splitting")
+        split = False
+
+    if workers > 1:
+
+        pool = WorkerPool(workers, tcp_port, udp_port, metrics_port, record,
+                          history)
+        pool.start()
+        logging.info(f"Running as headless server with {workers} workers"
+                     f" with port TCP:{tcp_port} UDP:{udp_port}")
+
+        pool.join()
+        logging.info("Exiting")
+        return
+
+    if engine == "asyncio":
+        logging.info("Running as headless server on asyncio"
+                     f" with port TCP:{tcp_port} UDP:{udp_port}")
+        run_asyncio_server(tcp_port, udp_port, metrics_port, record,
+                           history)
+        logging.info("Exiting")
+        return
+
+    if split:
+        SplitServer(tcp_port, udp_port, metrics_port, record, history)
+        logging.info("Running as headless server with a UDP relay process"
+                     f" with port TCP:{tcp_port} UDP:{udp_port}")
+
+    else:
+        ServerInstance(tcp_port, udp_port, record, history)
+        logging.info("Running as headless server"
+                     f" with port TCP:{tcp_port} UDP:{udp_port}")
+
+    if metrics_port is not None:
+        serve_metrics(metrics_port)
 
     reactor.run()
 
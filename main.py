@@ -3,7 +3,6 @@ from __future__ import annotations
 import ipaddress
 import json
 import logging
-import struct
 import sys
 import time
 import tkinter
@@ -19,12 +18,17 @@ from idlelib.tooltip import Hovertip
 from twisted.internet import reactor, task, tksupport
 
 from modules.Client import ClientInstance
-from modules.Common import (CarInfo, Credidentials, DataQueue, NetData,
+from modules.Common import (CarInfo, Channel, Credidentials, NetData,
                             NetworkQueue, PitStop)
+from modules.Dispatch import PacketDispatcher
 from modules.DriverInputs import DriverInputs
+from modules.History import HISTORY_UPDATE, STRATEGY_ID, HistoryCursor
+from modules.RateControl import RateController, SendRate
+from modules.Sequence import timestamp_ms
 from modules.Server import ServerInstance
 from modules.Strategy import StrategyUI
-from modules.Telemetry import Telemetry, TelemetryRT, TelemetryUI
+from modules.Telemetry import (Telemetry, TelemetryRT, TelemetryRTBatch,
+                               TelemetryUI)
 from modules.TyreGraph import PrevLapsGraph, TyreGraph
 from modules.TyreSets import TyreSets, TyresSetData
 from modules.Users import UserUI
@@ -48,7 +52,6 @@ class ConnectionPage(ttk.Frame):
         self.is_connected = None
         self.connection_msg = ""
         self.credis = None
-        self.is_connected_loop = task.LoopingCall(self.check_connection)
 
         self.credidentials = None
         key_check = ("saved_ip", "tcp_port", "udp_port", "username",
@@ -61,8 +64,9 @@ class ConnectionPage(ttk.Frame):
             try:
                 self.credidentials = json.load(fp)
 
+                # "room" is optional, older files don't have it
                 if (type(self.credidentials) is not dict or
-                        tuple(self.credidentials.keys()) != key_check):
+                        not set(key_check).issubset(self.credidentials)):
 
                     logging.info(f"Invalid connection.json file")
                     self.credidentials = None
@@ -115,6 +119,12 @@ class ConnectionPage(ttk.Frame):
         Hovertip(self.l_driverID, "Driver ID for driver swap "
                  "(Driver 1, 2, 3, 4, etc), not your SteamID", 10)
 
+        self.l_room = tkinter.Label(self.f_connection_info, text="Team",
+                                    anchor=tkinter.E, width=10)
+        self.l_room.grid(row=5, column=0, padx=5, pady=2)
+        Hovertip(self.l_room, "Team token, the whole team must use the "
+                 "same one (can be empty)", 10)
+
         if self.credidentials is None:
             self.cb_ip = ttk.Combobox(self.f_connection_info, width=30,
                                       values=[])
@@ -139,6 +149,11 @@ class ConnectionPage(ttk.Frame):
         Hovertip(self.e_driverID, "Driver ID for driver swap "
                  "(Driver 1, 2, 3, 4, etc), not your SteamID", 10)
 
+        self.e_room = tkinter.Entry(self.f_connection_info, width=30)
+        self.e_room.grid(row=5, column=1, padx=5, pady=2)
+        Hovertip(self.e_room, "Team token, the whole team must use the "
+                 "same one (can be empty)", 10)
+
         self.b_connect = tkinter.Button(self, text="Connect",
                                         command=self.connect)
         self.b_connect.grid(row=1, padx=10, pady=5)
@@ -149,6 +164,8 @@ class ConnectionPage(ttk.Frame):
             self.e_udp_port.insert(tkinter.END, self.credidentials["udp_port"])
             self.e_username.insert(tkinter.END, self.credidentials["username"])
             self.e_driverID.insert(tkinter.END, self.credidentials["driverID"])
+            self.e_room.insert(tkinter.END,
+                               self.credidentials.get("room", ""))
 
         else:
             self.e_tcp_port.insert(tkinter.END, "4269")
@@ -248,7 +265,8 @@ class ConnectionPage(ttk.Frame):
                 tcp_port=int(self.e_tcp_port.get()),
                 udp_port=int(self.e_udp_port.get()),
                 username=self.e_username.get(),
-                driverID=int(self.e_driverID.get())
+                driverID=int(self.e_driverID.get()),
+                room=self.e_room.get()
             )
 
             if self.as_server:
@@ -257,7 +275,6 @@ class ConnectionPage(ttk.Frame):
             else:
                 self.main_app.connect_to_server(self.credits)
 
-            self.is_connected_loop.start(0.1)
             logging.info("Waiting for connection confirmation")
 
         else:
@@ -280,12 +297,12 @@ class ConnectionPage(ttk.Frame):
 
         self.b_connect.config(state="normal")
         self.is_connected = None
-        self.is_connected_loop.stop()
 
     def connected(self, succes: bool, error: str) -> None:
 
         self.is_connected = succes
         self.connection_msg = error
+        reactor.callLater(0, self.check_connection)
 
     def save_credidentials(self, credits: Credidentials) -> None:
 
@@ -312,6 +329,7 @@ class ConnectionPage(ttk.Frame):
                 "udp_port": credits.udp_port,
                 "username": credits.username,
                 "driverID": credits.driverID,
+                "room": credits.room,
             }
             json.dump(connection, fp, indent=4)
 
@@ -364,7 +382,28 @@ class App(tkinter.Tk):
         self.is_connected = False
         self.client: Optional[ClientInstance] = None
         self.server: Optional[ServerInstance] = None
-        self.net_queue = DataQueue([], [])
+        # Strategy history in strategy_ui, a reconnection only gets the
+        # newer strategies
+        self.history_cursor = HistoryCursor()
+        # Messages received by the client transports
+        self.net_queue = Channel(1024)
+        self.net_queue.waker = self._wake_network
+        self.closed = False
+
+        self.dispatcher = PacketDispatcher("App", self._on_unknown)
+        for data_type, handler in (
+                (NetworkQueue.ConnectionReply, self._on_connection_reply),
+                (NetworkQueue.ServerData, self._on_server_data),
+                (NetworkQueue.Strategy, self._on_strategy),
+                (NetworkQueue.StategyHistory, self._on_strategy_history),
+                (NetworkQueue.StrategyDone, self._on_strategy_done),
+                (NetworkQueue.Telemetry, self._on_telemetry),
+                (NetworkQueue.TelemetryRT, self._on_telemetry_rt),
+                (NetworkQueue.TelemetryRTBatch, self._on_telemetry_rt_batch),
+                (NetworkQueue.UpdateUsers, self._on_update_users),
+                (NetworkQueue.TyreSets, self._on_tyre_sets)):
+
+            self.dispatcher.register(data_type, handler)
 
         self.menu_bar = tkinter.Menu(self)
         self.menu_bar.add_command(label="Connect",
@@ -409,6 +448,12 @@ class App(tkinter.Tk):
         self.user_ui = UserUI(self.main_frame)
         self.user_ui.grid(row=1, column=0)
 
+        # Telemetry send rates and link quality while connected
+        self.link_status = tkinter.StringVar()
+        self.l_link = ttk.Label(self.main_frame,
+                                textvariable=self.link_status)
+        self.l_link.grid(row=2, column=0, pady=3)
+
         self.tab_control = ttk.Notebook(self.main_frame)
         self.tab_control.grid(row=0, column=0, pady=3)
 
@@ -452,9 +497,9 @@ class App(tkinter.Tk):
         self.tab_control.add(self.tyre_sets, text="Tyre Sets")
 
         self.tab_control.hide(0)
+        self.tab_control.bind("<<NotebookTabChanged>>", self._tab_changed)
 
         self.last_time = time.time()
-        self.rt_last_time = time.time()
         self.rt_min_delta = self.gui_config["driver_input_speed"]
         self.min_delta = 0.5
         self.last_telemetry = time.time()
@@ -462,8 +507,15 @@ class App(tkinter.Tk):
 
         logging.info("Main UI created.")
 
+        # Sample ACC shared memory while connected, every rt_min_delta
         self.client_loopCall = task.LoopingCall(self.client_loop)
-        self.client_loopCall.start(0.01)
+
+        # Driver inputs sampled at sample_rate Hz, sent in batches by
+        # client_loop (0 sends one TelemetryRT per loop instead)
+        self.rt_sample_rate = self.gui_config.get(
+            "driver_input_sample_rate", 0)
+        self.rt_samples = []
+        self.rt_sampler = task.LoopingCall(self.sample_driver_inputs)
 
         self.eval('tk::PlaceWindow . center')
         self.updateScrollRegion()
@@ -473,7 +525,7 @@ class App(tkinter.Tk):
         self.main_canvas.update_idletasks()
         self.main_canvas.config(scrollregion=self.main_frame.bbox())
 
-    def client_loop(self) -> None:
+    def _tab_changed(self, event) -> None:
 
         selected_tab_name = self.tab_control.tab(self.tab_control.select(),
                                                  "text")
@@ -493,129 +545,54 @@ class App(tkinter.Tk):
             if self.tyre_graph.is_animating:
                 self.tyre_graph.stop_animation()
 
-        for element in self.net_queue.q_out:
-
-            if element.data_type == NetworkQueue.ConnectionReply:
-
-                logging.info("Received Connection reply for server")
-
-                succes = bool(element.data[0])
-                msg_lenght = element.data[1]
-                msg = element.data[2:2 + msg_lenght]
-
-                self.connection_page.connected(succes, msg)
-                self.mb_connected(succes)
-                self.is_connected = succes
-                if not succes:
-                    self.client.close()
-
-            elif element.data_type == NetworkQueue.ServerData:
-
-                server_data = CarInfo.from_bytes(element.data)
-                is_first_update = self.strategy_ui.server_data is None
-                self.strategy_ui.server_data = server_data
-
-                if is_first_update:
-                    self.strategy_ui.update_values()
-
-            elif element.data_type == NetworkQueue.Strategy:
-
-                logging.info("Received: Strategy")
-
-                self.strategy_ui.b_set_strat.config(state="disabled")
-                asm_data = self.strategy_ui.asm.read_shared_memory()
-                pit_stop = PitStop.from_bytes(element.data)
-                self.strategy_ui.save_strategy(pit_stop)
-
-                if asm_data is not None:
-                    self.strategy_ui.apply_strategy(pit_stop)
-
-            elif element.data_type == NetworkQueue.StategyHistory:
-
-                self.strategy_ui.clear_strategy_history()
-
-                strategy_count = element.data[0]
-                byte_index = 1
-                for _ in range(strategy_count):
-
-                    strat = PitStop.from_bytes(element.data[byte_index:])
-                    self.strategy_ui.save_strategy(strat)
-                    byte_index += PitStop.byte_size
-
-            elif element.data_type == NetworkQueue.StrategyDone:
-
-                logging.info("Received: Strategy Done")
-
-                self.strategy_ui.b_set_strat.config(state="normal")
-                self.strategy_ui.update_values()
-
-            elif element.data_type == NetworkQueue.Telemetry:
-
-                telemetry, err = Telemetry.from_bytes(element.data)
-                if (telemetry is None):
-                    messagebox.showerror("Unexpected error", err)
-                    self.on_close()
-                    return
-
-                self.telemetry_ui.update_values(telemetry)
-                self.tyre_graph.update_data(telemetry)
-                self.strategy_ui.updade_telemetry_data(telemetry)
+    def _wake_network(self) -> None:
 
-                self.driver_inputs.update_lap(telemetry.lap)
+        reactor.callLater(0, self.process_network)
 
-                if not self.strategy_ui.is_driver_active:
-                    self.strategy_ui.is_driver_active = True
-                    self.user_ui.set_active(telemetry.driver)
+    def process_network(self) -> None:
 
-                self.last_telemetry = time.time()
+        for element in self.net_queue.drain():
 
-            elif element.data_type == NetworkQueue.TelemetryRT:
+            self.dispatcher.dispatch_type(element.data_type.value,
+                                          element.data)
 
-                telemetry = TelemetryRT.from_bytes(element.data)
-                self.driver_inputs.update_values(telemetry)
+            # A handler closed the app
+            if self.closed:
+                return
 
-            elif element.data_type == NetworkQueue.UpdateUsers:
+    def make_rates(self) -> RateController:
+        """
+        Send rates of Telemetry and TelemetryRT, between the bounds of
+        gui.json (fixed when there is none)
+        """
 
-                logging.info("Received user update")
+        rates = {}
+        for data_type, interval, bounds in (
+                (NetworkQueue.Telemetry, self.min_delta,
+                 "telemetry_interval_bounds"),
+                (NetworkQueue.TelemetryRT, self.rt_min_delta,
+                 "driver_input_interval_bounds")):
 
-                user_update = element.data
-                nb_users = user_update[0]
-                self.user_ui.reset()
-                self.strategy_ui.reset_drivers()
+            low, high = self.gui_config.get(bounds, (interval, interval))
+            rates[data_type] = SendRate(interval, low, high)
 
-                index = 1
-                for _ in range(nb_users):
+        return RateController(rates)
 
-                    lenght = user_update[index]
-                    index += 1
-                    name = user_update[index:index+lenght].decode("utf-8")
-                    index += lenght
-                    driverID = user_update[index]
-                    index += 1
-
-                    self.user_ui.add_user(name, driverID)
-                    self.strategy_ui.add_driver(name, driverID)
-
-            elif element.data_type == NetworkQueue.TyreSets:
-
-                data = zlib.decompress(element.data)
-
-                tyres_data = []
-                nb_of_set = data[0]
-                byte_index = 1
-                for _ in range(nb_of_set):
-                    tyre_info = TyresSetData.from_bytes(
-                        data[byte_index:byte_index+TyresSetData.byte_size])
-                    tyres_data.append(tyre_info)
-                    byte_index += TyresSetData.byte_size
-
-                self.tyre_sets.update_tyre_set_data(tyres_data)
-
-        self.net_queue.q_out.clear()
+    def client_loop(self) -> None:
 
         if not self.is_connected:
             return
 
+        # Follow the send rates of the link, the loop sends TelemetryRT
+        rates = self.client.rates
+        min_delta = rates.interval(NetworkQueue.Telemetry)
+        self.client_loopCall.interval = rates.interval(
+            NetworkQueue.TelemetryRT)
+
+        status = str(rates)
+        if status != self.link_status.get():
+            self.link_status.set(status)
+
         if not self.strategy_ui.is_connected:
             self.strategy_ui.is_connected = True
 
@@ -626,9 +603,6 @@ class App(tkinter.Tk):
                 self.telemetry_ui.driver_swap = False
                 self.strategy_ui.set_driver(self.telemetry_ui.current_driver)
 
-        rt_delta_time = time.time() - self.rt_last_time
-        delta_time = time.time() - self.last_time
-
         if (self.strategy_ui.is_driver_active and
                 time.time() > self.last_telemetry + self.telemetry_timeout):
 
@@ -641,10 +615,11 @@ class App(tkinter.Tk):
         asm_data = self.strategy_ui.asm.read_shared_memory()
         if asm_data is not None:
 
-            if self.rt_min_delta < rt_delta_time:
-
-                self.rt_last_time = time.time()
+            # Driver inputs are sent every loop (rt_min_delta)
+            if self.rt_sampler.running:
+                self.send_driver_inputs()
 
+            else:
                 telemetry_rt = TelemetryRT(
                     asm_data.Physics.gas,
                     asm_data.Physics.brake,
@@ -653,12 +628,14 @@ class App(tkinter.Tk):
                     asm_data.Physics.speed_kmh
                 )
 
-                self.net_queue.q_in.append(NetData(NetworkQueue.TelemetryRT,
-                                           telemetry_rt.to_bytes()))
+                self.client.send(NetData(NetworkQueue.TelemetryRT,
+                                         telemetry_rt.to_bytes()))
 
-            if self.min_delta < delta_time:
+            if time.time() >= self.last_time + min_delta:
 
-                self.last_time = time.time()
+                # Keep the cadence of the loop, don't accumulate its delay
+                self.last_time = max(self.last_time + min_delta,
+                                     time.time() - min_delta)
 
                 infos = CarInfo(
                     *astuple(asm_data.Graphics.mfd_tyre_pressure),
@@ -666,8 +643,8 @@ class App(tkinter.Tk):
                     asm_data.Static.max_fuel,
                     asm_data.Graphics.mfd_tyre_set)
 
-                self.net_queue.q_in.append(NetData(NetworkQueue.CarInfoData,
-                                           infos.to_bytes()))
+                self.client.send(NetData(NetworkQueue.CarInfoData,
+                                         infos.to_bytes()))
 
                 # Telemetry
                 name = asm_data.Static.player_name.split("\x00")[0]
@@ -710,38 +687,191 @@ class App(tkinter.Tk):
                     asm_data.Graphics.current_tyre_set,
                 )
 
-                self.net_queue.q_in.append(NetData(NetworkQueue.Telemetry,
-                                           telemetry_data.to_bytes()))
+                self.client.send(NetData(NetworkQueue.Telemetry,
+                                         telemetry_data.to_bytes()))
 
         if self.strategy_ui.strategy is not None:
 
             logging.info("Sending strategy")
             strategy = self.strategy_ui.strategy
             self.strategy_ui.strategy = None
-            self.net_queue.q_in.append(NetData(NetworkQueue.StrategySet,
-                                               strategy.to_bytes()))
+            self.client.send(NetData(NetworkQueue.StrategySet,
+                                     strategy.to_bytes()))
 
         if self.strategy_ui.strategy_ok:
 
             logging.info("Send strategy Done")
-            self.net_queue.q_in.append(NetData(NetworkQueue.StrategyDone))
+            self.client.send(NetData(NetworkQueue.StrategyDone))
             self.strategy_ui.strategy_ok = False
 
         if self.tyre_sets.updated:
 
-            data = b""
-            data += struct.pack("!B", len(self.tyre_sets.tyres_data))
-            for tyre_set in self.tyre_sets.tyres_data:
-                data += tyre_set.to_bytes()
-
-            data_compressed = zlib.compress(data)
-            print(f"{len(data)} vs {len(data_compressed)}")
-
-            self.net_queue.q_in.append(NetData(NetworkQueue.TyreSets,
-                                               data_compressed))
+            # The client compresses them, out of the GUI thread
+            data = TyresSetData.list_to_bytes(self.tyre_sets.tyres_data)
+            self.client.send(NetData(NetworkQueue.TyreSets, data))
             self.tyre_sets.updated = False
             logging.info("Sending tyre set data")
 
+    def sample_driver_inputs(self) -> None:
+
+        asm_data = self.strategy_ui.asm.read_shared_memory()
+        if asm_data is None:
+            return
+
+        self.rt_samples.append((timestamp_ms(), TelemetryRT(
+            asm_data.Physics.gas,
+            asm_data.Physics.brake,
+            asm_data.Physics.steer_angle,
+            asm_data.Physics.gear,
+            asm_data.Physics.speed_kmh
+        )))
+
+    def send_driver_inputs(self) -> None:
+
+        samples = self.rt_samples
+        self.rt_samples = []
+
+        size = TelemetryRTBatch.max_samples
+        for index in range(0, len(samples), size):
+
+            batch = TelemetryRTBatch(samples[index:index+size])
+            self.client.send(NetData(NetworkQueue.TelemetryRTBatch,
+                                     batch.to_bytes()))
+
+    def _on_connection_reply(self, data: bytes) -> None:
+
+        logging.info("Received Connection reply for server")
+
+        succes = bool(data[0])
+        msg_lenght = data[1]
+        msg = data[2:2 + msg_lenght]
+
+        self.connection_page.connected(succes, msg)
+        self.mb_connected(succes)
+        self.is_connected = succes
+        if succes:
+            # A second reply doesn't start them again
+            if not self.client_loopCall.running:
+                self.client_loopCall.start(self.rt_min_delta)
+
+            if self.rt_sample_rate > 0 and not self.rt_sampler.running:
+                self.rt_sampler.start(1 / self.rt_sample_rate)
+
+        elif self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def _on_server_data(self, data: bytes) -> None:
+
+        server_data = CarInfo.from_bytes(data)
+        is_first_update = self.strategy_ui.server_data is None
+        self.strategy_ui.server_data = server_data
+
+        if is_first_update:
+            self.strategy_ui.update_values()
+
+    def _on_strategy(self, data: bytes) -> None:
+
+        logging.info("Received: Strategy")
+
+        self.strategy_ui.b_set_strat.config(state="disabled")
+        asm_data = self.strategy_ui.asm.read_shared_memory()
+        pit_stop = PitStop.from_bytes(data)
+        strategy_id = STRATEGY_ID.unpack_from(data, PitStop.byte_size)[0]
+        self.strategy_ui.save_strategies([(strategy_id, pit_stop)])
+
+        if asm_data is not None:
+            self.strategy_ui.apply_strategy(pit_stop)
+
+    def _on_strategy_history(self, data: bytes) -> None:
+
+        reset, strategy_count = HISTORY_UPDATE.unpack_from(data)
+        if reset:
+            self.strategy_ui.clear_strategy_history()
+
+        strategies = []
+        byte_index = HISTORY_UPDATE.size
+        for _ in range(strategy_count):
+
+            strategy_id = STRATEGY_ID.unpack_from(data, byte_index)[0]
+            byte_index += STRATEGY_ID.size
+            strat = PitStop.from_bytes(data, byte_index)
+            strategies.append((strategy_id, strat))
+            byte_index += PitStop.byte_size
+
+        self.strategy_ui.save_strategies(strategies)
+
+    def _on_strategy_done(self, data: bytes) -> None:
+
+        logging.info("Received: Strategy Done")
+
+        self.strategy_ui.b_set_strat.config(state="normal")
+        self.strategy_ui.update_values()
+
+    def _on_telemetry(self, data: bytes) -> None:
+
+        telemetry, err = Telemetry.from_bytes(data)
+        if (telemetry is None):
+            messagebox.showerror("Unexpected error", err)
+            self.on_close()
+            return
+
+        self.telemetry_ui.update_values(telemetry)
+        self.tyre_graph.update_data(telemetry)
+        self.strategy_ui.updade_telemetry_data(telemetry)
+
+        self.driver_inputs.update_lap(telemetry.lap)
+
+        if not self.strategy_ui.is_driver_active:
+            self.strategy_ui.is_driver_active = True
+            self.user_ui.set_active(telemetry.driver)
+
+        self.last_telemetry = time.time()
+
+    def _on_telemetry_rt(self, data: bytes) -> None:
+
+        telemetry = TelemetryRT.from_bytes(data)
+        self.driver_inputs.update_values(telemetry)
+
+    def _on_telemetry_rt_batch(self, data: bytes) -> None:
+
+        batch = TelemetryRTBatch.from_bytes(data)
+        if batch.samples:
+            self.driver_inputs.update_batch(batch)
+
+    def _on_update_users(self, data: bytes) -> None:
+
+        logging.info("Received user update")
+
+        user_update = data
+        nb_users = user_update[0]
+        self.user_ui.reset()
+        self.strategy_ui.reset_drivers()
+
+        index = 1
+        for _ in range(nb_users):
+
+            lenght = user_update[index]
+            index += 1
+            name = user_update[index:index+lenght].decode("utf-8")
+            index += lenght
+            driverID = user_update[index]
+            index += 1
+
+            self.user_ui.add_user(name, driverID)
+            self.strategy_ui.add_driver(name, driverID)
+
+    def _on_tyre_sets(self, data: bytes) -> None:
+
+        data = zlib.decompress(data)
+        tyres_data = TyresSetData.list_from_bytes(data)
+
+        self.tyre_sets.update_tyre_set_data(tyres_data)
+
+    def _on_unknown(self, data: bytes) -> None:
+
+        logging.warning("Unexpected network message")
+
     def show_connection_page(self, as_server: bool = False) -> None:
 
         logging.info("Show connection page")
@@ -758,7 +888,11 @@ class App(tkinter.Tk):
 
         logging.info("Creating a ClientInstance, connecting"
                      f" to {credits.ip}:{credits.tcp_port}")
-        self.client = ClientInstance(credits, self.net_queue)
+        if self.client is not None:
+            self.client.close()
+
+        self.client = ClientInstance(credits, self.net_queue,
+                                     self.make_rates(), self.history_cursor)
 
     def as_server(self, credis: Credidentials) -> Tuple[bool, str]:
 
@@ -793,9 +927,20 @@ class App(tkinter.Tk):
 
     def stop_networking(self) -> None:
 
-        if self.is_connected:
+        if self.client_loopCall.running:
+            self.client_loopCall.stop()
+
+        if self.rt_sampler.running:
+            self.rt_sampler.stop()
+
+        self.rt_samples.clear()
+        self.link_status.set("")
+
+        # Also pending or refused, its loops run since it was created
+        if self.client is not None:
 
             self.client.close()
+            self.client = None
             self.is_connected = False
             logging.info("Client stopped.")
 
@@ -816,7 +961,7 @@ class App(tkinter.Tk):
 
         self.disconnect()
 
-        self.client_loopCall.stop()
+        self.closed = True
 
         tksupport.uninstall()
 
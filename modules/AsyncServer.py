@@ -0,0 +1,317 @@
+"""
+asyncio engine of the server.
+
+Runs the TCP_Server / UDP_Server protocols of modules.Server on asyncio
+transports instead of the Twisted reactor: the wire protocol, the rooms and
+the relay are the same code. Thin adapters give the protocols the part of
+the Twisted API they use (transport, clock for the timers and heartbeats).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from twisted.internet.address import IPv4Address
+from twisted.internet.error import ConnectionDone, ConnectionLost
+from twisted.internet.interfaces import IPushProducer
+from twisted.python.failure import Failure
+
+from modules.Metrics import server_metrics
+from modules.Server import (Rooms, TCP_Factory, TCP_Server, UDP_Server,
+                            start_history, start_recording)
+
+log = logging.getLogger(__name__)
+
+# Seconds a metrics client has to send its request
+METRICS_REQUEST_TIMEOUT = 5
+
+
+class AsyncioDelayedCall:
+    """
+    IDelayedCall of an asyncio TimerHandle
+    """
+
+    def __init__(self, handle: asyncio.TimerHandle, due: float) -> None:
+
+        self._handle = handle
+        self._due = due
+        self.called = False
+
+    def getTime(self) -> float:
+
+        return self._due
+
+    def cancel(self) -> None:
+
+        self._handle.cancel()
+
+    def active(self) -> bool:
+
+        return not (self.called or self._handle.cancelled())
+
+
+class AsyncioClock:
+    """
+    IReactorTime of an asyncio loop, seconds() is time.time() like the
+    reactor so heartbeats and link monitors see the same clock
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+
+        self.loop = loop
+
+    def seconds(self) -> float:
+
+        return time.time()
+
+    def callLater(self, delay: float, function: Callable[..., Any],
+                  *args, **kwargs) -> AsyncioDelayedCall:
+
+        def run() -> None:
+            call.called = True
+            function(*args, **kwargs)
+
+        handle = self.loop.call_later(max(0, delay), run)
+        call = AsyncioDelayedCall(handle, self.seconds() + delay)
+
+        return call
+
+
+class AsyncioTCPTransport:
+    """
+    The ITCPTransport methods TCP_Server uses, on an asyncio transport
+    """
+
+    def __init__(self, transport: asyncio.Transport) -> None:
+
+        self.transport = transport
+        host, port = transport.get_extra_info("peername")[:2]
+        self._peer = IPv4Address("TCP", host, port)
+        # Streaming producer paused while the write buffer is full
+        self.producer: Optional[IPushProducer] = None
+
+    def write(self, data: bytes) -> None:
+
+        self.transport.write(data)
+
+    def getPeer(self) -> IPv4Address:
+
+        return self._peer
+
+    def loseConnection(self) -> None:
+
+        self.transport.close()
+
+    def abortConnection(self) -> None:
+
+        self.transport.abort()
+
+    def get_write_buffer_size(self) -> int:
+
+        return self.transport.get_write_buffer_size()
+
+    def registerProducer(self, producer: IPushProducer,
+                         streaming: bool) -> None:
+
+        self.producer = producer
+
+    def unregisterProducer(self) -> None:
+
+        self.producer = None
+
+
+class AsyncioTCPProtocol(asyncio.Protocol):
+
+    def __init__(self, server: TCP_Server) -> None:
+
+        self.server = server
+        self.transport: Optional[AsyncioTCPTransport] = None
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+
+        self.transport = AsyncioTCPTransport(transport)
+        self.server.makeConnection(self.transport)
+
+    def pause_writing(self) -> None:
+
+        if self.transport.producer is not None:
+            self.transport.producer.pauseProducing()
+
+    def resume_writing(self) -> None:
+
+        if self.transport.producer is not None:
+            self.transport.producer.resumeProducing()
+
+    def data_received(self, data: bytes) -> None:
+
+        self.server.dataReceived(data)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+
+        reason = ConnectionDone() if exc is None else ConnectionLost(str(exc))
+        self.server.connected = 0
+        if self.transport.producer is not None:
+            self.transport.producer.stopProducing()
+        self.server.connectionLost(Failure(reason))
+
+
+class AsyncioUDPTransport:
+    """
+    The IUDPTransport methods UDP_Server uses
+    """
+
+    def __init__(self, transport: asyncio.DatagramTransport) -> None:
+
+        self.transport = transport
+
+    def write(self, datagram: bytes, addr: Tuple[str, int]) -> None:
+
+        self.transport.sendto(datagram, addr)
+
+    def loseConnection(self) -> None:
+
+        self.transport.close()
+
+
+class AsyncioUDPProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, server: UDP_Server) -> None:
+
+        self.server = server
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+
+        self.server.transport = AsyncioUDPTransport(transport)
+        self.server.startProtocol()
+
+    def datagram_received(self, datagram: bytes,
+                          addr: Tuple[str, int]) -> None:
+
+        self.server.datagramReceived(datagram, addr[:2])
+
+    def error_received(self, exc: Exception) -> None:
+
+        # ICMP port unreachable of a client gone, like Twisted ignores it
+        log.debug(f"UDP error: {exc}")
+
+
+class AsyncServerInstance:
+    """
+    ServerInstance on an asyncio loop, start() must run in the loop
+    """
+
+    def __init__(self, tcp_port: int, udp_port: int,
+                 loop: Optional[asyncio.AbstractEventLoop] = None,
+                 record: Optional[str] = None,
+                 history: Optional[str] = None) -> None:
+
+        self.tcp_port_number = tcp_port
+        self.udp_port_number = udp_port
+        self.loop = loop or asyncio.get_event_loop()
+        self.clock = AsyncioClock(self.loop)
+
+        self.rooms = Rooms()
+        self.tcp_factory = TCP_Factory(self.rooms, clock=self.clock)
+        self.history = start_history(history, self.tcp_factory)
+        self.udp_server = UDP_Server(self.rooms, clock=self.clock)
+
+        self.tcp_server: Optional[asyncio.AbstractServer] = None
+        self.udp_transport: Optional[asyncio.DatagramTransport] = None
+
+        server_metrics.watch(self.tcp_factory, self.udp_server)
+        self.recorder = start_recording(record, self.tcp_factory,
+                                        self.udp_server)
+
+    async def start(self) -> None:
+
+        self.tcp_factory.startFactory()
+        self.tcp_server = await self.loop.create_server(
+            lambda: AsyncioTCPProtocol(self.tcp_factory.buildProtocol(None)),
+            port=self.tcp_port_number, reuse_address=True)
+
+        self.udp_transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: AsyncioUDPProtocol(self.udp_server),
+            local_addr=("0.0.0.0", self.udp_port_number))
+
+    def close(self) -> None:
+
+        # Before the connections close, see start_history
+        if self.history is not None:
+            self.history.close()
+
+        self.tcp_factory.close()
+        self.tcp_factory.stopFactory()
+        if self.tcp_server is not None:
+            self.tcp_server.close()
+
+        self.udp_server.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+async def serve_metrics(port: int, interface: str = "127.0.0.1"
+                        ) -> asyncio.AbstractServer:
+    """
+    modules.Metrics.serve_metrics on asyncio, any path answers
+    """
+
+    async def answer(reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+
+        try:
+            await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"),
+                                   METRICS_REQUEST_TIMEOUT)
+
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError):
+            writer.close()
+            return
+
+        body = server_metrics.render()
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/plain; version=0.0.4;"
+                     b" charset=utf-8\r\n"
+                     b"Content-Length: " + str(len(body)).encode() +
+                     b"\r\nConnection: close\r\n\r\n" + body)
+        await writer.drain()
+        writer.close()
+
+    loop = asyncio.get_running_loop()
+    server = await asyncio.start_server(answer, interface, port)
+    server_metrics.start(AsyncioClock(loop))
+    log.info(f"Metrics on http://{interface}:{port}/metrics")
+
+    return server
+
+
+def run_asyncio_server(tcp_port: int, udp_port: int,
+                       metrics_port: Optional[int] = None,
+                       record: Optional[str] = None,
+                       history: Optional[str] = None) -> None:
+    """
+    Run the asyncio engine until ctrl C
+    """
+
+    async def main() -> None:
+
+        server = AsyncServerInstance(tcp_port, udp_port,
+                                     asyncio.get_running_loop(), record,
+                                     history)
+        await server.start()
+
+        if metrics_port is not None:
+            await serve_metrics(metrics_port)
+
+        try:
+            await asyncio.Event().wait()
+
+        finally:
+            server.close()
+
+    try:
+        asyncio.run(main())
+
+    except KeyboardInterrupt:
+        pass
@@ -2,38 +2,104 @@ from __future__ import annotations
 
 import logging
 import struct
-import time
+import zlib
+from collections import deque
+from functools import partial
+from typing import Deque, Dict, Optional, Tuple
 
-from twisted.internet import reactor, task
+from twisted.internet import reactor, task, threads
 from twisted.internet.endpoints import TCP4ClientEndpoint
+from twisted.internet.interfaces import IReactorTime
 from twisted.internet.protocol import ClientFactory, DatagramProtocol, Protocol
 from twisted.python.failure import Failure
 
-from modules.Common import (Credidentials, DataQueue, NetData, NetworkQueue,
-                            PacketType)
+from modules.Codec import TELEMETRY, TELEMETRY_RT, UDP_HEADER
+from modules.Common import (Channel, Credidentials, DataQueue, NetData,
+                            NetworkQueue, OverflowPolicy, PacketType,
+                            PitStop)
+from modules.Compression import (COMPRESSED, COMPRESSION_FLAGS,
+                                 COMPRESSION_ZLIB, compress, decompress,
+                                 read_flags)
+from modules.Delta import DeltaDecoder, DeltaEncoder
+from modules.Dispatch import PacketDispatcher
+from modules.Election import STANDBY_INTERVAL
+from modules.Heartbeat import HEARTBEAT_INTERVAL, Heartbeat
+from modules.History import (HISTORY_FLAGS, HISTORY_PAGE, HISTORY_REQUEST,
+                             HISTORY_UPDATE, LONG_HISTORY, PAGED_HISTORY,
+                             STRATEGY_ID, HistoryCursor)
+from modules.RateControl import RateController
+from modules.Sequence import (LINK_REPORT_INTERVAL, JitterBuffer,
+                              StreamSender, StreamStats, StreamTracker)
+from modules.Framing import FrameDecoder, frame
 
 client_log = logging.getLogger(__name__)
 
+UDP_MESSAGES = (NetworkQueue.Telemetry, NetworkQueue.TelemetryRT,
+                NetworkQueue.TelemetryRTBatch)
+# Telemetry is sent at most every 10ms, older message are useless
+UDP_QUEUE_SIZE = 16
+TCP_QUEUE_SIZE = 256
+# Telemetry is sent every 0.5s, a keyframe every 3s bounds the deltas
+TELEMETRY_KEYFRAME_INTERVAL = 6
+# Keyframe packet, delta packet, layout and queue of the telemetry streams
+# received. Only Telemetry is sent with deltas: the driver inputs of
+# TelemetryRT change on every packet on track, its deltas save nothing.
+TELEMETRY_STREAMS = (
+    (PacketType.Telemetry, PacketType.TelemetryDelta, TELEMETRY,
+     NetworkQueue.Telemetry),
+    (PacketType.TelemetryRT, PacketType.TelemetryRTDelta, TELEMETRY_RT,
+     NetworkQueue.TelemetryRT),
+)
+# Streams played through a jitter buffer, the others drop what is late.
+# Batches carry the time of their samples, they don't need one.
+JITTER_BUFFERED = (NetworkQueue.TelemetryRT,)
+# Type of the telemetry sent without deltas
+FULL_UDP = {
+    NetworkQueue.TelemetryRT: PacketType.TelemetryRT.to_bytes(),
+    NetworkQueue.TelemetryRTBatch: PacketType.TelemetryRTBatch.to_bytes(),
+}
+# Payload of a telemetry datagram, after the type and the UDP_HEADER
+HEADER_END = 1 + UDP_HEADER.size
+STATS_INTERVAL = 60
+
 
 class ClientInstance:
 
-    def __init__(self, credis: Credidentials, queue: DataQueue) -> None:
+    def __init__(self, credis: Credidentials, queue: Channel,
+                 rates: Optional[RateController] = None,
+                 history: Optional[HistoryCursor] = None) -> None:
 
+        # Both transports push received messages straight in the app queue
         self.data_queue = queue
 
-        self.udp_queue = DataQueue([], [])
-        self.tcp_queue = DataQueue([], [])
+        self.udp_queue = DataQueue(
+            Channel(UDP_QUEUE_SIZE, OverflowPolicy.DropOldest), queue)
+        self.tcp_queue = DataQueue(
+            Channel(TCP_QUEUE_SIZE, OverflowPolicy.NeverDrop), queue)
+
+        # Shared by both transports, the server sends the last telemetry of
+        # the room over TCP when joining
+        self.telemetry = TelemetryReceiver(queue)
+        self.stats_call = task.LoopingCall(self.log_stats)
+        self.stats_call.start(STATS_INTERVAL, now=False)
 
-        self.looping_call = task.LoopingCall(self.check_queue)
-        self.looping_call.start(0.01)
+        # Send intervals the app follows, from the server link reports
+        self.rates = RateController({}) if rates is None else rates
+        self.rates_call = task.LoopingCall(self.rates.check)
+        self.rates_call.start(LINK_REPORT_INTERVAL, now=False)
 
         endpoint = TCP4ClientEndpoint(reactor, credis.ip, credis.tcp_port, timeout=5)
         
-        deferred = endpoint.connect(TCP_Factory(credis, self.tcp_queue))
+        # Strategy history the app has, kept between connections
+        self.history = HistoryCursor() if history is None else history
+        deferred = endpoint.connect(TCP_Factory(credis, self.tcp_queue,
+                                                self.telemetry, self.history))
         deferred.addErrback(self._connectionErr)
 
-        reactor.listenUDP(0, UDPClient(credis.ip, credis.udp_port,
-                                       self.udp_queue))
+        self.udp_client = UDPClient(credis.ip, credis.udp_port,
+                                    self.udp_queue, self.telemetry,
+                                    self.rates, credis.room)
+        reactor.listenUDP(0, self.udp_client)
 
     def _connectionErr(self, reason: Failure) -> None:
 
@@ -47,66 +113,247 @@ class ClientInstance:
 
         net_data = NetData(NetworkQueue.ConnectionReply, buffer)
 
-        self.tcp_queue.q_out.append(net_data)
+        self.tcp_queue.q_out.push(net_data)
 
-    def check_queue(self) -> None:
+    def send(self, element: NetData) -> None:
+        """
+        Push a message in the queue of the transport sending it
+        """
 
-        for element in self.data_queue.q_in:
+        # Another teammate is the telemetry source, its car info is the one
+        if (element.data_type == NetworkQueue.CarInfoData
+                and self.udp_client.standby):
+            return
 
-            if (element.data_type in (NetworkQueue.Telemetry,
-                                      NetworkQueue.TelemetryRT)):
+        if element.data_type in UDP_MESSAGES:
+            self.udp_queue.q_in.push(element)
 
-                self.udp_queue.q_in.append(element)
+        else:
+            self.tcp_queue.q_in.push(element)
 
-            else:
-                self.tcp_queue.q_in.append(element)
+    def close(self) -> None:
+
+        self.tcp_queue.q_in.push(NetData(NetworkQueue.Close))
+        self.udp_queue.q_in.push(NetData(NetworkQueue.Close))
+
+        for call in (self.stats_call, self.rates_call):
+            if call.running:
+                call.stop()
+
+        self.log_stats()
+        self.telemetry.close()
+
+    def log_stats(self) -> None:
+
+        self.telemetry.log_stats()
+
+        rates = str(self.rates)
+        if rates:
+            client_log.info(f"Send rates: {rates}")
+
+
+class TelemetryReceiver:
+    """
+    Rebuild the full Telemetry and TelemetryRT from their keyframes and
+    deltas, for both transports.
+
+    Each (sender, stream) is tracked with its sequence numbers, late
+    Telemetry is dropped and TelemetryRT goes through a jitter buffer.
+    """
+
+    def __init__(self, queue: Channel, clock: IReactorTime = reactor) -> None:
 
-        self.data_queue.q_in.clear()
+        self.queue = queue
+        self.clock = clock
+        self.decoders = {}
+        for _, _, layout, data_type in TELEMETRY_STREAMS:
+            self.decoders[data_type] = DeltaDecoder(layout)
+
+        self.trackers: Dict[Tuple[int, NetworkQueue], StreamTracker] = {}
+        self.buffers: Dict[Tuple[int, NetworkQueue], JitterBuffer] = {}
+
+    def register(self, dispatcher: PacketDispatcher) -> None:
+
+        for key_packet, delta_packet, _, data_type in TELEMETRY_STREAMS:
+            dispatcher.register(key_packet,
+                                partial(self._receive, data_type, True))
+            dispatcher.register(delta_packet,
+                                partial(self._receive, data_type, False))
+
+        dispatcher.register(PacketType.TelemetryRTBatch, self._receive_batch)
 
-        for element in self.udp_queue.q_out:
-            self.data_queue.q_out.append(element)
+    def stats(self) -> Dict[str, StreamStats]:
 
-        self.udp_queue.q_out.clear()
+        return {f"{data_type.name} from {sender:04x}": tracker.stats
+                for (sender, data_type), tracker in self.trackers.items()}
 
-        for element in self.tcp_queue.q_out:
-            self.data_queue.q_out.append(element)
+    def log_stats(self) -> None:
 
-        self.tcp_queue.q_out.clear()
+        for stream, stats in self.stats().items():
+            client_log.info(f"{stream}: {stats}")
 
     def close(self) -> None:
 
-        self.looping_call.stop()
-        self.tcp_queue.q_in.append(NetData(NetworkQueue.Close))
-        self.udp_queue.q_in.append(NetData(NetworkQueue.Close))
+        for buffer in self.buffers.values():
+            buffer.clear()
+
+    def _receive(self, data_type: NetworkQueue, keyframe: bool,
+                 data: bytes) -> None:
+
+        tracked = self._track(data_type, data)
+        if tracked is None:
+            return
+
+        stream, sequence, timestamp, newest = tracked
+
+        # Keyframes are kept even late, newer deltas can use them
+        decoder = self.decoders[data_type]
+        if keyframe:
+            payload = decoder.keyframe(data[HEADER_END:])
+
+        else:
+            payload = decoder.decode(data[HEADER_END:])
+
+        if payload is None:
+            return
+
+        buffer = self.buffers.get(stream)
+        if buffer is not None:
+            buffer.push(sequence, timestamp, payload)
+
+        elif newest:
+            self._push(data_type, payload)
+
+    def _receive_batch(self, data: bytes) -> None:
+
+        data_type = NetworkQueue.TelemetryRTBatch
+        tracked = self._track(data_type, data)
+
+        # The samples of a late batch are older than the ones shown
+        if tracked is not None and tracked[3]:
+            self._push(data_type, bytes(data[HEADER_END:]))
+
+    def _track(self, data_type: NetworkQueue, data: bytes
+               ) -> Optional[Tuple[Tuple[int, NetworkQueue], int, int, bool]]:
+        """
+        Stream, extended sequence number, timestamp and if it is the newest
+        of a datagram, None for invalid or duplicated datagrams
+        """
+
+        if len(data) < HEADER_END:
+            client_log.warning(f"Truncated {data_type.name} datagram")
+            return None
+
+        sender, sequence, timestamp = UDP_HEADER.unpack_from(data, 1)
+        stream = (sender, data_type)
+        tracker = self.trackers.get(stream)
+        if tracker is None:
+            tracker = StreamTracker()
+            self.trackers[stream] = tracker
+
+            if data_type in JITTER_BUFFERED:
+                self.buffers[stream] = JitterBuffer(
+                    tracker, partial(self._push, data_type), self.clock)
+
+        sequence, newest = tracker.track(sequence, timestamp,
+                                         self.clock.seconds())
+        if sequence is None:
+            return None
+
+        return stream, sequence, timestamp, newest
+
+    def _push(self, data_type: NetworkQueue, payload: bytes) -> None:
+
+        self.queue.push(NetData(data_type, payload))
 
 
 class TCP_Factory(ClientFactory):
 
-    def __init__(self, credis: Credidentials, queue: DataQueue) -> None:
+    def __init__(self, credis: Credidentials, queue: DataQueue,
+                 telemetry: TelemetryReceiver,
+                 history: HistoryCursor) -> None:
 
         self._name = credis.username
         self._driverID = credis.driverID
+        self._room = credis.room
         self.data_queue = queue
+        self.telemetry = telemetry
+        self.history = history
 
     def buildProtocol(self, addr) -> TCP_Client:
 
-        return TCP_Client(self._name, self._driverID, self.data_queue)
+        return TCP_Client(self._name, self._driverID, self.data_queue,
+                          self.telemetry, self.history, self._room)
+
+
+def tyre_sets_frame(data: bytes) -> bytes:
+    """
+    Frame of the TyreSets packet of data, its zlib is the payload every app
+    version expects. Run in a thread, it is too slow for the GUI one.
+    """
+
+    return frame(PacketType.TyreSets.to_bytes() + zlib.compress(data))
+
+
+def room_bytes(room: str) -> bytes:
+    """
+    "!B" lenght prefixed room token
+    """
+
+    room_byte = room.encode("utf-8")[:255]
+    return struct.pack("!B", len(room_byte)) + room_byte
 
 
 class TCP_Client(Protocol):
 
-    def __init__(self, name: str, driverID: int, queue: DataQueue) -> None:
+    def __init__(self, name: str, driverID: int, queue: DataQueue,
+                 telemetry: TelemetryReceiver, history: HistoryCursor,
+                 room: str = "") -> None:
 
         self._name = name
         self._driverID = driverID
+        self._room = room
         self._data_queue = queue
         self._error = ""
-        self.loop_call = task.LoopingCall(self.check_queue)
-        self.loop_call.start(0.1)
+        self._decoder = FrameDecoder()
+        self.heartbeat = Heartbeat()
+        self.heartbeat_call = task.LoopingCall(self._heartbeat)
+        # Negotiated in the Connect, see modules.Compression
+        self.compression = False
+        # Negotiated in the Connect, see modules.History
+        self.long_history = False
+        self.paged_history = False
+        self.history = history
+        # Frames waiting for one built in a thread, to keep their order.
+        # None until the thread is done, b"" if it failed.
+        self._outbox: Deque[list] = deque()
+
+        self._dispatcher = PacketDispatcher("TCP_Client", self._invalid_packet)
+        self._dispatcher.register(PacketType.ConnectionReply,
+                                  self._on_connection_reply)
+        self._dispatcher.register(PacketType.Compressed, self._on_compressed)
+        self._dispatcher.register(PacketType.Strategy, self._on_strategy)
+        self._dispatcher.register(PacketType.StategyHistory,
+                                  self._on_strategy_history)
+        self._dispatcher.register(PacketType.StrategyPage,
+                                  self._on_strategy_page)
+        for packet, data_type in (
+                (PacketType.ServerData, NetworkQueue.ServerData),
+                (PacketType.StrategyOK, NetworkQueue.StrategyDone),
+                (PacketType.UpdateUsers, NetworkQueue.UpdateUsers),
+                (PacketType.TyreSets, NetworkQueue.TyreSets)):
+
+            self._dispatcher.register(packet, partial(self._push, data_type))
+
+        # Last telemetry of the room, sent when joining
+        telemetry.register(self._dispatcher)
+
+        self._dispatcher.register(PacketType.Ping, self._on_ping)
+        self._dispatcher.register(PacketType.Pong, self.heartbeat.on_pong)
 
     def check_queue(self) -> None:
 
-        for element in self._data_queue.q_in:
+        for element in self._data_queue.q_in.drain():
 
             packet = element.data_type
 
@@ -122,30 +369,59 @@ class TCP_Client(Protocol):
                 self.send_message(PacketType.StrategyOK.to_bytes())
 
             elif packet == NetworkQueue.TyreSets:
-                self.send_message(PacketType.TyreSets.to_bytes()
-                                  + element.data)
+                self.send_later(threads.deferToThread(tyre_sets_frame,
+                                                      element.data))
 
             elif packet == NetworkQueue.Close:
                 self.close()
 
-        self._data_queue.q_in.clear()
-
     def send_message(self, data: bytes) -> None:
 
-        data_header = struct.pack("!H", len(data))
-        message = data_header + data
-        self.transport.write(message)
+        if self.compression:
+            data = compress(data) or data
+
+        self._write(frame(data))
+
+    def send_later(self, deferred) -> None:
+        """
+        Send the frame deferred gives, before the messages sent after
+        """
+
+        entry = [None]
+        self._outbox.append(entry)
+
+        def done(message: bytes) -> None:
+            entry[0] = message
+            self._flush_outbox()
+
+        def failed(reason: Failure) -> None:
+            client_log.warning(f"Couldn't build a message: {reason.value}")
+            done(b"")
+
+        deferred.addCallbacks(done, failed)
+
+    def _write(self, message: bytes) -> None:
+
+        if self._outbox:
+            self._outbox.append([message])
+
+        elif self.connected:
+            self.transport.write(message)
+
+    def _flush_outbox(self) -> None:
+
+        while self._outbox and self._outbox[0][0] is not None:
+
+            message = self._outbox.popleft()[0]
+            if message and self.connected:
+                self.transport.write(message)
 
     def dataReceived(self, data: bytes):
 
-        byte_offset = 0
-        while (len(data) != byte_offset):
+        self.heartbeat.seen()
 
-            packet_size = struct.unpack("!H",
-                                        data[byte_offset:byte_offset+2])[0]
-            byte_offset += 2
-            self._decode_packet(data[byte_offset:byte_offset+packet_size])
-            byte_offset += packet_size
+        for packet in self._decoder.feed(data):
+            self._decode_packet(packet)
 
     def connectionMade(self):
 
@@ -157,112 +433,327 @@ class TCP_Client(Protocol):
         buffer.append(name_lenght)
         buffer.append(name_byte)
         buffer.append(struct.pack("!B", self._driverID))
+        buffer.append(room_bytes(self._room))
+        buffer.append(struct.pack("!B", COMPRESSION_FLAGS | HISTORY_FLAGS))
 
         self.send_message(b"".join(buffer))
 
-    def connectionLost(self, reason: Failure):
-        self._error = str(reason)
-        client_log.info("Lost connection with server"
-                        f" {self.transport.getPeer()}")
+        # Send what was queued while connecting then wait for new messages
+        self._data_queue.q_in.waker = self._wake
+        self.check_queue()
 
-    def close(self):
+        self.heartbeat_call.start(HEARTBEAT_INTERVAL, now=False)
 
-        if self.transport is not None:
-            client_log.info("Close TCP client")
-            self.transport.loseConnection()
-            self.loop_call.stop()
+    def _heartbeat(self) -> None:
 
-    def _decode_packet(self, data: bytes) -> None:
+        # Older servers never answer, only a server which did can be dead
+        if self.heartbeat.capable and not self.heartbeat.alive:
+            client_log.warning(f"Server missed {self.heartbeat.missed}"
+                               " heartbeats, closing the connection")
+            self.transport.abortConnection()
+            return
 
-        packet = PacketType.from_bytes(data)
-        data = data[1:]
+        self.send_message(self.heartbeat.ping())
 
-        net_data = None
-        if packet == PacketType.ConnectionReply:
-            net_data = NetData(NetworkQueue.ConnectionReply, data)
+    def _on_ping(self, data: memoryview) -> None:
 
-        elif packet == PacketType.ServerData:
-            net_data = NetData(NetworkQueue.ServerData, data)
+        pong = self.heartbeat.on_ping(data)
+        if pong is not None:
+            self.send_message(pong)
 
-        elif packet == PacketType.Strategy:
-            net_data = NetData(NetworkQueue.Strategy, data)
+    def _on_connection_reply(self, data: memoryview) -> None:
 
-        elif packet == PacketType.StategyHistory:
-            net_data = NetData(NetworkQueue.StategyHistory, data)
+        # Flags accepted by the server after the message, none from an
+        # older one
+        flags = read_flags(data, 3 + data[2])
+        self.compression = bool(data[1]) and bool(flags & COMPRESSION_ZLIB)
+        if self.compression:
+            client_log.info("Compression enabled")
 
-        elif packet == PacketType.StrategyOK:
-            net_data = NetData(NetworkQueue.StrategyDone, data)
+        self.long_history = bool(data[1]) and bool(flags & LONG_HISTORY)
+        self.paged_history = bool(data[1]) and bool(flags & PAGED_HISTORY)
+        self._push(NetworkQueue.ConnectionReply, data)
 
-        elif packet == PacketType.UpdateUsers:
-            net_data = NetData(NetworkQueue.UpdateUsers, data)
+        if self.paged_history:
+            self._request_page()
 
-        elif packet == PacketType.TyreSets:
-            net_data = NetData(NetworkQueue.TyreSets, data)
+    def _request_page(self) -> None:
+
+        self.send_message(PacketType.StrategyPageRequest.to_bytes() +
+                          HISTORY_REQUEST.pack(self.history.epoch,
+                                               self.history.last))
+
+    def _on_strategy(self, data: memoryview) -> None:
+
+        end = 1 + PitStop.byte_size
+        if self.paged_history:
+            strategy_id = STRATEGY_ID.unpack_from(data, end)[0]
 
         else:
-            client_log.warning(f"Invalid packet type {data}")
-            client_log.warning(f"Size: {len(data)}")
+            # Older servers don't number them, in the order received
+            strategy_id = self.history.last + 1
+
+        # Otherwise the next page has it
+        if strategy_id == self.history.last + 1:
+            self.history.last = strategy_id
+
+        self._data_queue.q_out.push(NetData(
+            NetworkQueue.Strategy,
+            bytes(data[1:end]) + STRATEGY_ID.pack(strategy_id)))
+
+    def _on_strategy_history(self, data: memoryview) -> None:
+
+        # Whole history of an older server, "!B" count unless LONG_HISTORY
+        if self.long_history:
+            count = struct.unpack_from("!H", data, 1)[0]
+            offset = 3
+
+        else:
+            count = data[1]
+            offset = 2
+
+        buffer = [HISTORY_UPDATE.pack(True, count)]
+        for strategy_id in range(1, count + 1):
+            buffer.append(STRATEGY_ID.pack(strategy_id))
+            buffer.append(data[offset:offset+PitStop.byte_size])
+            offset += PitStop.byte_size
+
+        self.history.epoch = 0
+        self.history.last = count
+        self._data_queue.q_out.push(NetData(NetworkQueue.StategyHistory,
+                                            b"".join(buffer)))
+
+    def _on_strategy_page(self, data: memoryview) -> None:
+
+        history = self.history
+        epoch, first, last, count = HISTORY_PAGE.unpack_from(data, 1)
+        reset = epoch != history.epoch
+        if reset:
+            client_log.info("New strategy history, getting it all")
+            history.epoch = epoch
+            history.last = 0
+
+        # The ones received since the request are in the app already
+        skipped = max(0, history.last + 1 - first)
+        start = 1 + HISTORY_PAGE.size + skipped * PitStop.byte_size
+        buffer = [HISTORY_UPDATE.pack(reset, max(0, count - skipped))]
+        for strategy_id in range(first + skipped, first + count):
+            buffer.append(STRATEGY_ID.pack(strategy_id))
+            buffer.append(data[start:start+PitStop.byte_size])
+            start += PitStop.byte_size
+
+        history.last = max(history.last, first + count - 1)
+        if reset or count > skipped:
+            self._data_queue.q_out.push(NetData(NetworkQueue.StategyHistory,
+                                                b"".join(buffer)))
+
+        if history.last < last:
+            self._request_page()
+
+        else:
+            client_log.info(f"Strategy history synced, {last} strategies")
+
+    def _on_compressed(self, data: memoryview) -> None:
+
+        try:
+            packet = decompress(data)
+
+        except zlib.error as error:
+            client_log.warning(f"Invalid compressed packet: {error}")
             return
 
-        self._data_queue.q_out.append(net_data)
+        if packet[:1] == COMPRESSED:
+            client_log.warning("Nested compressed packet")
+            return
+
+        self._decode_packet(memoryview(packet))
+
+    def _wake(self) -> None:
+
+        reactor.callLater(0, self.check_queue)
+
+    def connectionLost(self, reason: Failure):
+        self._data_queue.q_in.waker = None
+        self._error = str(reason)
+        client_log.info("Lost connection with server"
+                        f" {self.transport.getPeer()} ({self.heartbeat})")
+
+        if self.heartbeat_call.running:
+            self.heartbeat_call.stop()
+
+    def close(self):
+
+        if self.transport is not None:
+            client_log.info("Close TCP client")
+            self.transport.loseConnection()
+
+    def _decode_packet(self, data: memoryview) -> None:
+
+        self._dispatcher.dispatch(data)
+
+    def _push(self, data_type: NetworkQueue, data: memoryview) -> None:
+
+        # NetData outlive the received chunk, copy the payload
+        self._data_queue.q_out.push(NetData(data_type, bytes(data[1:])))
+
+    def _invalid_packet(self, data: memoryview) -> None:
+
+        client_log.warning(f"Invalid packet type {bytes(data)}")
+        client_log.warning(f"Size: {len(data)}")
 
 
 class UDPClient(DatagramProtocol):
 
-    def __init__(self, ip: str, port: int, queue: DataQueue) -> None:
+    def __init__(self, ip: str, port: int, queue: DataQueue,
+                 telemetry: TelemetryReceiver, rates: RateController,
+                 room: str = "") -> None:
         super().__init__()
 
         self.ip = ip
         self.port = port
         self.queue = queue
-        self.udp_imnotdead_timer = time.time()
-        self.loop_call = task.LoopingCall(self.udp_client_loop)
-        self.loop_call.start(0.01)
+        self._hello = PacketType.ConnectUDP.to_bytes() + room_bytes(room)
+
+        self._encoders = {
+            NetworkQueue.Telemetry: DeltaEncoder(
+                TELEMETRY, PacketType.Telemetry, PacketType.TelemetryDelta,
+                TELEMETRY_KEYFRAME_INTERVAL),
+        }
+        # Same sender id on every stream, each with its own sequence
+        sender = StreamSender()
+        self._senders = {
+            NetworkQueue.Telemetry: sender,
+            NetworkQueue.TelemetryRT: StreamSender(sender.sender),
+            NetworkQueue.TelemetryRTBatch: StreamSender(sender.sender),
+        }
+
+        self._dispatcher = PacketDispatcher("UDPClient", lambda data: None)
+        telemetry.register(self._dispatcher)
+        self._dispatcher.register(PacketType.LinkReport, rates.on_report)
+        self._dispatcher.register(PacketType.Ping, self._on_ping)
+        self._dispatcher.register(PacketType.TelemetrySource,
+                                  self._on_telemetry_source)
+        self._dispatcher.register(PacketType.UDP_RENEW, self._on_udp_renew)
+
+        # The server relays the telemetry of another client of the room,
+        # only claim the source (see modules.Election)
+        self.standby = False
+        self._last_claim = 0.0
+
+        self.server_heartbeat = Heartbeat()
+        self._dispatcher.register(PacketType.Pong,
+                                  self.server_heartbeat.on_pong)
+        self.heartbeat_call = task.LoopingCall(self.heartbeat)
 
     def startProtocol(self) -> None:
 
         self.transport.connect(self.ip, self.port)
-        self.transport.write(b"Hello UDP")
+        self.transport.write(self._hello)
 
-    def udp_client_loop(self) -> None:
+        self.queue.q_in.waker = self._wake
+        self.udp_client_loop()
+        self.heartbeat_call.start(HEARTBEAT_INTERVAL, now=False)
 
-        for element in self.queue.q_in:
+    def _wake(self) -> None:
 
-            if element.data_type == NetworkQueue.Telemetry:
-                self.transport.write(PacketType.Telemetry.to_bytes()
-                                     + element.data)
+        reactor.callLater(0, self.udp_client_loop)
+
+    def udp_client_loop(self) -> None:
 
-            elif element.data_type == NetworkQueue.TelemetryRT:
-                self.transport.write(PacketType.TelemetryRT.to_bytes()
-                                     + element.data)
+        for element in self.queue.q_in.drain():
 
-            elif element.data_type == NetworkQueue.Close:
+            data_type = element.data_type
+            if data_type == NetworkQueue.Close:
                 self.close()
+                return
+
+            if self.standby and not self._claim(data_type):
+                continue
+
+            encoder = self._encoders.get(data_type)
+            if encoder is not None:
+                packet = encoder.encode(element.data)
+
+            elif data_type in FULL_UDP:
+                packet = FULL_UDP[data_type] + element.data
+
+            else:
+                continue
+
+            header = self._senders[data_type].header()
+            self.transport.write(packet[:1] + header + packet[1:])
+
+    def _claim(self, data_type: NetworkQueue) -> bool:
+        """
+        While standing by, only a Telemetry keyframe every STANDBY_INTERVAL
+        is sent
+        """
+
+        if data_type != NetworkQueue.Telemetry:
+            return False
 
-        self.queue.q_in.clear()
+        now = reactor.seconds()
+        if now - self._last_claim < STANDBY_INTERVAL:
+            return False
 
-        if time.time() - self.udp_imnotdead_timer > 10:
-            self.transport.write(b"I'm not a dead client")
-            self.udp_imnotdead_timer = time.time()
+        self._last_claim = now
+        self._encoders[data_type].reset()
+        return True
+
+    def _on_telemetry_source(self, data: bytes) -> None:
+
+        if len(data) < 2:
+            return
+
+        standby = not data[1]
+        if standby == self.standby:
+            return
+
+        self.standby = standby
+        if standby:
+            client_log.info("Another client is the telemetry source,"
+                            " standing by")
+
+        else:
+            client_log.info("Telemetry source of the room")
+            # The receivers never got the keyframes of these streams
+            for encoder in self._encoders.values():
+                encoder.reset()
+
+    def _on_udp_renew(self, data: bytes) -> None:
+
+        # The server doesn't know the room of this address (restarted,
+        # evicted it or new NAT mapping), its telemetry was dropped
+        client_log.info("Server lost the room of the client, joining again")
+        self.transport.write(self._hello)
+        for encoder in self._encoders.values():
+            encoder.reset()
+
+    def heartbeat(self) -> None:
+
+        # Also tell the room again, a restarted or evicting server doesn't
+        # know it
+        self.transport.write(self._hello)
+        self.transport.write(self.server_heartbeat.ping())
 
     def datagramReceived(self, datagram: bytes, addr) -> None:
 
+        self.server_heartbeat.seen()
+
         if datagram == b"I'm not a dead server":
             return
 
         self._decode_packet(datagram)
 
-    def _decode_packet(self, data: bytes) -> None:
+    def _on_ping(self, data: bytes) -> None:
 
-        packet = PacketType.from_bytes(data)
+        pong = self.server_heartbeat.on_ping(data)
+        if pong is not None:
+            self.transport.write(pong)
 
-        if packet == PacketType.Telemetry:
-            self.queue.q_out.append(NetData(NetworkQueue.Telemetry,
-                                    data[1:]))
+    def _decode_packet(self, data: bytes) -> None:
 
-        elif packet == PacketType.TelemetryRT:
-            self.queue.q_out.append(NetData(NetworkQueue.TelemetryRT,
-                                    data[1:]))
+        self._dispatcher.dispatch(data)
 
     # Possibly invoked if there is no server listening
     def connectionRefused(self):
@@ -272,6 +763,9 @@ class UDPClient(DatagramProtocol):
     def close(self):
 
         if self.transport is not None:
-            client_log.info("Close UDP client")
+            client_log.info(f"Close UDP client ({self.server_heartbeat})")
+            self.queue.q_in.waker = None
             self.transport.loseConnection()
-            self.loop_call.stop()
+
+        if self.heartbeat_call.running:
+            self.heartbeat_call.stop()
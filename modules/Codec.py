@@ -0,0 +1,31 @@
+"""
+Precompiled struct.Struct for every message sent on the wire.
+
+Each message is packed or unpacked with a single call, unpack_from take an
+offset so messages can be read in place from a received frame.
+"""
+from __future__ import annotations
+
+import struct
+
+# Fixed part of a Telemetry, after the driver name lenght (B) and name
+TELEMETRY = struct.Struct("!i 11f 3i 2? B i 12f ? f B 2B 5f B 4f 2i ? 3f 2i")
+TELEMETRY_RT = struct.Struct("!3f i f")
+# Batch of TelemetryRT: base timestamp in ms and number of samples, then each
+# sample is its offset in ms from the base and a TelemetryRT
+TELEMETRY_RT_BATCH = struct.Struct("!IB")
+TELEMETRY_RT_SAMPLE = struct.Struct("!H 3f i f")
+CAR_INFO = struct.Struct("!6f i")
+PIT_STOP = struct.Struct("! 8s f i 3s 4f 2i 2?")
+TYRE_SET = struct.Struct("!3f 4f")
+TYRES_SET = struct.Struct("!" + " ".join(["3f 4f"] * 4))
+# After the type byte of the telemetry datagrams: sender id, sequence number
+# and sender timestamp in ms
+UDP_HEADER = struct.Struct("!HHI")
+# Server report of the telemetry datagrams received from a client: received
+# and lost (cumulative), sender timestamp of the last one and ms it was held
+LINK_REPORT = struct.Struct("!IIIH")
+# Heartbeat ping: sender timestamp in ms, its pong echoes it followed by the
+# timestamp of the peer answering
+PING = struct.Struct("!I")
+PONG = struct.Struct("!II")
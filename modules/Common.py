@@ -4,9 +4,13 @@ import logging
 import struct
 import sys
 import os
-from dataclasses import astuple, dataclass
+from collections import deque
+from dataclasses import dataclass
 from enum import Enum, auto
-from typing import ClassVar, List, Tuple, Union
+from typing import (Callable, ClassVar, Deque, Iterator, List, Optional,
+                    Tuple, Union)
+
+from modules.Codec import CAR_INFO, PIT_STOP
 
 log = logging.getLogger(__name__)
 
@@ -133,6 +137,8 @@ class Credidentials:
     udp_port: int
     username: str
     driverID: int
+    # Team token, users of the same room share their data
+    room: str = ""
 
 
 class PacketType(Enum):
@@ -152,6 +158,16 @@ class PacketType(Enum):
     UDP_RENEW = 13
     StategyHistory = 14
     TyreSets = 15
+    TelemetryDelta = 16
+    TelemetryRTDelta = 17
+    TelemetryRTBatch = 18
+    LinkReport = 19
+    Ping = 20
+    Pong = 21
+    Compressed = 22
+    TelemetrySource = 23
+    StrategyPage = 24
+    StrategyPageRequest = 25
     Unkown = -1
 
     def to_bytes(self) -> bytes:
@@ -188,17 +204,94 @@ class NetworkQueue(Enum):
     StrategySet = auto()
     Telemetry = auto()
     TelemetryRT = auto()
+    TelemetryRTBatch = auto()
     UpdateUsers = auto()
     ConnectionReply = auto()
     TyreSets = auto()
     Close = auto()
 
 
+class OverflowPolicy(Enum):
+
+    DropOldest = auto()
+    NeverDrop = auto()
+
+
+class Channel:
+    """
+    Bounded FIFO of NetData between a producer and a consumer.
+
+    When full, DropOldest discard the oldest message (telemetry, only the
+    latest matter) and NeverDrop keep every message past the bound and
+    count the overflow (strategy, nothing can be lost).
+
+    The consumer set a waker, called when a message is pushed in the empty
+    channel, to schedule a drain instead of polling the channel.
+    """
+
+    def __init__(self, maxlen: int,
+                 policy: OverflowPolicy = OverflowPolicy.NeverDrop) -> None:
+
+        self.maxlen = maxlen
+        self.policy = policy
+        self.waker: Optional[Callable[[], None]] = None
+        self._queue: Deque[NetData] = deque()
+
+        self.pushed = 0
+        self.dropped = 0
+        self.overflows = 0
+
+    def push(self, element: NetData) -> None:
+
+        if len(self._queue) >= self.maxlen:
+
+            if self.policy == OverflowPolicy.DropOldest:
+                self._queue.popleft()
+                self.dropped += 1
+
+            else:
+                if self.overflows == 0:
+                    log.warning(f"Channel over {self.maxlen} messages")
+                self.overflows += 1
+
+        self._queue.append(element)
+        self.pushed += 1
+
+        if len(self._queue) == 1 and self.waker is not None:
+            self.waker()
+
+    def pop(self) -> NetData:
+
+        return self._queue.popleft()
+
+    def drain(self) -> Iterator[NetData]:
+        """
+        Pop messages until the channel is empty
+        """
+
+        queue = self._queue
+        while queue:
+            yield queue.popleft()
+
+    def clear(self) -> None:
+
+        self._queue.clear()
+
+    @property
+    def depth(self) -> int:
+
+        return len(self._queue)
+
+    def __len__(self) -> int:
+
+        return len(self._queue)
+
+
 @dataclass
 class DataQueue:
 
-    q_in: List[NetData]
-    q_out: List[NetData]
+    q_in: Channel
+    q_out: Channel
 
 
 @dataclass
@@ -219,17 +312,23 @@ class CarInfo:
     max_fuel: float
     tyre_set: int
 
-    byte_format: ClassVar[str] = "!6f i"
-    byte_size: ClassVar[int] = struct.calcsize(byte_format)
+    byte_format: ClassVar[str] = CAR_INFO.format
+    byte_size: ClassVar[int] = CAR_INFO.size
 
     def to_bytes(self) -> bytes:
 
-        return struct.pack(self.byte_format, *astuple(self))
+        return CAR_INFO.pack(self.front_left_pressure,
+                             self.front_right_pressure,
+                             self.rear_left_pressure,
+                             self.rear_right_pressure,
+                             self.fuel_to_add,
+                             self.max_fuel,
+                             self.tyre_set)
 
     @classmethod
     def from_bytes(cls, data: bytes) -> CarInfo:
 
-        return CarInfo(*struct.unpack(cls.byte_format, data[:cls.byte_size]))
+        return CarInfo(*CAR_INFO.unpack_from(data))
 
 
 @dataclass
@@ -245,27 +344,25 @@ class PitStop:
     repairs_bodywork: bool = True
     repairs_suspension: bool = True
 
-    byte_format: ClassVar[str] = "! 8s f i 3s 4f 2i 2?"
-    byte_size: ClassVar[int] = struct.calcsize(byte_format)
+    byte_format: ClassVar[str] = PIT_STOP.format
+    byte_size: ClassVar[int] = PIT_STOP.size
 
     def to_bytes(self) -> bytes:
-        buffer = []
-        buffer.append(struct.pack("!8s", self.timestamp.encode("utf-8")))
-        buffer.append(struct.pack("!f", self.fuel))
-        buffer.append(struct.pack("!i", self.tyre_set))
-        buffer.append(struct.pack("!3s", self.tyre_compound.encode("utf-8")))
-        buffer.append(struct.pack("!4f", *self.tyre_pressures))
-        buffer.append(struct.pack("!i", self.driver_offset))
-        buffer.append(struct.pack("!i", self.brake_pad))
-        buffer.append(struct.pack("!?", self.repairs_bodywork))
-        buffer.append(struct.pack("!?", self.repairs_suspension))
-
-        return b"".join(buffer)
+
+        return PIT_STOP.pack(self.timestamp.encode("utf-8"),
+                             self.fuel,
+                             self.tyre_set,
+                             self.tyre_compound.encode("utf-8"),
+                             *self.tyre_pressures,
+                             self.driver_offset,
+                             self.brake_pad,
+                             self.repairs_bodywork,
+                             self.repairs_suspension)
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> PitStop:
+    def from_bytes(cls, data: bytes, offset: int = 0) -> PitStop:
 
-        temp_data = struct.unpack(cls.byte_format, data[:cls.byte_size])
+        temp_data = PIT_STOP.unpack_from(data, offset)
 
         pit_data = [
             temp_data[0].decode("utf-8"),
@@ -0,0 +1,113 @@
+"""
+Compression of the TCP packets, negotiated at Connect.
+
+A client able to decompress sets its COMPRESSION_FLAGS in a byte after the
+room of its Connect, the server answers with the flags it accepted after
+the message of its ConnectionReply. Both sides may then send any packet as
+a Compressed packet: the zlib stream of the whole packet, type included,
+with the preset dictionary ZDICT. Every packet is compressed on its own,
+without the history of the previous ones, so the server compresses a
+broadcast once for all the members of a room. Packets under
+COMPRESSION_THRESHOLD, or not getting smaller, are sent as they are.
+"""
+from __future__ import annotations
+
+import zlib
+from typing import Optional
+
+from modules.Common import PacketType
+
+# Flags of the Connect and ConnectionReply
+COMPRESSION_ZLIB = 0x01
+# What this version understands
+COMPRESSION_FLAGS = COMPRESSION_ZLIB
+# Smaller packets are sent as they are (CarInfo, pings, ...)
+COMPRESSION_THRESHOLD = 40
+COMPRESSION_LEVEL = 6
+# Frames are "!H" long, a bigger packet can only be corrupted
+MAX_DECOMPRESSED = 0xFFFF
+COMPRESSED = PacketType.Compressed.to_bytes()
+
+# Preset dictionary of COMPRESSION_ZLIB, sample packets of a race (see
+# benchmarks.compression). Never change it, a new dictionary needs a new
+# flag: the zlib stream only names its dictionary (adler32) and a peer with
+# another one can't decompress.
+ZDICT = (
+    b'\x08\x0eMax Verstappen'
+    b'\x00\x00\x00bB\xb5\xe8\xb8@5\xd5JA%\xb4\xec'
+    b"A\xc4\xcf\xd1A\xbd'\xbfA\xd8n\xfaA\xb5\xd6\xa9"
+    b'A\xf7\xa0$A\xf9U\x88A\xfe\x87\xa1A\xf8\x133'
+    b'\x00\x00\x90M\x00\x01qs\x00\x01\xc0N\x00\x00\x02\x00'
+    b'\x06\x11\xb5A\xde\xd7BA\xd6\x03\x1cA\xe5\xd5{A'
+    b'\xe7\x96<B\xb8\xd1@B\xc0,\\B\x90\xcf\xd2B'
+    b'\xb2b\xf4D"Z\xd3D\x07\x7f|C\xda\t"C'
+    b'zY\xc1\x00L\x0f\x19@\x02\x01\x01\x00\x00\x00\x00\x00'
+    b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+    b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+    b'\x00\x00\x00\x02\x00\x00hL\x01A\xeb\xfe&A\xfff'
+    b'\xe7A\ns\x18\x00\x10\xab\xe7\x00\x00\x00\x04\x0e\x081'
+    b'2:34:56B\xc14\xe9\x00\x00\x00$D'
+    b'ryA\xdc\x00\x00A\xdb33A\xd8\xcc\xcdA\xd9'
+    b'\x99\x9a\x00\x00\x00\x00\x00\x00\x00\x01\x01\x0112:3'
+    b'4:56B\xdb\xd6\xb3\x00\x00\x00\x06DryA'
+    b'\xdc\x00\x00A\xdb33A\xd8\xcc\xcdA\xd9\x99\x9a\x00'
+    b'\x00\x00\x00\x00\x00\x00\x01\x01\x0112:34:5'
+    b'6B\xac\xba\xa8\x00\x00\x00\x1aDryA\xdc\x00\x00'
+    b'A\xdb33A\xd8\xcc\xcdA\xd9\x99\x9a\x00\x00\x00\x00'
+    b'\x00\x00\x00\x01\x01\x0112:34:56B\xaa'
+    b'u\xf8\x00\x00\x00+DryA\xdc\x00\x00A\xdb3'
+    b'3A\xd8\xcc\xcdA\xd9\x99\x9a\x00\x00\x00\x00\x00\x00\x00'
+    b'\x01\x01\x0112:34:56B\x96\x10U\x00'
+    b'\x00\x00(DryA\xdc\x00\x00A\xdb33A\xd8'
+    b'\xcc\xcdA\xd9\x99\x9a\x00\x00\x00\x00\x00\x00\x00\x01\x01\x01'
+    b'12:34:56Bl\xea\xd9\x00\x00\x00\x16'
+    b'DryA\xdc\x00\x00A\xdb33A\xd8\xcc\xcdA'
+    b'\xd9\x99\x9a\x00\x00\x00\x00\x00\x00\x00\x01\x01\x0112:'
+    b"34:56A\xea'\x89\x00\x00\x00\x15Dry"
+    b'A\xdc\x00\x00A\xdb33A\xd8\xcc\xcdA\xd9\x99\x9a'
+    b'\x00\x00\x00\x00\x00\x00\x00\x01\x01\x0112:34:'
+    b'56B\xa8\xdf\xcc\x00\x00\x00\x05DryA\xdc\x00'
+    b'\x00A\xdb33A\xd8\xcc\xcdA\xd9\x99\x9a\x00\x00\x00'
+    b'\x00\x00\x00\x00\x01\x01\x01'
+)
+
+
+def compress(data: bytes) -> Optional[bytes]:
+    """
+    Compressed packet of data, None when it isn't worth it
+    """
+
+    if len(data) < COMPRESSION_THRESHOLD:
+        return None
+
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED,
+                                  zlib.MAX_WBITS, zdict=ZDICT)
+    packet = COMPRESSED + compressor.compress(data) + compressor.flush()
+    if len(packet) >= len(data):
+        return None
+
+    return packet
+
+
+def decompress(packet: bytes) -> bytes:
+    """
+    Packet inside a Compressed packet, raise zlib.error when invalid
+    """
+
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS, zdict=ZDICT)
+    data = decompressor.decompress(packet[1:], MAX_DECOMPRESSED)
+    if not decompressor.eof or decompressor.unconsumed_tail:
+        raise zlib.error("Truncated or too big compressed packet")
+
+    return data
+
+
+def read_flags(data: bytes, offset: int) -> int:
+    """
+    Optional flags byte at offset, 0 for an older peer
+    """
+
+    if len(data) <= offset:
+        return 0
+
+    return data[offset]
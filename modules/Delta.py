@@ -0,0 +1,220 @@
+"""
+Keyframe + delta encoding of the telemetry streams.
+
+A keyframe is the full packet, unchanged on the wire so older receivers
+still understand it. Between keyframes a delta carries the crc32 of the last
+keyframe and of the one before, a bitmask of the fields different from
+either keyframe and the bytes of these fields only: it is rebuilt from
+whichever of them the receiver has.
+
+Deltas are relative to the keyframes, not to the previous delta, a dropped
+delta only lose itself. A dropped keyframe doesn't lose the deltas after it,
+the previous keyframe still rebuilds them, unless it was dropped too.
+Keyframes are sent every keyframe_interval packets or whenever a delta
+wouldn't be smaller than the full packet.
+"""
+from __future__ import annotations
+
+import re
+import struct
+import zlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from modules.Common import PacketType
+
+# crc32 of the last keyframe and of the one before (the same without one)
+DELTA_HEADER = struct.Struct("!II")
+# Keyframes kept by a decoder, two per sender of the room is enough
+KEYFRAMES_KEPT = 8
+
+
+def field_layout(layout: struct.Struct) -> List[Tuple[int, int]]:
+    """
+    Offset and size of every field of a "!" struct, a "Ns" string is one
+    field
+    """
+
+    fields = []
+    offset = 0
+    for count, code in re.findall(r"(\d*)([a-zA-Z?])", layout.format[1:]):
+
+        count = int(count) if count else 1
+        if code in "sp":
+            fields.append((offset, count))
+            offset += count
+            continue
+
+        size = struct.calcsize("!" + code)
+        for _ in range(count):
+            fields.append((offset, size))
+            offset += size
+
+    return fields
+
+
+class DeltaEncoder:
+    """
+    Encode the payloads of a stream as keyframes or deltas.
+
+    Payloads are the fixed layout, optionally after a variable prefix (the
+    driver name of a Telemetry) which must stay the same between keyframes.
+    """
+
+    def __init__(self, layout: struct.Struct, key_packet: PacketType,
+                 delta_packet: PacketType, keyframe_interval: int) -> None:
+
+        self.layout = layout
+        self.fields = field_layout(layout)
+        self.mask_size = (len(self.fields) + 7) // 8
+        self.key_header = key_packet.to_bytes()
+        self.delta_header = delta_packet.to_bytes()
+        self.keyframe_interval = keyframe_interval
+
+        self._key: Optional[bytes] = None
+        self._key_crc = 0
+        self._since_key = 0
+        # Keyframe before the last one, if deltas can use it
+        self._previous: Optional[bytes] = None
+        self._previous_crc = 0
+
+        self.keyframes = 0
+        self.deltas = 0
+
+    def encode(self, payload: bytes) -> bytes:
+        """
+        Packet, with its type byte, to send for payload
+        """
+
+        key = self._key
+        if (key is None or self._since_key >= self.keyframe_interval
+                or len(payload) != len(key)):
+            return self._keyframe(payload)
+
+        base = len(payload) - self.layout.size
+        if payload[:base] != key[:base]:
+            return self._keyframe(payload)
+
+        previous = self._previous
+        mask = 0
+        changed = []
+        for bit, (offset, size) in enumerate(self.fields):
+
+            start = base + offset
+            field = payload[start:start+size]
+            if (field != key[start:start+size] or previous is not None
+                    and field != previous[start:start+size]):
+                mask |= 1 << bit
+                changed.append(field)
+
+        delta = b"".join((self.delta_header,
+                          DELTA_HEADER.pack(self._key_crc,
+                                            self._previous_crc),
+                          mask.to_bytes(self.mask_size, "big"),
+                          *changed))
+
+        if len(delta) >= len(self.key_header) + len(payload):
+            return self._keyframe(payload)
+
+        self._since_key += 1
+        self.deltas += 1
+
+        return delta
+
+    def reset(self) -> None:
+        """
+        Start again with a keyframe
+        """
+
+        self._key = None
+        self._previous = None
+
+    def _keyframe(self, payload: bytes) -> bytes:
+
+        key = self._key
+        base = len(payload) - self.layout.size
+        if (key is not None and len(key) == len(payload)
+                and key[:base] == payload[:base]):
+            self._previous = key
+            self._previous_crc = self._key_crc
+
+        else:
+            self._previous = None
+
+        self._key = bytes(payload)
+        self._key_crc = zlib.crc32(self._key)
+        if self._previous is None:
+            self._previous_crc = self._key_crc
+        self._since_key = 0
+        self.keyframes += 1
+
+        return self.key_header + payload
+
+
+class DeltaDecoder:
+    """
+    Rebuild the full payloads of a stream from its keyframes and deltas
+    """
+
+    def __init__(self, layout: struct.Struct) -> None:
+
+        self.layout = layout
+        self.fields = field_layout(layout)
+        self.mask_size = (len(self.fields) + 7) // 8
+        self._keys: OrderedDict[int, bytes] = OrderedDict()
+
+        # Deltas whose keyframe was lost or invalid
+        self.missing = 0
+
+    def keyframe(self, payload: bytes) -> bytes:
+
+        payload = bytes(payload)
+        crc = zlib.crc32(payload)
+
+        self._keys[crc] = payload
+        self._keys.move_to_end(crc)
+        if len(self._keys) > KEYFRAMES_KEPT:
+            self._keys.popitem(last=False)
+
+        return payload
+
+    def decode(self, delta: bytes) -> Optional[bytes]:
+        """
+        Full payload of delta (without its type byte), None if both its
+        keyframes are unknown
+        """
+
+        index = DELTA_HEADER.size + self.mask_size
+        if len(delta) < index:
+            self.missing += 1
+            return None
+
+        crc, previous_crc = DELTA_HEADER.unpack_from(delta)
+        key = self._keys.get(crc)
+        if key is None:
+            key = self._keys.get(previous_crc)
+        mask = int.from_bytes(delta[DELTA_HEADER.size:index], "big")
+        if key is None or mask >> len(self.fields):
+            self.missing += 1
+            return None
+
+        payload = bytearray(key)
+        base = len(key) - self.layout.size
+        bit = 0
+        while mask:
+
+            if mask & 1:
+                offset, size = self.fields[bit]
+                start = base + offset
+                payload[start:start+size] = delta[index:index+size]
+                index += size
+
+            mask >>= 1
+            bit += 1
+
+        if index != len(delta) or len(payload) != len(key):
+            # Truncated or not matching the layout
+            self.missing += 1
+            return None
+
+        return bytes(payload)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import logging
+from enum import Enum
+from typing import Callable, List, Optional, Union
+
+log = logging.getLogger(__name__)
+
+Handler = Callable[[bytes], None]
+
+
+class PacketDispatcher:
+    """
+    Handler table of an endpoint indexed by the packet type byte.
+
+    Each endpoint register the handlers of the packets it understands,
+    dispatching a packet is then a single list lookup instead of building
+    a PacketType and walking an if/elif chain.
+    """
+
+    def __init__(self, name: str,
+                 default: Optional[Handler] = None) -> None:
+
+        self.name = name
+        self._default = default or self._unknown
+        self._handlers: List[Handler] = [self._default] * 256
+
+    def register(self, packet: Union[Enum, int], handler: Handler) -> None:
+
+        if isinstance(packet, Enum):
+            packet = packet.value
+
+        self._handlers[packet] = handler
+
+    def unregister(self, packet: Union[Enum, int]) -> None:
+
+        if isinstance(packet, Enum):
+            packet = packet.value
+
+        self._handlers[packet] = self._default
+
+    def dispatch(self, data: bytes) -> None:
+        """
+        Call the handler of the first byte of data with the whole packet
+        """
+
+        if len(data) == 0:
+            log.warning(f"{self.name}: empty packet")
+            return
+
+        self._handlers[data[0]](data)
+
+    def dispatch_type(self, packet: int, data: bytes) -> None:
+        """
+        Call the handler of packet with data, for already split messages
+        """
+
+        self._handlers[packet](data)
+
+    def _unknown(self, data: bytes) -> None:
+
+        log.warning(f"{self.name}: incorrect packet type {data[0]}")
@@ -1,20 +1,25 @@
 
 from __future__ import annotations
 
+import bisect
 import logging
 import time
 import tkinter
 from tkinter import ttk
+from typing import Optional
 
 import matplotlib
 import matplotlib.animation as animation
 from matplotlib import pyplot, style
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-from modules.Telemetry import TelemetryRT
+from modules.Telemetry import TelemetryRT, TelemetryRTBatch
 
 matplotlib.use("TkAgg")
 
+# Seconds of inputs shown by the graph
+GRAPH_WINDOW = 10
+
 style.use("dark_background")
 
 log = logging.getLogger(__name__)
@@ -87,30 +92,49 @@ class InputGraph(ttk.Frame):
         self.gas_line.set_data(self.time_20s, self.gas_20s)
         self.brake_line.set_data(self.time_20s, self.brake_20s)
 
-    def update_values(self, throttle: float, brake: float) -> None:
+    def update_values(self, throttle: float, brake: float,
+                      timestamp: Optional[float] = None) -> None:
+
+        self._update_window(self.add_values(throttle, brake, timestamp))
+
+    def add_values(self, throttle: float, brake: float,
+                   timestamp: Optional[float] = None) -> float:
+        """
+        Add a sample without updating the graph, timestamp is the time of
+        the sample on the sender clock in seconds, None for now
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        if self.start_lap_time != 0:
+            time_from_start = timestamp - self.start_lap_time
+
+            # Another sender or its clock jumped
+            if (time_from_start < self.time_axis[-1]
+                    or time_from_start - self.time_axis[-1] > GRAPH_WINDOW):
+                self.reset()
 
-        time_from_start = time.time() - self.start_lap_time
+        if self.start_lap_time == 0:
+            self.start_lap_time = timestamp
+            time_from_start = 0
 
         self.gas_data.append(throttle * 100)
         self.brake_data.append(brake * 100)
+        self.time_axis.append(time_from_start)
 
-        if self.start_lap_time != 0:
-            self.time_axis.append(time_from_start)
-
-        else:
-            self.time_axis.append(0)
-            self.start_lap_time = time.time()
-
-        self.gas_20s.clear()
-        self.brake_20s.clear()
-        self.time_20s.clear()
-        for throttle, brake, time_s in zip(self.gas_data,
-                                           self.brake_data,
-                                           self.time_axis):
-            if time_from_start - time_s < 10:
-                self.gas_20s.append(throttle)
-                self.brake_20s.append(brake)
-                self.time_20s.append(time_from_start - time_s)
+        return time_from_start
+
+    def _update_window(self, time_from_start: float) -> None:
+
+        # time_axis is sorted, the window is its tail
+        start = bisect.bisect_right(self.time_axis,
+                                    time_from_start - GRAPH_WINDOW)
+
+        self.gas_20s[:] = self.gas_data[start:]
+        self.brake_20s[:] = self.brake_data[start:]
+        self.time_20s[:] = [time_from_start - time_s
+                            for time_s in self.time_axis[start:]]
 
     def reset(self) -> None:
 
@@ -183,7 +207,8 @@ class DriverInputs(ttk.Frame):
         speed_var = ttk.Label(self, textvariable=self.speed, width=5)
         speed_var.grid(row=5, column=1)
 
-    def update_values(self, data: TelemetryRT) -> None:
+    def update_values(self, data: TelemetryRT,
+                      timestamp: Optional[float] = None) -> None:
 
         self.gas.set(data.gas)
         self.brake.set(data.brake)
@@ -199,7 +224,17 @@ class DriverInputs(ttk.Frame):
         self.c_steering.coords(self.steering_rect,
                                0, 0, (self.steering.get() + 1) * 50, 20)
 
-        self.input_graph.update_values(data.gas, data.brake)
+        self.input_graph.update_values(data.gas, data.brake, timestamp)
+
+    def update_batch(self, batch: TelemetryRTBatch) -> None:
+
+        # The bars show the last sample, the graph all of them
+        *samples, (timestamp, last) = batch.samples
+        for sample_time, sample in samples:
+            self.input_graph.add_values(sample.gas, sample.brake,
+                                        sample_time / 1000)
+
+        self.update_values(last, timestamp / 1000)
 
     def update_lap(self, lap: int) -> None:
 
@@ -0,0 +1,252 @@
+"""
+Election of the telemetry source of a room.
+
+Every app with ACC open streams its telemetry, a teammate spectating or
+waiting for a driver swap duplicates the one of the driver. The server
+relays the telemetry of a single client of the room, its source, and tells
+the others with a TelemetrySource packet to stand by: they only send a
+Telemetry keyframe every STANDBY_INTERVAL, a claim with the driver name and
+pit state their ACC shows.
+
+The source stays elected while it streams. It is replaced
+- when silent for SOURCE_MISSES times the interval it sends at (between
+  MIN_SOURCE_TIMEOUT and MAX_SOURCE_TIMEOUT), by the client with the
+  latest claim, whose claim is relayed at once. The silent source (or a
+  client of the same driver, after a new NAT mapping) takes it back with
+  its next telemetry within RECLAIM_WINDOW: a spectating teammate only
+  stands in for a stalled driver, and replacing a source only late costs
+  little.
+- during a driver swap, its car in the pit box, by a claim from another
+  driver. The driver it replaced can't take it back by a swap for
+  SWAP_HOLD, a teammate in the box would make them flip at every claim.
+"""
+from __future__ import annotations
+
+import struct
+from typing import Dict, Optional, Tuple
+
+from modules.Codec import UDP_HEADER
+from modules.Common import PacketType
+
+Address = Tuple[str, int]
+
+# Datagrams of the source lost or late in a row before replacing it
+SOURCE_MISSES = 3
+# Period (s) of the check of the silent sources
+ELECTION_INTERVAL = 0.1
+# Bounds (s) of the time without telemetry before replacing the source.
+# The check runs up to ELECTION_INTERVAL later and the claim of the new
+# source is relayed at once: a team goes at most 0.8s without telemetry,
+# well under the 2s telemetry timeout of the app.
+MIN_SOURCE_TIMEOUT = 0.3
+MAX_SOURCE_TIMEOUT = 0.7
+# Weight of a faster gap between two datagrams of the source in its send
+# interval, a slower one is followed at once: the datagrams of the other
+# streams come in between
+INTERVAL_SMOOTHING = 1 / 8
+# Seconds the source replaced for being silent can take it back
+RECLAIM_WINDOW = 30
+# Seconds between two claims of a client standing by
+STANDBY_INTERVAL = 1
+# Seconds a claim stays valid, a few lost ones are fine
+CLAIM_TIMEOUT = 2.5 * STANDBY_INTERVAL
+# Seconds the driver replaced by a swap can't take the source back by one
+SWAP_HOLD = 60
+
+TELEMETRY = PacketType.Telemetry.value
+# Driver name lenght of a Telemetry keyframe datagram, after its type and
+# UDP_HEADER
+DRIVER_OFFSET = 1 + UDP_HEADER.size
+# is_in_pit in the fixed part of a Telemetry (lap, 11 floats, 3 times)
+IN_PIT_OFFSET = struct.calcsize("!i 11f 3i")
+
+
+def read_driver(datagram: bytes) -> Optional[Tuple[str, bool]]:
+    """
+    Driver name and is_in_pit of a Telemetry keyframe datagram
+    """
+
+    if len(datagram) <= DRIVER_OFFSET:
+        return None
+
+    lenght = datagram[DRIVER_OFFSET]
+    in_pit = DRIVER_OFFSET + 1 + lenght + IN_PIT_OFFSET
+    if len(datagram) <= in_pit:
+        return None
+
+    name = bytes(datagram[DRIVER_OFFSET+1:DRIVER_OFFSET+1+lenght])
+    return name.decode("utf-8", "replace"), bool(datagram[in_pit])
+
+
+class SourceElection:
+    """
+    Telemetry source of one room
+    """
+
+    def __init__(self) -> None:
+
+        self.source: Optional[Address] = None
+        # Last telemetry of the source
+        self.source_seen = 0.0
+        # Interval the source sends at, None until its second datagram
+        self.interval: Optional[float] = None
+        # Driver name and in pit of the last keyframe of every client
+        self.drivers: Dict[Address, Tuple[str, bool]] = {}
+        # Last claim of every client standing by, and its datagram (a
+        # Telemetry keyframe) relayed when it becomes the source
+        self.claims: Dict[Address, float] = {}
+        self.keyframes: Dict[Address, bytes] = {}
+        # Driver replaced by the last swap and when
+        self.replaced: Optional[Tuple[str, float]] = None
+        # Source replaced for being silent, its driver name and when
+        self.silent: Optional[Tuple[Address, Optional[str], float]] = None
+
+    def receive(self, addr: Address, datagram: bytes, now: float) -> bool:
+        """
+        Telemetry datagram from addr, True if it is to be relayed
+        """
+
+        if datagram[0] == TELEMETRY:
+            driver = read_driver(datagram)
+            if driver is not None:
+                self.drivers[addr] = driver
+
+        if self.source is None:
+            self.elect(addr, now)
+            return True
+
+        if addr == self.source:
+            gap = now - self.source_seen
+            interval = self.interval
+            if interval is None or gap >= interval:
+                self.interval = gap
+
+            else:
+                self.interval = interval + (gap - interval) * \
+                    INTERVAL_SMOOTHING
+
+            self.source_seen = now
+            return True
+
+        self.claims[addr] = now
+        if datagram[0] == TELEMETRY:
+            self.keyframes[addr] = bytes(datagram)
+
+        if self._reclaiming(addr, now):
+            self.silent = None
+            self.elect(addr, now)
+            return True
+
+        if self._swapping(addr, now):
+            self.replaced = (self.drivers[self.source][0], now)
+            # The new driver is the one to stand in for now
+            self.silent = None
+            self.elect(addr, now)
+            return True
+
+        return False
+
+    def _reclaiming(self, addr: Address, now: float) -> bool:
+
+        if self.silent is None:
+            return False
+
+        silent, driver, since = self.silent
+        if now - since >= RECLAIM_WINDOW:
+            self.silent = None
+            return False
+
+        claim = self.drivers.get(addr)
+        if claim is not None and claim[1]:
+            # In the pit box, it may be swapping out
+            return False
+
+        if addr == silent:
+            return True
+
+        return driver is not None and claim is not None and claim[0] == driver
+
+    def _swapping(self, addr: Address, now: float) -> bool:
+
+        source = self.drivers.get(self.source)
+        claim = self.drivers.get(addr)
+        if source is None or claim is None:
+            return False
+
+        name, in_pit = source
+        if not in_pit or claim[0] == name:
+            return False
+
+        if self.replaced is not None:
+            replaced, since = self.replaced
+            if claim[0] == replaced and now - since < SWAP_HOLD:
+                return False
+
+        return True
+
+    @property
+    def timeout(self) -> float:
+        """
+        Seconds without telemetry before replacing the source
+        """
+
+        if self.interval is None:
+            return MAX_SOURCE_TIMEOUT
+
+        return min(max(SOURCE_MISSES * self.interval, MIN_SOURCE_TIMEOUT),
+                   MAX_SOURCE_TIMEOUT)
+
+    def elect(self, addr: Optional[Address], now: float) -> None:
+
+        self.source = addr
+        self.source_seen = now
+        self.interval = None
+        if addr is not None:
+            self.claims.pop(addr, None)
+            self.keyframes.pop(addr, None)
+
+        if self.silent is not None and addr == self.silent[0]:
+            self.silent = None
+
+    def check(self, now: float) -> Optional[bytes]:
+        """
+        Replace a silent source by the latest claim, or by nobody until the
+        next telemetry. The claim datagram of the new source is returned,
+        to relay right away.
+        """
+
+        if self.source is None and not self.claims:
+            return None
+
+        if (self.source is not None
+                and now - self.source_seen < self.timeout):
+            return None
+
+        for addr, claimed in list(self.claims.items()):
+            if now - claimed >= CLAIM_TIMEOUT:
+                del self.claims[addr]
+                self.keyframes.pop(addr, None)
+
+        latest = max(self.claims, key=self.claims.get, default=None)
+        if latest is None and self.source is None:
+            return None
+
+        if self.source is not None and self.silent is None:
+            driver = self.drivers.get(self.source)
+            self.silent = (self.source,
+                           None if driver is None else driver[0], now)
+
+        keyframe = self.keyframes.get(latest)
+        self.elect(latest, now)
+        return keyframe
+
+    def forget(self, addr: Address) -> None:
+        """
+        addr left the room
+        """
+
+        self.drivers.pop(addr, None)
+        self.claims.pop(addr, None)
+        self.keyframes.pop(addr, None)
+        if addr == self.source:
+            self.source = None
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import struct
+from typing import List
+
+FRAME_HEADER = struct.Struct("!H")
+
+
+def frame(data: bytes) -> bytes:
+    """
+    Prefix data with its "!H" lenght
+    """
+
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for the "!H" lenght prefixed TCP stream.
+
+    TCP doesn't keep message boundaries, a chunk can hold several frames,
+    half of one or even just one byte of a header. The partial frame at the
+    end of a chunk is kept in a bytearray and completed by the next chunks.
+
+    Frames are memoryviews on the received data (no copy), a consumer who
+    wants to keep one after the callback must copy it with bytes().
+    """
+
+    def __init__(self) -> None:
+
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[memoryview]:
+        """
+        Add a received chunk and return every frame completed by it
+        """
+
+        if self._buffer:
+            # Hand the old buffer to the frames and start a new one for
+            # the remainder, views on a bytearray forbid resizing it.
+            self._buffer += data
+            data = self._buffer
+            self._buffer = bytearray()
+
+        view = memoryview(data)
+        frames = []
+        end = len(data)
+        offset = 0
+        while end - offset >= 2:
+
+            packet_size = FRAME_HEADER.unpack_from(data, offset)[0]
+            if end - offset - 2 < packet_size:
+                break
+
+            offset += 2
+            frames.append(view[offset:offset+packet_size])
+            offset += packet_size
+
+        if offset != end:
+            self._buffer += view[offset:]
+
+        return frames
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of bytes waiting for the rest of their frame
+        """
+
+        return len(self._buffer)
+
+    def take(self) -> bytes:
+        """
+        Remove and return the bytes waiting for the rest of their frame,
+        to hand the stream over to another decoder
+        """
+
+        data = bytes(self._buffer)
+        self._buffer = bytearray()
+
+        return data
+
+    def reset(self) -> None:
+
+        self._buffer = bytearray()
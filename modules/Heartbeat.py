@@ -0,0 +1,127 @@
+"""
+Ping / pong heartbeat of the TCP and UDP links.
+
+Every HEARTBEAT_INTERVAL a side pings its peer with its timestamp (ms), the
+Pong echoes it with the timestamp of the peer. The pinging side gets the
+RTT and the offset between both clocks from it.
+
+A peer is pinged back and dropped when silent only once it sent a Ping or
+a Pong (Heartbeat.capable), older apps don't understand them.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from twisted.internet import reactor
+from twisted.internet.interfaces import IReactorTime
+
+from modules.Codec import PING, PONG
+from modules.Common import PacketType
+from modules.Sequence import TIMESTAMP_MODULO, timestamp_ms
+
+HEARTBEAT_INTERVAL = 5
+# Heartbeats a peer can miss before being dropped, old clients only say
+# they are alive every 10s
+HEARTBEAT_MISSED = 3
+# Longer RTT are a clock jump or a corrupted pong
+RTT_MAX = 10
+
+
+def signed_ms(value: int) -> int:
+    """
+    Difference of two timestamps wrapping at TIMESTAMP_MODULO
+    """
+
+    value %= TIMESTAMP_MODULO
+    if value >= TIMESTAMP_MODULO // 2:
+        value -= TIMESTAMP_MODULO
+
+    return value
+
+
+class Heartbeat:
+    """
+    Liveness, RTT and clock offset of one peer
+    """
+
+    def __init__(self, clock: IReactorTime = reactor) -> None:
+
+        self.clock = clock
+        self.last_seen = clock.seconds()
+        # Peer understands Ping and Pong
+        self.capable = False
+
+        # Smoothed RTT (s) and peer clock minus local clock (s)
+        self.rtt: Optional[float] = None
+        self.offset: Optional[float] = None
+
+    def seen(self) -> None:
+        """
+        Something was received from the peer
+        """
+
+        self.last_seen = self.clock.seconds()
+
+    @property
+    def missed(self) -> int:
+
+        silence = self.clock.seconds() - self.last_seen
+        return int(silence // HEARTBEAT_INTERVAL)
+
+    @property
+    def alive(self) -> bool:
+
+        return self.missed < HEARTBEAT_MISSED
+
+    def ping(self) -> bytes:
+
+        return PacketType.Ping.to_bytes() + PING.pack(timestamp_ms())
+
+    def on_ping(self, data: bytes) -> Optional[bytes]:
+        """
+        Pong answering the Ping data, None if it is invalid
+        """
+
+        if len(data) < 1 + PING.size:
+            return None
+
+        self.capable = True
+        timestamp = PING.unpack_from(data, 1)[0]
+
+        return PacketType.Pong.to_bytes() + PONG.pack(timestamp,
+                                                      timestamp_ms())
+
+    def on_pong(self, data: bytes) -> None:
+
+        if len(data) < 1 + PONG.size:
+            return
+
+        self.capable = True
+        sent, answered = PONG.unpack_from(data, 1)
+
+        rtt = signed_ms(timestamp_ms() - sent)
+        if not 0 <= rtt < RTT_MAX * 1000:
+            return
+
+        # The peer answered half way through the round trip
+        offset = signed_ms(answered - sent - rtt // 2) / 1000
+        rtt /= 1000
+
+        if self.rtt is None:
+            self.rtt = rtt
+            self.offset = offset
+            return
+
+        # Pongs delayed by a queue give a worse offset, keep the fast ones
+        if rtt <= self.rtt:
+            self.offset += (offset - self.offset) / 4
+
+        self.rtt += (rtt - self.rtt) / 8
+
+    def __str__(self) -> str:
+
+        if self.rtt is None:
+            return "no RTT yet"
+
+        return (f"RTT {self.rtt * 1000:.0f}ms,"
+                f" clock offset {self.offset * 1000:+.0f}ms")
@@ -0,0 +1,445 @@
+"""
+Durable strategy history and user roster of the rooms of a server.
+
+Every strategy set and every user joining or leaving a room is appended to
+a log (a FILE_HEADER then records, each a RECORD header and a payload).
+The records of the last COMMIT_INTERVAL are flushed to disk together, in a
+thread: a slow disk never stalls the reactor. A server restarted mid race
+reads the log back: the rooms get their strategy history again and the
+users connected before keep their name and driver ID for RESUME_GRACE.
+Joins and leaves make the log grow, it is rewritten with only the state
+(compacted) in the thread once it holds COMPACT_RATIO times more records
+than the state does. A record cut by a crash is dropped when reading the
+log.
+
+The strategy history sent to the clients with LONG_HISTORY (flag of the
+Connect, next to the compression ones) has a "!H" count, the other ones
+get the newest 255 in the old "!B" one.
+
+Clients with PAGED_HISTORY ask for it instead, by pages:
+
+- StrategyPageRequest (HISTORY_REQUEST): the epoch of the room they know
+  and the ID of the last strategy of it they have, 0 for none
+- StrategyPage (HISTORY_PAGE): the epoch of the room, the ID of the first
+  strategy of the page, the ID of the last strategy of the room and the
+  strategies. A client asks for the next one until it has the last.
+
+The ID of a strategy is its position in the room (from 1), a Strategy sent
+to them has it after the PitStop. The epoch of a room is drawn when the
+room is created and kept in the log: a client knowing an other epoch (other
+server, or restarted without log) gets the history from the start.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import random
+import struct
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from twisted.internet import reactor, task
+from twisted.internet.interfaces import IReactorTime
+
+from modules.Common import PitStop
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"PYACCHST"
+VERSION = 1
+FILE_HEADER = struct.Struct("!8sB")
+# Kind, payload lenght and crc32 of the payload
+RECORD = struct.Struct("!BHI")
+
+# Record kinds, the payload is the "!B" lenght prefixed room name then
+# a PitStop or the "!B" lenght prefixed user name and its driver ID
+RECORD_STRATEGY = 1
+RECORD_JOIN = 2
+RECORD_LEAVE = 3
+# The "!I" epoch of the room
+RECORD_EPOCH = 4
+
+# Connect flag, the client reads a "!H" StategyHistory count
+LONG_HISTORY = 0x02
+# Connect flag, the client asks for the strategy history by pages
+PAGED_HISTORY = 0x04
+# What this version understands
+HISTORY_FLAGS = LONG_HISTORY | PAGED_HISTORY
+# Epoch and ID of the last strategy known
+HISTORY_REQUEST = struct.Struct("!II")
+# Epoch, ID of the first strategy, ID of the last one of the room and count
+HISTORY_PAGE = struct.Struct("!IIIH")
+# Strategies per StrategyPage
+PAGE_SIZE = 64
+# ID of a strategy after the PitStop of a Strategy
+STRATEGY_ID = struct.Struct("!I")
+# StategyHistory the client gives the app: the app clears its history
+# first, count, then the STRATEGY_ID and PitStop of each
+HISTORY_UPDATE = struct.Struct("!?H")
+# Strategies in a StategyHistory frame ("!H" long, type and count)
+MAX_HISTORY = (0xFFFF - 3) // PitStop.byte_size
+MAX_SHORT_HISTORY = 0xFF
+# Seconds the users of a room before a restart keep their name and ID
+RESUME_GRACE = 120
+# Records of the log per record of the state before compacting it
+COMPACT_RATIO = 4
+# Smaller logs are never compacted
+COMPACT_MIN_RECORDS = 256
+# Period (s) of the flush to disk of the new records, what a crash can lose
+COMMIT_INTERVAL = 0.2
+
+
+def history_payload(strategies: List[PitStop], long_history: bool) -> bytes:
+    """
+    StategyHistory payload of the newest strategies fitting in it
+    """
+
+    if long_history:
+        strategies = strategies[-MAX_HISTORY:]
+        count = struct.pack("!H", len(strategies))
+
+    else:
+        strategies = strategies[-MAX_SHORT_HISTORY:]
+        count = struct.pack("!B", len(strategies))
+
+    return count + b"".join(strategy.to_bytes() for strategy in strategies)
+
+
+def new_epoch() -> int:
+
+    return random.randrange(1, 1 << 32)
+
+
+def history_page(strategies: List[PitStop], epoch: int,
+                 after: int) -> bytes:
+    """
+    StrategyPage payload of the strategies after the ID after
+    """
+
+    page = strategies[after:after+PAGE_SIZE]
+    return (HISTORY_PAGE.pack(epoch, after + 1, len(strategies), len(page))
+            + b"".join(strategy.to_bytes() for strategy in page))
+
+
+class HistoryCursor:
+    """
+    What a client has of the strategy history of its room, kept by the app
+    between its connections
+    """
+
+    def __init__(self) -> None:
+
+        # 0 until synced with a server asking for pages
+        self.epoch = 0
+        self.last = 0
+
+
+def _string(value: str) -> bytes:
+
+    data = value.encode("utf-8")[:255]
+    return struct.pack("!B", len(data)) + data
+
+
+def _read_string(data: bytes, offset: int) -> Tuple[str, int]:
+
+    lenght = data[offset]
+    end = offset + 1 + lenght
+    return data[offset+1:end].decode("utf-8"), end
+
+
+class RoomState:
+    """
+    What the log keeps of a room
+    """
+
+    def __init__(self) -> None:
+
+        self.strategies: List[PitStop] = []
+        # 0 until the first strategy
+        self.epoch = 0
+        # Connected users, name to driver ID
+        self.roster: Dict[str, int] = {}
+
+
+class HistoryLog:
+    """
+    Append the history of the rooms to path, after reading what it holds
+    """
+
+    def __init__(self, path: str, clock: IReactorTime = reactor) -> None:
+
+        self.path = path
+        self.rooms: Dict[str, RoomState] = {}
+        self.records = 0
+        # Records written since the last flush to disk
+        self.dirty = False
+        # fsync or compaction running in the thread, one at a time
+        self.executor = ThreadPoolExecutor(1, "history")
+        self.job: Optional[Future] = None
+        # Records appended while compacting, for the compacted log, and
+        # the record count of the compacted state
+        self.pending: Optional[List[bytes]] = None
+        self.compacted = 0
+
+        start = time.perf_counter()
+        end = self._read()
+        strategies = sum(len(room.strategies) for room in self.rooms.values())
+        log.info(f"Read {self.records} records of {path} in"
+                 f" {(time.perf_counter() - start) * 1000:.1f}ms:"
+                 f" {len(self.rooms)} rooms, {strategies} strategies")
+
+        self.file: Optional[BinaryIO] = None
+        if end is None:
+            self._rewrite()
+
+        else:
+            self.file = open(path, "r+b")
+            # Drop a record cut by a crash
+            self.file.truncate(end)
+            self.file.seek(end)
+            if self._compaction_due():
+                self._rewrite()
+
+        # Polls the thread too, its callbacks would be engine specific
+        self.commit_call = task.LoopingCall(self.commit)
+        self.commit_call.clock = clock
+        self.commit_call.start(COMMIT_INTERVAL, now=False)
+
+    @property
+    def state_records(self) -> int:
+
+        return sum(len(room.strategies) + len(room.roster) + 1
+                   for room in self.rooms.values())
+
+    def _read(self) -> Optional[int]:
+        """
+        Apply the records of the log, offset after the last valid one or
+        None without a valid log
+        """
+
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+
+        except FileNotFoundError:
+            return None
+
+        if (len(data) < FILE_HEADER.size or
+                FILE_HEADER.unpack_from(data) != (MAGIC, VERSION)):
+            if data:
+                raise ValueError(f"{self.path} isn't a strategy history")
+
+            return None
+
+        offset = FILE_HEADER.size
+        while offset + RECORD.size <= len(data):
+
+            kind, lenght, crc = RECORD.unpack_from(data, offset)
+            start = offset + RECORD.size
+            payload = data[start:start+lenght]
+            if len(payload) < lenght or zlib.crc32(payload) != crc:
+                log.warning(f"{self.path} ends with a cut record")
+                break
+
+            self._apply(kind, payload)
+            self.records += 1
+            offset = start + lenght
+
+        return offset
+
+    def _apply(self, kind: int, payload: bytes) -> None:
+
+        name, offset = _read_string(payload, 0)
+        room = self.rooms.get(name)
+        if room is None:
+            room = RoomState()
+            self.rooms[name] = room
+
+        if kind == RECORD_STRATEGY:
+            room.strategies.append(PitStop.from_bytes(payload, offset))
+            return
+
+        if kind == RECORD_EPOCH:
+            room.epoch = struct.unpack_from("!I", payload, offset)[0]
+            return
+
+        user, offset = _read_string(payload, offset)
+        if kind == RECORD_JOIN:
+            room.roster[user] = payload[offset]
+
+        elif kind == RECORD_LEAVE:
+            room.roster.pop(user, None)
+
+    @staticmethod
+    def _record(kind: int, payload: bytes) -> bytes:
+
+        return (RECORD.pack(kind, len(payload), zlib.crc32(payload)) +
+                payload)
+
+    def _append(self, kind: int, payload: bytes) -> None:
+
+        if self.file is None:
+            return
+
+        self._apply(kind, payload)
+        record = self._record(kind, payload)
+        # Also in the log being replaced, a crash while compacting
+        # leaves it complete
+        self.file.write(record)
+        if self.pending is not None:
+            self.pending.append(record)
+
+        self.records += 1
+        self.dirty = True
+
+    def strategy(self, room: str, epoch: int, strategy: PitStop) -> None:
+
+        state = self.rooms.get(room)
+        if state is None or state.epoch != epoch:
+            self._append(RECORD_EPOCH,
+                         _string(room) + struct.pack("!I", epoch))
+
+        self._append(RECORD_STRATEGY, _string(room) + strategy.to_bytes())
+
+    def join(self, room: str, user: str, driver_id: int) -> None:
+
+        self._append(RECORD_JOIN,
+                     _string(room) + _string(user) + bytes((driver_id,)))
+
+    def leave(self, room: str, user: str, driver_id: int) -> None:
+
+        self._append(RECORD_LEAVE,
+                     _string(room) + _string(user) + bytes((driver_id,)))
+
+    def _compaction_due(self) -> bool:
+
+        return (self.records >= COMPACT_MIN_RECORDS and
+                self.records >= COMPACT_RATIO * self.state_records)
+
+    def commit(self) -> None:
+        """
+        Finish the work of the thread, then give it the next one: a
+        compaction or the flush to disk of the new records
+        """
+
+        if self.file is None:
+            return
+
+        if self.job is not None:
+            if not self.job.done():
+                return
+
+            self._job_done()
+
+        if self._compaction_due():
+            snapshot, self.compacted = self._snapshot()
+            log.info(f"Compacting {self.path} from {self.records} to"
+                     f" {self.compacted} records")
+            self.pending = []
+            self.job = self.executor.submit(self._write, snapshot)
+
+        if not self.dirty:
+            return
+
+        # The thread can't share the buffer of the file with the reactor
+        self.file.flush()
+        self.dirty = False
+        if self.job is None:
+            self.job = self.executor.submit(os.fsync, self.file.fileno())
+
+    def _job_done(self) -> None:
+
+        job, self.job = self.job, None
+        error = job.exception()
+        if error is not None:
+            log.warning(f"Can't write {self.path}: {error}")
+
+        pending, self.pending = self.pending, None
+        if pending is None:
+            return
+
+        if error is not None:
+            # The log keeps growing, try again on the next commit
+            return
+
+        # The new records follow the compacted state
+        os.replace(f"{self.path}.tmp", self.path)
+        self.file.close()
+        self.file = open(self.path, "r+b")
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(b"".join(pending))
+        self.records = self.compacted + len(pending)
+        self.dirty = self.dirty or bool(pending)
+
+    def _snapshot(self) -> Tuple[bytes, int]:
+        """
+        Log of the state and its record count
+        """
+
+        buffer = [FILE_HEADER.pack(MAGIC, VERSION)]
+        records = 0
+        for name, room in self.rooms.items():
+
+            prefix = _string(name)
+            if room.epoch:
+                buffer.append(self._record(
+                    RECORD_EPOCH, prefix + struct.pack("!I", room.epoch)))
+
+            for strategy in room.strategies:
+                buffer.append(self._record(RECORD_STRATEGY,
+                                           prefix + strategy.to_bytes()))
+
+            for user, driver_id in room.roster.items():
+                buffer.append(self._record(
+                    RECORD_JOIN,
+                    prefix + _string(user) + bytes((driver_id,))))
+
+            records += (len(room.strategies) + len(room.roster) +
+                        bool(room.epoch))
+
+        return b"".join(buffer), records
+
+    def _write(self, snapshot: bytes) -> None:
+        """
+        Write the compacted log next to the log, run in the thread
+        """
+
+        with open(f"{self.path}.tmp", "wb") as file:
+            file.write(snapshot)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _rewrite(self) -> None:
+        """
+        Write the state in a new log and put it in place of the old one,
+        when starting
+        """
+
+        if self.file is not None:
+            self.file.close()
+
+        snapshot, self.records = self._snapshot()
+        self._write(snapshot)
+        os.replace(f"{self.path}.tmp", self.path)
+
+        self.file = open(self.path, "r+b")
+        self.file.seek(0, os.SEEK_END)
+
+    def close(self) -> None:
+        """
+        Stop writing, the users disconnected by the shutdown stay in the
+        roster
+        """
+
+        if self.file is None:
+            return
+
+        self.commit_call.stop()
+        # A compaction not done yet is dropped, the log is complete
+        self.executor.shutdown(wait=True)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
@@ -0,0 +1,494 @@
+"""
+Metrics of the server in the Prometheus text format.
+
+The server counts what it receives and sends as it goes, the gauges
+(clients, connections, outbound buffers and queues, lag, RTT) are read
+from the servers when scraped. serve_metrics exposes them over HTTP on the
+loopback only.
+
+Every client has its Traffic, lists of counters indexed by the packet type
+byte: counting a packet on the relay path is two list increments.
+"""
+from __future__ import annotations
+
+import bisect
+import logging
+from typing import (TYPE_CHECKING, Callable, Dict, Iterable, List, Optional,
+                    Sequence, Tuple)
+
+from twisted.internet import reactor, task
+from twisted.internet.interfaces import (IListeningPort, IReactorTime,
+                                         ITCPTransport)
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from modules.Common import PacketType
+
+if TYPE_CHECKING:
+    from modules.Server import TCP_Factory, UDP_Server
+
+log = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+# Fan-out duration buckets (s), from a few clients to a full room on a busy
+# server
+FANOUT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3,
+                  5e-3, 1e-2)
+# Reactor lag buckets (s)
+LAG_BUCKETS = (1e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1)
+# Period of the reactor lag probe (s)
+LAG_PROBE_INTERVAL = 0.25
+
+
+def packet_name(packet: int) -> str:
+
+    try:
+        return PacketType(packet).name
+
+    except ValueError:
+        return str(packet)
+
+
+# Label of every packet type byte, looked up when counting
+PACKET_NAMES = [packet_name(packet) for packet in range(256)]
+
+
+def peer_name(addr: Tuple[str, int]) -> str:
+
+    return f"{addr[0]}:{addr[1]}"
+
+
+def outbound_bytes(transport: ITCPTransport) -> int:
+    """
+    Bytes written on transport not yet sent to the kernel
+    """
+
+    # asyncio transports
+    if hasattr(transport, "get_write_buffer_size"):
+        return transport.get_write_buffer_size()
+
+    # Not part of the interface, the buffer of twisted FileDescriptor
+    data = getattr(transport, "dataBuffer", b"")
+    offset = getattr(transport, "offset", 0)
+    pending = getattr(transport, "_tempDataLen", 0)
+
+    return len(data) - offset + pending
+
+
+def _escape(value: str) -> str:
+
+    return (value.replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _labels(names: Sequence[str], values: Iterable[str]) -> str:
+
+    pairs = [f'{name}="{_escape(value)}"'
+             for name, value in zip(names, values)]
+    if not pairs:
+        return ""
+
+    return "{" + ",".join(pairs) + "}"
+
+
+class Traffic:
+    """
+    Packets and bytes received, sent and forwarded (to another worker) of
+    one client, by packet type
+    """
+
+    __slots__ = ("transport", "client", "in_packets", "in_bytes",
+                 "out_packets", "out_bytes", "forward_packets",
+                 "forward_bytes")
+
+    def __init__(self, transport: str, client: str) -> None:
+
+        self.transport = transport
+        self.client = client
+        self.in_packets = [0] * 256
+        self.in_bytes = [0] * 256
+        self.out_packets = [0] * 256
+        self.out_bytes = [0] * 256
+        self.forward_packets = [0] * 256
+        self.forward_bytes = [0] * 256
+
+    def received(self, packet: int, size: int) -> None:
+
+        self.in_packets[packet] += 1
+        self.in_bytes[packet] += size
+
+    def sent(self, packet: int, size: int) -> None:
+
+        self.out_packets[packet] += 1
+        self.out_bytes[packet] += size
+
+    def forwarded(self, packet: int, size: int) -> None:
+
+        self.forward_packets[packet] += 1
+        self.forward_bytes[packet] += size
+
+
+class TrafficCounter:
+    """
+    Counter of every Traffic, unit is "packets" or "bytes"
+    """
+
+    kind = "counter"
+    labels = ("direction", "transport", "packet", "client")
+
+    def __init__(self, name: str, description: str, unit: str,
+                 traffic: Dict[int, Traffic]) -> None:
+
+        self.name = name
+        self.description = description
+        self.unit = unit
+        self.traffic = traffic
+
+    def render(self) -> List[str]:
+
+        lines = []
+        for traffic in self.traffic.values():
+            for direction in ("in", "out", "forward"):
+
+                counts = getattr(traffic, f"{direction}_{self.unit}")
+                for packet, count in enumerate(counts):
+                    if count:
+                        labels = _labels(self.labels, (
+                            direction, traffic.transport,
+                            PACKET_NAMES[packet], traffic.client))
+                        lines.append(f"{self.name}{labels} {count}")
+
+        return lines
+
+
+class Gauge:
+    """
+    Values read from collect when scraped
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str,
+                 collect: Callable[[], Dict[LabelValues, float]],
+                 labels: Sequence[str] = ()) -> None:
+
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+
+        return [f"{self.name}{_labels(self.labels, key)} {value}"
+                for key, value in self.collect().items()]
+
+
+class Counter(Gauge):
+    """
+    Totals read from collect when scraped, they only go up
+    """
+
+    kind = "counter"
+
+
+class HistogramSeries:
+    """
+    Observations of a Histogram for one set of label values
+    """
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+
+        self.buckets = buckets
+        # Count of each bucket, not cumulative, the last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram:
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str,
+                 buckets: Sequence[float],
+                 labels: Sequence[str] = ()) -> None:
+
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[LabelValues, HistogramSeries] = {}
+
+    def labelled(self, *labels: str) -> HistogramSeries:
+
+        series = self.series.get(labels)
+        if series is None:
+            series = HistogramSeries(self.buckets)
+            self.series[labels] = series
+
+        return series
+
+    def render(self) -> List[str]:
+
+        lines = []
+        names = self.labels + ("le",)
+        for key, series in self.series.items():
+
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series.counts):
+                total += count
+                lines.append(f"{self.name}_bucket"
+                             f"{_labels(names, (*key, str(bound)))} {total}")
+
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)}"
+                         f" {series.sum}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)}"
+                         f" {total}")
+
+        return lines
+
+
+class ServerMetrics:
+    """
+    Every metric of a server process
+    """
+
+    def __init__(self) -> None:
+
+        # Traffic of the connected clients by id()
+        self.traffic: Dict[int, Traffic] = {}
+        self.packets = TrafficCounter("pyacc_packets_total",
+                                      "Packets received, sent or forwarded"
+                                      " to another worker", "packets",
+                                      self.traffic)
+        self.bytes = TrafficCounter("pyacc_bytes_total",
+                                    "Bytes received, sent or forwarded to"
+                                    " another worker", "bytes",
+                                    self.traffic)
+        self.fanout = Histogram("pyacc_fanout_seconds",
+                                "Time to relay a packet to its room",
+                                FANOUT_BUCKETS, ("transport",))
+        self.tcp_fanout = self.fanout.labelled("tcp")
+        self.udp_fanout = self.fanout.labelled("udp")
+        self.reactor_lag = Histogram("pyacc_reactor_lag_seconds",
+                                     "Delay of the reactor running a timer",
+                                     LAG_BUCKETS)
+
+        self.tcp_factory: Optional[TCP_Factory] = None
+        self.udp_server: Optional[UDP_Server] = None
+
+        self.metrics = [
+            self.packets, self.bytes, self.fanout, self.reactor_lag,
+            Gauge("pyacc_tcp_connections", "Open TCP connections",
+                  self._tcp_connections),
+            Gauge("pyacc_tcp_users", "TCP connections in a room",
+                  self._tcp_users, ("client", "user", "room")),
+            Gauge("pyacc_tcp_outbound_buffer_bytes",
+                  "Bytes waiting to be sent to a TCP client",
+                  self._outbound_buffers, ("client",)),
+            Gauge("pyacc_tcp_outbound_queued_bytes",
+                  "Bytes held back while a TCP client is behind",
+                  self._outbound_queued, ("client",)),
+            Counter("pyacc_tcp_superseded_frames_total",
+                    "Frames to a TCP client replaced by a newer one before"
+                    " being sent", self._superseded, ("client",)),
+            Gauge("pyacc_tcp_client_lag_seconds",
+                  "How long a TCP client has been behind, 0 when it keeps"
+                  " up", self._client_lag, ("client",)),
+            Gauge("pyacc_udp_clients",
+                  "UDP clients relayed by this process, or forwarded to"
+                  " another worker", self._udp_clients, ("state",)),
+            Gauge("pyacc_rooms", "Rooms with a TCP or UDP client",
+                  self._rooms),
+            Gauge("pyacc_rtt_seconds", "Smoothed heartbeat RTT of a client",
+                  self._rtt, ("transport", "client")),
+        ]
+
+        self._lag_call = task.LoopingCall(self._probe_lag)
+        self._last_probe = 0.0
+
+    def watch(self, tcp_factory: Optional[TCP_Factory],
+              udp_server: Optional[UDP_Server]) -> None:
+        """
+        Servers whose state the gauges read, the ones of this process
+        """
+
+        self.tcp_factory = tcp_factory
+        self.udp_server = udp_server
+
+    def client(self, transport: str, client: str) -> Traffic:
+        """
+        Traffic of a new client, counted until forget
+        """
+
+        traffic = Traffic(transport, client)
+        self.traffic[id(traffic)] = traffic
+
+        return traffic
+
+    def forget(self, traffic: Traffic) -> None:
+        """
+        Drop the series of a client gone
+        """
+
+        self.traffic.pop(id(traffic), None)
+
+    def start(self, clock: IReactorTime = reactor) -> None:
+
+        self._lag_call.clock = clock
+        self._last_probe = clock.seconds()
+        self._lag_call.start(LAG_PROBE_INTERVAL, now=False)
+
+    def stop(self) -> None:
+
+        if self._lag_call.running:
+            self._lag_call.stop()
+
+    def render(self) -> bytes:
+
+        lines = []
+        for metric in self.metrics:
+
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for line in metric.render():
+                lines.append(line)
+
+        lines.append("")
+
+        return "\n".join(lines).encode("utf-8")
+
+    def _probe_lag(self) -> None:
+
+        now = self._lag_call.clock.seconds()
+        lag = now - self._last_probe - LAG_PROBE_INTERVAL
+        self._last_probe = now
+        self.reactor_lag.labelled().observe(max(0.0, lag))
+
+    def _tcp_connections(self) -> Dict[LabelValues, float]:
+
+        if self.tcp_factory is None:
+            return {}
+
+        return {(): len(self.tcp_factory.connections)}
+
+    def _tcp_users(self) -> Dict[LabelValues, float]:
+
+        if self.tcp_factory is None:
+            return {}
+
+        return {(connection.peer, connection.user[0], connection.room.name): 1
+                for connection in self.tcp_factory.connections
+                if connection.valid_user}
+
+    def _outbound_buffers(self) -> Dict[LabelValues, float]:
+
+        if self.tcp_factory is None:
+            return {}
+
+        return {(connection.peer,): outbound_bytes(connection.transport)
+                for connection in self.tcp_factory.connections
+                if connection.transport is not None}
+
+    def _outbound_queued(self) -> Dict[LabelValues, float]:
+
+        if self.tcp_factory is None:
+            return {}
+
+        return {(connection.peer,): connection.outbound.queued
+                for connection in self.tcp_factory.connections
+                if connection.outbound is not None}
+
+    def _superseded(self) -> Dict[LabelValues, float]:
+
+        if self.tcp_factory is None:
+            return {}
+
+        return {(connection.peer,): connection.outbound.superseded
+                for connection in self.tcp_factory.connections
+                if connection.outbound is not None}
+
+    def _client_lag(self) -> Dict[LabelValues, float]:
+
+        if self.tcp_factory is None:
+            return {}
+
+        return {(connection.peer,): connection.outbound.lag
+                for connection in self.tcp_factory.connections
+                if connection.outbound is not None}
+
+    def _udp_clients(self) -> Dict[LabelValues, float]:
+
+        if self.udp_server is None:
+            return {}
+
+        return {("relayed",): len(self.udp_server.clients),
+                ("forwarded",): len(self.udp_server.forward)}
+
+    def _rooms(self) -> Dict[LabelValues, float]:
+
+        if self.tcp_factory is None:
+            return {}
+
+        return {(): sum(1 for room in self.tcp_factory.rooms.values()
+                        if room.users or room.udp_clients)}
+
+    def _rtt(self) -> Dict[LabelValues, float]:
+
+        rtt = {}
+        if self.tcp_factory is not None:
+            for connection in self.tcp_factory.connections:
+                if connection.heartbeat.rtt is not None:
+                    rtt[("tcp", connection.peer)] = connection.heartbeat.rtt
+
+        if self.udp_server is not None:
+            for addr, heartbeat in self.udp_server.heartbeats.items():
+                if heartbeat.rtt is not None:
+                    rtt[("udp", peer_name(addr))] = heartbeat.rtt
+
+        return rtt
+
+
+class MetricsResource(Resource):
+
+    isLeaf = True
+
+    def __init__(self, metrics: ServerMetrics) -> None:
+
+        super().__init__()
+        self.metrics = metrics
+
+    def render_GET(self, request) -> bytes:
+
+        request.setHeader(b"Content-Type",
+                          b"text/plain; version=0.0.4; charset=utf-8")
+        return self.metrics.render()
+
+
+def serve_metrics(port: int,
+                  interface: str = "127.0.0.1") -> IListeningPort:
+    """
+    Serve the metrics of this process on http://interface:port/metrics
+    """
+
+    root = Resource()
+    root.putChild(b"metrics", MetricsResource(server_metrics))
+
+    site = Site(root)
+    site.noisy = False
+    listening = reactor.listenTCP(port, site, interface=interface)
+    server_metrics.start()
+    log.info(f"Metrics on http://{interface}:{port}/metrics")
+
+    return listening
+
+
+# Metrics of this process, like a logger every module uses the same one
+server_metrics = ServerMetrics()
@@ -0,0 +1,134 @@
+"""
+Outbound queue of a TCP connection of the server.
+
+The queue is the streaming producer of its transport: the transport pauses
+it when the socket buffer of the client is full (a client on a bad link)
+and resumes it once drained. While paused the frames wait in the queue,
+where a frame of a SUPERSEDED packet replaces the waiting one of the same
+type, only the last car info matters. Every other packet (strategy,
+users, history, ...) is always delivered, in order; a client with more
+than MAX_QUEUED bytes waiting is dropped, it will never catch up.
+"""
+from __future__ import annotations
+
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from twisted.internet import reactor
+from twisted.internet.interfaces import (IPushProducer, IReactorTime,
+                                         ITCPTransport)
+from zope.interface import implementer
+
+from modules.Common import PacketType
+
+log = logging.getLogger(__name__)
+
+# Packets a newer one of the same type makes useless
+SUPERSEDED = frozenset((PacketType.ServerData.value,
+                        PacketType.TyreSets.value))
+# Bytes waiting for a client before dropping it
+MAX_QUEUED = 1 << 20
+
+
+@implementer(IPushProducer)
+class OutboundQueue:
+
+    def __init__(self, transport: ITCPTransport,
+                 overflow: Callable[[], None],
+                 clock: IReactorTime = reactor) -> None:
+
+        self.transport = transport
+        self.overflow = overflow
+        self.clock = clock
+
+        self.paused = False
+        # Connection lost or dropped, nothing more to send
+        self.stopped = False
+        # [packet, frame] in sending order
+        self.frames: Deque[List] = deque()
+        # Entry of frames of each waiting SUPERSEDED packet
+        self.waiting: Dict[int, List] = {}
+        self.queued = 0
+        # Frames replaced by a newer one
+        self.superseded = 0
+        # Since when the client is behind
+        self.behind_since: Optional[float] = None
+
+        transport.registerProducer(self, True)
+
+    @property
+    def lag(self) -> float:
+        """
+        Seconds the client is behind, 0 when it keeps up
+        """
+
+        if self.behind_since is None:
+            return 0
+
+        return self.clock.seconds() - self.behind_since
+
+    def write(self, packet: int, message: bytes) -> None:
+        """
+        Send message (the frame of a packet type), or queue it while the
+        client is behind
+        """
+
+        if self.stopped:
+            return
+
+        if not self.paused and not self.frames:
+            self.transport.write(message)
+            return
+
+        if packet in SUPERSEDED:
+            entry = self.waiting.get(packet)
+            if entry is not None:
+                self.queued += len(message) - len(entry[1])
+                entry[1] = message
+                self.superseded += 1
+                return
+
+        entry = [packet, message]
+        self.frames.append(entry)
+        if packet in SUPERSEDED:
+            self.waiting[packet] = entry
+
+        self.queued += len(message)
+        if self.queued > MAX_QUEUED:
+            log.warning(f"{self.transport.getPeer()} is {self.lag:.1f}s"
+                        f" behind with {self.queued} bytes waiting,"
+                        " dropping it")
+            self.stopProducing()
+            self.overflow()
+
+    def pauseProducing(self) -> None:
+
+        self.paused = True
+        if self.behind_since is None:
+            self.behind_since = self.clock.seconds()
+
+    def resumeProducing(self) -> None:
+
+        self.paused = False
+
+        # Writing can fill the buffer and pause again
+        while self.frames and not self.paused:
+
+            entry = self.frames.popleft()
+            packet, message = entry
+            if self.waiting.get(packet) is entry:
+                del self.waiting[packet]
+
+            self.queued -= len(message)
+            self.transport.write(message)
+
+        if not self.frames and not self.paused:
+            self.behind_since = None
+
+    def stopProducing(self) -> None:
+
+        self.stopped = True
+        self.frames.clear()
+        self.waiting.clear()
+        self.queued = 0
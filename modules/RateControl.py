@@ -0,0 +1,182 @@
+"""
+Adaptive send rate of the telemetry streams.
+
+The server reports every LINK_REPORT_INTERVAL the telemetry datagrams it
+received from the client (modules.Sequence.LinkMonitor). Two reports give
+the loss in between, the timestamp echoed by a report gives the round trip
+time. The send intervals are backed off when the link drops datagrams or
+queues them (RTT above its lowest), and shortened again slowly while it is
+clean, always inside their bounds.
+
+Servers not sending reports leave the intervals at their initial value.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from twisted.internet import reactor
+from twisted.internet.interfaces import IReactorTime
+
+from modules.Codec import LINK_REPORT
+from modules.Common import NetworkQueue
+from modules.Sequence import (COUNTER_MODULO, LINK_REPORT_INTERVAL,
+                              TIMESTAMP_MODULO, timestamp_ms)
+
+log = logging.getLogger(__name__)
+
+# Loss over a report interval backing off the rates, and below which the
+# link is clean
+LOSS_BACKOFF = 0.05
+LOSS_CLEAN = 0.01
+# RTT above the lowest seen (s) meaning the datagrams queue on the path
+QUEUE_DELAY_BACKOFF = 0.1
+QUEUE_DELAY_CLEAN = 0.03
+# Interval factors, back off fast and come back slowly
+BACKOFF = 1.5
+PROBE = 0.9
+# Longer RTT are a clock jump or a corrupted report
+RTT_MAX = 10
+# Reports missed before backing off, the server may drop them all
+REPORT_TIMEOUT = 5 * LINK_REPORT_INTERVAL
+
+
+@dataclass
+class SendRate:
+    """
+    Send interval of a stream (s) and its bounds
+    """
+
+    interval: float
+    low: float
+    high: float
+
+    def scale(self, factor: float) -> bool:
+        """
+        Multiply the interval by factor inside the bounds, True if it
+        changed
+        """
+
+        interval = min(self.high, max(self.low, self.interval * factor))
+        changed = interval != self.interval
+        self.interval = interval
+
+        return changed
+
+
+class RateController:
+    """
+    Send intervals of the telemetry streams from the server link reports
+    """
+
+    def __init__(self, rates: Dict[NetworkQueue, SendRate],
+                 clock: IReactorTime = reactor) -> None:
+
+        self.rates = rates
+        self.clock = clock
+
+        # Smoothed and lowest RTT (s)
+        self.rtt: Optional[float] = None
+        self.min_rtt: Optional[float] = None
+        # Loss over the last report interval
+        self.loss = 0.0
+
+        self._counters: Optional[Tuple[int, int]] = None
+        self._last_report: Optional[float] = None
+
+    def interval(self, data_type: NetworkQueue) -> float:
+
+        return self.rates[data_type].interval
+
+    def on_report(self, data: bytes) -> None:
+        """
+        LinkReport datagram received, with its type byte
+        """
+
+        if len(data) < 1 + LINK_REPORT.size:
+            return
+
+        received, lost, timestamp, held = LINK_REPORT.unpack_from(data, 1)
+        self._last_report = self.clock.seconds()
+
+        rtt = ((timestamp_ms() - timestamp - held) % TIMESTAMP_MODULO) / 1000
+        if rtt < RTT_MAX:
+            self._update_rtt(rtt)
+
+        previous = self._counters
+        self._counters = (received, lost)
+        if previous is None:
+            return
+
+        received = (received - previous[0]) % COUNTER_MODULO
+        lost = (lost - previous[1]) % COUNTER_MODULO
+        if lost > COUNTER_MODULO // 2:
+            # Reordered datagrams counted as lost in the previous report
+            lost = 0
+
+        if received + lost == 0:
+            return
+
+        self.loss = lost / (received + lost)
+        queue_delay = 0 if self.rtt is None else self.rtt - self.min_rtt
+
+        if self.loss > LOSS_BACKOFF:
+            self._scale(BACKOFF, f"{self.loss * 100:.1f}% loss")
+
+        elif queue_delay > QUEUE_DELAY_BACKOFF:
+            self._scale(BACKOFF, f"{queue_delay * 1000:.0f}ms queue delay")
+
+        elif self.loss <= LOSS_CLEAN and queue_delay <= QUEUE_DELAY_CLEAN:
+            self._scale(PROBE)
+
+    def check(self) -> None:
+        """
+        Back off when the reports stopped, run every LINK_REPORT_INTERVAL
+        """
+
+        if self._last_report is None:
+            return
+
+        now = self.clock.seconds()
+        if now - self._last_report > REPORT_TIMEOUT:
+            self._last_report = now
+            self._scale(BACKOFF, "no link report")
+
+    def _update_rtt(self, rtt: float) -> None:
+
+        if self.rtt is None:
+            self.rtt = rtt
+            self.min_rtt = rtt
+            return
+
+        self.rtt += (rtt - self.rtt) / 8
+
+        if rtt < self.min_rtt:
+            self.min_rtt = rtt
+
+        else:
+            # Follow a route change making the path longer
+            self.min_rtt += (rtt - self.min_rtt) / 256
+
+    def _scale(self, factor: float, reason: str = "") -> None:
+
+        changed = False
+        for rate in self.rates.values():
+            changed |= rate.scale(factor)
+
+        if changed and factor > 1:
+            log.info(f"Backing off ({reason}): {self}")
+
+        elif changed:
+            log.debug(f"Speeding up: {self}")
+
+    def __str__(self) -> str:
+
+        parts = [f"{data_type.name} {1 / rate.interval:.1f}/s"
+                 for data_type, rate in self.rates.items()]
+        if self.rtt is not None:
+            parts.append(f"RTT {self.rtt * 1000:.0f}ms")
+            parts.append(f"loss {self.loss * 100:.1f}%")
+
+        return ", ".join(parts)
@@ -0,0 +1,294 @@
+"""
+Packet log of a server: every packet its clients send, with the time, room
+and sender, to replay a session (benchmarks.replay).
+
+The log is a FILE_HEADER then records, each a RECORD header and a payload.
+Rooms and senders are strings sent once in STRING records and then given
+by their id. Every INDEX_INTERVAL the recorder notes the time and offset of
+a record and flushes the file, close() appends these as the seek index with
+the string table and ends the file with a FOOTER. A log cut short (crash,
+kill) has no footer, PacketLog rebuilds its index with a scan.
+"""
+from __future__ import annotations
+
+import bisect
+import io
+import logging
+import os
+import struct
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"PYACCREC"
+VERSION = 1
+# Magic, version, monotonic clock (ns) and wall clock (s) at the start
+FILE_HEADER = struct.Struct("!8sBQd")
+# Kind, µs since the start, room id, sender id and payload lenght
+RECORD = struct.Struct("!BQHHH")
+# Index entry: µs since the start and file offset of a record
+INDEX_ENTRY = struct.Struct("!QQ")
+# Offset of the INDEX record, at the end of a closed log
+FOOTER = struct.Struct("!Q8s")
+
+# Record kinds
+RECORD_STRING = 0
+RECORD_TCP = 1
+RECORD_UDP = 2
+RECORD_INDEX = 3
+
+# Room id of a packet from a connection not in a room
+NO_ROOM = 0xFFFF
+MAX_STRINGS = 0xFFFF
+# Seconds between two index entries (and file flushes)
+INDEX_INTERVAL = 1
+
+
+def numbered_path(path: str, index: int) -> str:
+    """
+    Log path of worker index, "session.rec" -> "session.2.rec"
+    """
+
+    root, extension = os.path.splitext(path)
+    return f"{root}.{index}{extension}"
+
+
+class PacketRecorder:
+    """
+    Append the packets of a server to a log file
+    """
+
+    def __init__(self, path: str,
+                 clock_ns: Callable[[], int] = time.monotonic_ns) -> None:
+
+        self.path = path
+        self.clock_ns = clock_ns
+        self.file: Optional[BinaryIO] = open(path, "wb")
+        self.start = clock_ns()
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, self.start,
+                                         time.time()))
+
+        self.strings: Dict[str, int] = {}
+        self.index: List[Tuple[int, int]] = []
+        self._next_index = 0
+        self.records = 0
+
+        log.info(f"Recording the packets in {path}")
+
+    def _string(self, value: str, timestamp: int) -> int:
+
+        string = self.strings.get(value)
+        if string is not None:
+            return string
+
+        string = len(self.strings)
+        if string == MAX_STRINGS:
+            # Never happens in a race night, keep recording anyway
+            return NO_ROOM
+
+        self.strings[value] = string
+        data = value.encode("utf-8")
+        self.file.write(RECORD.pack(RECORD_STRING, timestamp, string, 0,
+                                    len(data)) + data)
+
+        return string
+
+    def record(self, kind: int, room: Optional[str], sender: str,
+               data: bytes) -> None:
+
+        if self.file is None:
+            return
+
+        timestamp = (self.clock_ns() - self.start) // 1000
+        if timestamp >= self._next_index:
+            self.index.append((timestamp, self.file.tell()))
+            self._next_index = timestamp + INDEX_INTERVAL * 1_000_000
+            self.file.flush()
+
+        room_id = NO_ROOM if room is None else self._string(room, timestamp)
+        sender_id = self._string(sender, timestamp)
+
+        self.file.write(RECORD.pack(kind, timestamp, room_id, sender_id,
+                                    len(data)))
+        self.file.write(data)
+        self.records += 1
+
+    def close(self) -> None:
+
+        if self.file is None:
+            return
+
+        offset = self.file.tell()
+        payload = [struct.pack("!I", len(self.index))]
+        payload.extend(INDEX_ENTRY.pack(*entry) for entry in self.index)
+        payload.append(struct.pack("!H", len(self.strings)))
+        for value in self.strings:
+            data = value.encode("utf-8")
+            payload.append(struct.pack("!H", len(data)) + data)
+
+        payload = b"".join(payload)
+        timestamp = (self.clock_ns() - self.start) // 1000
+        # The index can be bigger than a record payload, its lenght is
+        # only known from the footer
+        self.file.write(RECORD.pack(RECORD_INDEX, timestamp, 0, 0, 0))
+        self.file.write(payload)
+        self.file.write(FOOTER.pack(offset, MAGIC))
+        self.file.close()
+        self.file = None
+
+        log.info(f"Recorded {self.records} packets in {self.path}")
+
+
+@dataclass
+class Record:
+
+    # Monotonic clock (s) when the server received the packet
+    time: float
+    kind: int
+    room: Optional[str]
+    sender: str
+    data: bytes
+
+
+class PacketLog:
+    """
+    Read a log written by PacketRecorder
+    """
+
+    def __init__(self, path: str) -> None:
+
+        self.path = path
+        self.file = open(path, "rb")
+
+        magic, version, start, self.wall_start = FILE_HEADER.unpack(
+            self.file.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} isn't a packet log")
+
+        self.start = start / 1e9
+        self.strings: List[str] = []
+        self.index: List[Tuple[int, int]] = []
+        # Offset after the last record and its time in µs
+        self.end = FILE_HEADER.size
+        self.last = 0
+
+        if not self._read_footer():
+            log.info(f"{path} wasn't closed, scanning it")
+            self._scan()
+
+    def _read_footer(self) -> bool:
+
+        size = self.file.seek(0, io.SEEK_END)
+        if size < FILE_HEADER.size + RECORD.size + FOOTER.size:
+            return False
+
+        self.file.seek(size - FOOTER.size)
+        offset, magic = FOOTER.unpack(self.file.read(FOOTER.size))
+        if magic != MAGIC or offset > size - FOOTER.size:
+            return False
+
+        self.file.seek(offset)
+        kind, self.last, _, _, _ = RECORD.unpack(self.file.read(RECORD.size))
+        if kind != RECORD_INDEX:
+            return False
+
+        payload = self.file.read(size - FOOTER.size - offset - RECORD.size)
+
+        count, = struct.unpack_from("!I", payload)
+        position = 4
+        for _ in range(count):
+            self.index.append(INDEX_ENTRY.unpack_from(payload, position))
+            position += INDEX_ENTRY.size
+
+        count, = struct.unpack_from("!H", payload, position)
+        position += 2
+        for _ in range(count):
+            lenght, = struct.unpack_from("!H", payload, position)
+            position += 2
+            self.strings.append(
+                payload[position:position+lenght].decode("utf-8"))
+            position += lenght
+
+        self.end = offset
+        return True
+
+    def _scan(self) -> None:
+        """
+        Rebuild the index and the strings of a log without footer, a cut
+        last record is ignored
+        """
+
+        self.file.seek(FILE_HEADER.size)
+        next_index = 0
+        while True:
+
+            offset = self.file.tell()
+            header = self.file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+
+            kind, timestamp, room, _, lenght = RECORD.unpack(header)
+            data = self.file.read(lenght)
+            if len(data) < lenght or kind == RECORD_INDEX:
+                break
+
+            if kind == RECORD_STRING:
+                self.strings.append(data.decode("utf-8"))
+
+            elif timestamp >= next_index:
+                self.index.append((timestamp, offset))
+                next_index = timestamp + INDEX_INTERVAL * 1_000_000
+
+            self.end = self.file.tell()
+            self.last = timestamp
+
+    @property
+    def duration(self) -> float:
+
+        return self.last / 1e6
+
+    def records(self, start: float = 0,
+                end: Optional[float] = None) -> Iterator[Record]:
+        """
+        Packets received from start to end seconds after the start of the
+        log, start is found with the seek index
+        """
+
+        timestamps = [entry[0] for entry in self.index]
+        position = bisect.bisect_right(timestamps, start * 1e6) - 1
+        offset = self.index[position][1] if position >= 0 \
+            else FILE_HEADER.size
+
+        self.file.seek(offset)
+        strings = self.strings
+        while offset < self.end:
+
+            header = self.file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+
+            kind, timestamp, room, sender, lenght = RECORD.unpack(header)
+            data = self.file.read(lenght)
+            offset += RECORD.size + lenght
+            if len(data) < lenght:
+                return
+
+            if kind not in (RECORD_TCP, RECORD_UDP):
+                continue
+
+            seconds = timestamp / 1e6
+            if end is not None and seconds > end:
+                return
+
+            if seconds < start:
+                continue
+
+            yield Record(self.start + seconds, kind,
+                         None if room == NO_ROOM else strings[room],
+                         "" if sender == NO_ROOM else strings[sender], data)
+
+    def close(self) -> None:
+
+        self.file.close()
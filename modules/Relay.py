@@ -0,0 +1,271 @@
+"""
+Headless server with the UDP relay in its own process.
+
+The TCP server (connections, strategies, room state) and the UDP relay run
+on their own reactor, a burst of strategy history or user list sends no
+longer delays the telemetry. On Linux the relay is pinned to a core of its
+own and the TCP process to the others.
+
+The TCP process tells the relay about the rooms over a unix datagram
+socketpair:
+
+- ROOM_CLOSED name, the last TCP user left, the session is over and the
+  relay forgets the last telemetry of the room
+
+The relay keeps the last telemetry of its rooms, it sends it to a UDP
+client joining one: the TCP process has none to put in the room state.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import socket
+from typing import Optional, Set, Tuple
+
+from twisted.internet import reactor
+from twisted.internet.endpoints import TCP4ServerEndpoint
+from twisted.internet.interfaces import IListeningPort, IReadDescriptor
+from twisted.python.failure import Failure
+from zope.interface import implementer
+
+from modules.Metrics import serve_metrics, server_metrics
+from modules.Server import (Rooms, TCP_Factory, UDP_Server, start_history,
+                            start_recording)
+
+log = logging.getLogger(__name__)
+
+# Channel message kinds, followed by the room name
+ROOM_CLOSED = b"C"
+# Kind and a room name of at most 255 bytes
+CHANNEL_MESSAGE_SIZE = 512
+# Channel messages read per reactor iteration
+CHANNEL_BATCH = 64
+# Time given to the relay to stop by itself
+SHUTDOWN_DELAY = 2
+# Packet log number of each process
+TCP_LOG = 0
+RELAY_LOG = 1
+
+
+def relay_supported() -> bool:
+
+    return hasattr(socket, "AF_UNIX")
+
+
+def split_cores() -> Tuple[Set[int], Set[int]]:
+    """
+    Cores of the TCP process and of the relay: the last one available for
+    the relay, the others for the TCP process (the same one on a single
+    core)
+    """
+
+    if not hasattr(os, "sched_getaffinity"):
+        return set(), set()
+
+    cores = sorted(os.sched_getaffinity(0))
+    relay = {cores[-1]}
+
+    return set(cores[:-1]) or relay, relay
+
+
+def pin(cores: Set[int], name: str) -> None:
+
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        return
+
+    try:
+        os.sched_setaffinity(0, cores)
+
+    except OSError as msg:
+        log.warning(f"Can't pin the {name} to cores {sorted(cores)}: {msg}")
+        return
+
+    log.info(f"{name} pinned to cores {sorted(cores)}")
+
+
+class RelayLink:
+    """
+    TCP process end of the channel
+    """
+
+    def __init__(self, channel: socket.socket) -> None:
+
+        self.channel = channel
+
+    def room_closed(self, name: str) -> None:
+
+        self._send(ROOM_CLOSED, name)
+
+    def _send(self, kind: bytes, name: str) -> None:
+
+        try:
+            self.channel.send(kind + name.encode("utf-8"))
+
+        except OSError as msg:
+            # Full or relay gone, only the cache of a room is at stake
+            log.warning(f"Can't tell the relay about room {name!r}: {msg}")
+
+
+@implementer(IReadDescriptor)
+class RelayInbox:
+    """
+    Relay end of the channel
+    """
+
+    def __init__(self, channel: socket.socket,
+                 udp_server: UDP_Server) -> None:
+
+        self.channel = channel
+        self.udp_server = udp_server
+
+    def fileno(self) -> int:
+
+        return self.channel.fileno()
+
+    def logPrefix(self) -> str:
+
+        return "RelayInbox"
+
+    def doRead(self) -> None:
+
+        for _ in range(CHANNEL_BATCH):
+
+            try:
+                message = self.channel.recv(CHANNEL_MESSAGE_SIZE)
+
+            except BlockingIOError:
+                return
+
+            kind = message[:1]
+            name = message[1:].decode("utf-8")
+            if kind == ROOM_CLOSED:
+                log.info(f"Room {name!r} has no TCP user left")
+                room = self.udp_server.rooms.get(name)
+                if room is not None:
+                    room.last_values.clear()
+
+            else:
+                log.warning(f"Invalid channel message {message[:16]}")
+
+    def connectionLost(self, reason: Failure) -> None:
+
+        # Only happens when the reactor stops
+        log.debug(f"Channel closed: {reason.value}")
+
+
+class RelayServer:
+    """
+    UDP_Server of the relay process
+    """
+
+    def __init__(self, udp_port: int, channel: socket.socket,
+                 record: Optional[str] = None) -> None:
+
+        self.rooms = Rooms()
+        self.udp_server = UDP_Server(self.rooms)
+        self.udp_port: IListeningPort = reactor.listenUDP(udp_port,
+                                                          self.udp_server)
+
+        channel.setblocking(False)
+        self.inbox = RelayInbox(channel, self.udp_server)
+        reactor.addReader(self.inbox)
+
+        server_metrics.watch(None, self.udp_server)
+
+        self.recorder = start_recording(record, None, self.udp_server,
+                                        RELAY_LOG)
+        if self.recorder is not None:
+            reactor.addSystemEventTrigger("before", "shutdown",
+                                          self.recorder.close)
+
+
+def run_relay(udp_port: int, channel: socket.socket, cores: Set[int],
+              metrics_port: Optional[int] = None,
+              record: Optional[str] = None) -> None:
+    """
+    Entry point of the relay process
+    """
+
+    pin(cores, "UDP relay")
+    RelayServer(udp_port, channel, record)
+    log.info(f"UDP relay running on pid {os.getpid()}")
+
+    if metrics_port is not None:
+        serve_metrics(metrics_port)
+
+    reactor.run()
+
+    log.info("UDP relay exiting")
+
+
+class SplitServer:
+    """
+    TCP server of this process and its UDP relay process, its metrics are
+    served on metrics_port + 1 and its packets recorded apart. The rooms
+    kept in history are the ones of the TCP process
+    """
+
+    def __init__(self, tcp_port: int, udp_port: int,
+                 metrics_port: Optional[int] = None,
+                 record: Optional[str] = None,
+                 history: Optional[str] = None) -> None:
+
+        tcp_cores, relay_cores = split_cores()
+        channel, relay_end = socket.socketpair(socket.AF_UNIX,
+                                               socket.SOCK_DGRAM)
+
+        # Like the workers, a fresh interpreter instead of a forked reactor
+        context = multiprocessing.get_context("spawn")
+        self.relay = context.Process(
+            target=run_relay, name="udp-relay",
+            args=(udp_port, relay_end, relay_cores,
+                  None if metrics_port is None else metrics_port + 1,
+                  record))
+        self.relay.start()
+        relay_end.close()
+
+        pin(tcp_cores, "TCP server")
+
+        self.rooms = Rooms()
+        self.tcp_factory = TCP_Factory(self.rooms)
+        channel.setblocking(False)
+        self.tcp_factory.relay = RelayLink(channel)
+        self.history = start_history(history, self.tcp_factory)
+        self.tcp_port: Optional[IListeningPort] = None
+        endpoint = TCP4ServerEndpoint(reactor, tcp_port)
+        deferred = endpoint.listen(self.tcp_factory)
+        deferred.addCallback(self._tcp_listening)
+
+        server_metrics.watch(self.tcp_factory, None)
+
+        self.recorder = start_recording(record, self.tcp_factory, None,
+                                        TCP_LOG)
+        reactor.addSystemEventTrigger("before", "shutdown", self.close)
+
+    def _tcp_listening(self, port: IListeningPort) -> None:
+
+        self.tcp_port = port
+
+    def close(self) -> None:
+
+        # Before the connections close, see start_history
+        if self.history is not None:
+            self.history.close()
+
+        self.tcp_factory.close()
+        if self.tcp_port is not None:
+            self.tcp_port.stopListening()
+
+        if self.recorder is not None:
+            self.recorder.close()
+
+        # The reactor of the relay stops cleanly on SIGTERM, a ctrl C in a
+        # terminal may have reached it already
+        if self.relay.is_alive():
+            self.relay.terminate()
+
+        self.relay.join(SHUTDOWN_DELAY)
+        if self.relay.is_alive():
+            self.relay.kill()
+            self.relay.join()
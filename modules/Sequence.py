@@ -0,0 +1,298 @@
+"""
+Sequence numbers, loss accounting and jitter buffer of the UDP telemetry.
+
+Every telemetry datagram has a UDP_HEADER after its type byte: the random id
+of its sender, a 16 bits sequence number per stream and the sender
+monotonic clock in ms. Receivers track each (sender, stream) to count lost,
+reordered and duplicated datagrams and estimate the jitter (RFC 3550).
+"""
+from __future__ import annotations
+
+import heapq
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from twisted.internet import reactor
+from twisted.internet.interfaces import IDelayedCall, IReactorTime
+
+from modules.Codec import LINK_REPORT, UDP_HEADER
+
+SEQUENCE_MODULO = 1 << 16
+# Datagrams behind the newest whose reception is remembered
+SEEN_WINDOW = 64
+TIMESTAMP_MODULO = 1 << 32
+COUNTER_MODULO = 1 << 32
+# Seconds between two LinkMonitor reports
+LINK_REPORT_INTERVAL = 1
+# Jitter buffer delay bounds, the delay is 3 times the jitter in between
+JITTER_BUFFER_MIN = 0.02
+JITTER_BUFFER_MAX = 0.2
+
+
+def timestamp_ms() -> int:
+
+    return int(time.monotonic() * 1000) % TIMESTAMP_MODULO
+
+
+class StreamSender:
+    """
+    Header of the datagrams of one stream
+    """
+
+    def __init__(self, sender: Optional[int] = None) -> None:
+
+        if sender is None:
+            sender = random.getrandbits(16)
+
+        self.sender = sender
+        self.sequence = 0
+
+    def header(self) -> bytes:
+
+        header = UDP_HEADER.pack(self.sender, self.sequence, timestamp_ms())
+        self.sequence = (self.sequence + 1) % SEQUENCE_MODULO
+
+        return header
+
+
+@dataclass
+class StreamStats:
+
+    received: int = 0
+    lost: int = 0
+    reordered: int = 0
+    duplicates: int = 0
+    # Arrived after a newer one left the jitter buffer
+    late: int = 0
+    # Interarrival jitter in ms
+    jitter: float = 0
+
+    @property
+    def loss(self) -> float:
+
+        expected = self.received + self.lost
+        if expected == 0:
+            return 0
+
+        return self.lost / expected
+
+    def __str__(self) -> str:
+
+        return (f"received {self.received}, lost {self.lost}"
+                f" ({self.loss * 100:.1f}%), reordered {self.reordered},"
+                f" duplicates {self.duplicates}, late {self.late},"
+                f" jitter {self.jitter:.1f}ms")
+
+
+class StreamTracker:
+    """
+    Order and statistics of the datagrams of one (sender, stream)
+    """
+
+    def __init__(self) -> None:
+
+        self.stats = StreamStats()
+        # Extended (not wrapping) highest sequence number received
+        self.highest: Optional[int] = None
+        # Bit n is set when highest - n was received
+        self._seen = 0
+
+        self._last_transit: Optional[int] = None
+        # Local clock minus sender clock (s), lowest transit seen
+        self.offset: Optional[float] = None
+
+    def track(self, sequence: int, timestamp: int,
+              arrival: float) -> Tuple[Optional[int], bool]:
+        """
+        Extended sequence number of a datagram (None for a duplicate) and
+        if it is the newest
+        """
+
+        stats = self.stats
+
+        if self.highest is None:
+            self.highest = sequence
+            self._seen = 1
+            stats.received += 1
+            self._timing(timestamp, arrival)
+            return sequence, True
+
+        diff = (sequence - self.highest) % SEQUENCE_MODULO
+        if diff == 0:
+            stats.duplicates += 1
+            return None, False
+
+        if diff < SEQUENCE_MODULO // 2:
+            stats.received += 1
+            stats.lost += diff - 1
+            self.highest += diff
+            self._seen = ((self._seen << diff) | 1) & ((1 << SEEN_WINDOW) - 1)
+            self._timing(timestamp, arrival)
+            return self.highest, True
+
+        behind = SEQUENCE_MODULO - diff
+        if behind < SEEN_WINDOW:
+
+            if self._seen & (1 << behind):
+                stats.duplicates += 1
+                return None, False
+
+            self._seen |= 1 << behind
+
+        # Older than the newest, it was counted as lost
+        stats.received += 1
+        stats.lost = max(0, stats.lost - 1)
+        stats.reordered += 1
+
+        return self.highest - behind, False
+
+    def _timing(self, timestamp: int, arrival: float) -> None:
+
+        arrival_ms = int(arrival * 1000)
+        transit = (arrival_ms - timestamp) % TIMESTAMP_MODULO
+
+        if self._last_transit is not None:
+            change = (transit - self._last_transit) % TIMESTAMP_MODULO
+            if change > TIMESTAMP_MODULO // 2:
+                change -= TIMESTAMP_MODULO
+
+            self.stats.jitter += (abs(change) - self.stats.jitter) / 16
+
+        self._last_transit = transit
+
+        offset = arrival - timestamp / 1000
+        if self.offset is None or offset < self.offset:
+            self.offset = offset
+
+        else:
+            # Follow a slow drift between the clocks
+            self.offset += (offset - self.offset) / 1024
+
+
+class JitterBuffer:
+    """
+    Hold the datagrams of a stream to release them in order at a steady
+    pace, a datagram arriving after a newer one was released is dropped
+    """
+
+    def __init__(self, tracker: StreamTracker,
+                 release: Callable[[bytes], None],
+                 clock: IReactorTime = reactor) -> None:
+
+        self.tracker = tracker
+        self.release = release
+        self.clock = clock
+
+        self.released: Optional[int] = None
+        self._heap: List[Tuple[int, int, bytes]] = []
+        self._pending: Set[int] = set()
+        self._call: Optional[IDelayedCall] = None
+
+    @property
+    def delay(self) -> float:
+
+        delay = 3 * self.tracker.stats.jitter / 1000
+        return min(JITTER_BUFFER_MAX, max(JITTER_BUFFER_MIN, delay))
+
+    def push(self, sequence: int, timestamp: int, payload: bytes) -> None:
+
+        if self.released is not None and sequence <= self.released:
+            self.tracker.stats.late += 1
+            return
+
+        if sequence in self._pending:
+            self.tracker.stats.duplicates += 1
+            return
+
+        self._pending.add(sequence)
+        heapq.heappush(self._heap, (sequence, timestamp, payload))
+        self._arm()
+
+    def _due(self, timestamp: int) -> float:
+
+        return timestamp / 1000 + self.tracker.offset + self.delay
+
+    def _arm(self) -> None:
+
+        due = self._due(self._heap[0][1])
+        if self._call is not None and self._call.active():
+
+            if self._call.getTime() <= due:
+                return
+
+            self._call.cancel()
+
+        delay = max(0, due - self.clock.seconds())
+        self._call = self.clock.callLater(delay, self._run)
+
+    def _run(self) -> None:
+
+        self._call = None
+        now = self.clock.seconds()
+
+        while self._heap and self._due(self._heap[0][1]) <= now:
+            sequence, _, payload = heapq.heappop(self._heap)
+            self._pending.discard(sequence)
+            self.released = sequence
+            self.release(payload)
+
+        if self._heap:
+            self._arm()
+
+    def clear(self) -> None:
+
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+
+        self._call = None
+        self._heap.clear()
+        self._pending.clear()
+
+
+class LinkMonitor:
+    """
+    Reception of the telemetry datagrams of one client, reported back to
+    it so it can adapt its send rate (see modules.RateControl)
+    """
+
+    def __init__(self) -> None:
+
+        self.trackers: Dict[int, StreamTracker] = {}
+        # Sender timestamp and arrival of the last datagram
+        self._last: Optional[Tuple[int, float]] = None
+        self._fresh = False
+
+    def track(self, stream: int, datagram: bytes, arrival: float) -> None:
+
+        if len(datagram) < 1 + UDP_HEADER.size:
+            return
+
+        _, sequence, timestamp = UDP_HEADER.unpack_from(datagram, 1)
+        tracker = self.trackers.get(stream)
+        if tracker is None:
+            tracker = StreamTracker()
+            self.trackers[stream] = tracker
+
+        tracker.track(sequence, timestamp, arrival)
+        self._last = (timestamp, arrival)
+        self._fresh = True
+
+    def report(self, now: float) -> Optional[bytes]:
+        """
+        LINK_REPORT payload, None if nothing was received since the last one
+        """
+
+        if not self._fresh:
+            return None
+
+        self._fresh = False
+        received = sum(tracker.stats.received
+                       for tracker in self.trackers.values())
+        lost = sum(tracker.stats.lost for tracker in self.trackers.values())
+        timestamp, arrival = self._last
+        held = min(0xFFFF, int((now - arrival) * 1000))
+
+        return LINK_REPORT.pack(received % COUNTER_MODULO,
+                                lost % COUNTER_MODULO, timestamp, held)
@@ -1,268 +1,1150 @@
 from __future__ import annotations
 
+import heapq
+import itertools
 import logging
 import struct
 import time
-from typing import List, Tuple
+import zlib
+from typing import (TYPE_CHECKING, Callable, Dict, Hashable, List, Optional,
+                    Set, Tuple)
 
 from twisted.internet import reactor, task
 from twisted.internet.endpoints import TCP4ServerEndpoint
-from twisted.internet.interfaces import IAddress
+from twisted.internet.interfaces import (IAddress, IDelayedCall,
+                                         IListeningPort, IReactorTime)
 from twisted.internet.protocol import DatagramProtocol, Protocol, ServerFactory
 from twisted.python.failure import Failure
 
-from modules.Common import (DataQueue, NetData, NetworkQueue,
-                            PacketType, PitStop)
+from modules.Common import PacketType, PitStop
+from modules.Compression import (COMPRESSED, COMPRESSION_FLAGS,
+                                 COMPRESSION_THRESHOLD, COMPRESSION_ZLIB,
+                                 compress, decompress, read_flags)
+from modules.Dispatch import PacketDispatcher
+from modules.Election import ELECTION_INTERVAL, SourceElection
+from modules.Framing import FRAME_HEADER, FrameDecoder, frame
+from modules.Heartbeat import HEARTBEAT_INTERVAL, Heartbeat
+from modules.History import (HISTORY_FLAGS, HISTORY_REQUEST, LONG_HISTORY,
+                             PAGED_HISTORY, RESUME_GRACE, STRATEGY_ID,
+                             HistoryLog, history_page, history_payload,
+                             new_epoch)
+from modules.Metrics import Traffic, peer_name, server_metrics
+from modules.Outbound import OutboundQueue
+from modules.Recorder import (RECORD_TCP, RECORD_UDP, PacketRecorder,
+                              numbered_path)
+from modules.Sequence import LINK_REPORT_INTERVAL, LinkMonitor
+
+if TYPE_CHECKING:
+    from modules.Relay import RelayLink
+    from modules.Workers import WorkerRouter
 
 server_log = logging.getLogger(__name__)
 
+CONNECT_UDP = PacketType.ConnectUDP.to_bytes()
+PING = PacketType.Ping.value
+PONG = PacketType.Pong.value
+# What older clients send to the UDP server, they are in the default room
+LEGACY_UDP = (b"Hello UDP", b"I'm not a dead client")
+# Answer to a datagram of an unknown client (restarted or evicting server,
+# new NAT mapping, lost ConnectUDP), it sends its ConnectUDP again
+UDP_RENEW = PacketType.UDP_RENEW.to_bytes()
+# Streams relayed over UDP whose last packet is kept for late joiners
+CACHED_UDP = frozenset((PacketType.Telemetry.value,
+                        PacketType.TelemetryRT.value,
+                        PacketType.TelemetryDelta.value,
+                        PacketType.TelemetryRTDelta.value,
+                        PacketType.TelemetryRTBatch.value))
+# Sequenced stream (modules.Sequence) of the telemetry datagrams, keyframes
+# and deltas share the sequence numbers of their stream
+SEQUENCED_UDP = {
+    PacketType.Telemetry.value: PacketType.Telemetry.value,
+    PacketType.TelemetryDelta.value: PacketType.Telemetry.value,
+    PacketType.TelemetryRT.value: PacketType.TelemetryRT.value,
+    PacketType.TelemetryRTDelta.value: PacketType.TelemetryRT.value,
+    PacketType.TelemetryRTBatch.value: PacketType.TelemetryRTBatch.value,
+}
+LINK_REPORT = PacketType.LinkReport.to_bytes()
+# TelemetrySource packets, see modules.Election
+SOURCE_ACTIVE = PacketType.TelemetrySource.to_bytes() + b"\x01"
+SOURCE_STANDBY = PacketType.TelemetrySource.to_bytes() + b"\x00"
+# UDP fan-outs per one timed for the metrics
+FANOUT_SAMPLING = 16
+# Heartbeats aren't recorded, a replayed client doesn't answer them
+UNRECORDED = frozenset((PING, PONG))
+# Delta stream of each keyframe stream, see modules.Delta
+KEYFRAME_DELTAS = {
+    PacketType.Telemetry.value: PacketType.TelemetryDelta.value,
+    PacketType.TelemetryRT.value: PacketType.TelemetryRTDelta.value,
+}
+
+STRATEGY_HISTORY_DELAY = 0.5
+# Period (s) of the car info broadcast, clients send theirs every 0.5s
+CAR_INFO_INTERVAL = 0.5
+# ConnectionScheduler keys
+USER_UPDATE = "user_update"
+CLOSE = "close"
+# Room of the clients who don't send a team token (old clients)
+DEFAULT_ROOM = ""
+
+
+class ConnectionScheduler:
+    """
+    Single timer running the pending work of every connection of a factory.
+
+    Work is either ready, run on the next reactor iteration and coalesced by
+    key, or delayed in a heap ordered by due time. A run only touches the
+    connections with pending work, idle connections cost nothing.
+    """
+
+    def __init__(self, clock: IReactorTime = reactor) -> None:
+
+        self._clock = clock
+        self._ready: Dict[Hashable, Callable[[], None]] = {}
+        self._delayed: List[Tuple[float, int, Callable[[], None]]] = []
+        self._sequence = itertools.count()
+        self._call: Optional[IDelayedCall] = None
+
+    def call_soon(self, key: Hashable, function: Callable[[], None]) -> None:
+        """
+        Run function on the next iteration, once for all the calls with the
+        same key before it runs
+        """
+
+        if key not in self._ready:
+            self._ready[key] = function
+            self._arm(self._clock.seconds())
+
+    def call_later(self, delay: float, function: Callable[[], None]) -> None:
+
+        due = self._clock.seconds() + delay
+        heapq.heappush(self._delayed, (due, next(self._sequence), function))
+        self._arm(due)
+
+    @property
+    def pending(self) -> int:
+
+        return len(self._ready) + len(self._delayed)
+
+    def _arm(self, due: float) -> None:
+
+        if self._call is not None and self._call.active():
+
+            if self._call.getTime() <= due:
+                return
+
+            self._call.cancel()
+
+        delay = max(0, due - self._clock.seconds())
+        self._call = self._clock.callLater(delay, self._run)
+
+    def _run(self) -> None:
+
+        self._call = None
+
+        ready, self._ready = self._ready, {}
+        for function in ready.values():
+            self._run_one(function)
+
+        now = self._clock.seconds()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._run_one(heapq.heappop(self._delayed)[2])
+
+        if self._ready:
+            self._arm(now)
+
+        elif self._delayed:
+            self._arm(self._delayed[0][0])
+
+    @staticmethod
+    def _run_one(function: Callable[[], None]) -> None:
+
+        # One failing connection mustn't stop the work of the others
+        try:
+            function()
+
+        except Exception:
+            server_log.exception("Scheduled call failed")
+
+
+class Room:
+    """
+    Users, strategy history and UDP clients of one team.
+
+    Every broadcast of a member only goes to the members of its room.
+    """
+
+    def __init__(self, name: str) -> None:
+
+        self.name = name
+        self.users: List[TCP_Server] = []
+        self.user_connected: List[Tuple[str, int]] = []
+        self.strategies: List[PitStop] = []
+        # Epoch of the strategy IDs, see modules.History
+        self.epoch = new_epoch()
+        self.udp_clients: List[Tuple[str, int]] = []
+        # UDP client whose telemetry is relayed
+        self.election = SourceElection()
+        # Last packet of each stream by packet type, sent to joining users
+        self.last_values: Dict[int, bytes] = {}
+        # Car info (ServerData) of each driver to send on the next tick
+        self.car_info: Dict[Tuple[str, int], bytes] = {}
+        # Last car info sent of each driver
+        self.car_info_sent: Dict[Tuple[str, int], bytes] = {}
+        # Users connected before a restart of the server who didn't
+        # reconnect yet, name to driver ID, see modules.History
+        self.returning: Dict[str, int] = {}
+
+    def reserved(self, name: str, driverID: int) -> bool:
+        """
+        True if name or driverID is kept for another returning user
+        """
+
+        kept = self.returning.get(name)
+        if kept is not None:
+            return kept != driverID
+
+        return driverID in self.returning.values()
+
+    def cache(self, packet: int, data: bytes) -> None:
+        """
+        Keep data as the last value of its stream
+        """
+
+        delta = KEYFRAME_DELTAS.get(packet)
+        if delta is not None:
+            # A new keyframe makes the last delta useless, and the next
+            # delta must be sent after it
+            self.last_values.pop(delta, None)
+
+        self.last_values[packet] = data
+
+    def send_to_all_user(self, data: bytes) -> None:
+        """
+        Send data to every member, compressed once for the members who
+        negotiated it
+        """
+
+        message = frame(data)
+        packet = data[0]
+        size = len(message)
+        compressible = len(data) >= COMPRESSION_THRESHOLD
+        compressed = None
+
+        start = time.perf_counter()
+        for user in self.users:
+
+            if compressible and user.compression:
+                if compressed is None:
+                    compressed = frame(compress(data) or data)
+
+                user.outbound.write(packet, compressed)
+                user.traffic.sent(compressed[FRAME_HEADER.size],
+                                  len(compressed))
+                continue
+
+            user.outbound.write(packet, message)
+            user.traffic.sent(packet, size)
+
+        server_metrics.tcp_fanout.observe(time.perf_counter() - start)
+
+    def update_car_info(self, user: Tuple[str, int], packet: bytes) -> bool:
+        """
+        Keep packet as the car info of user for the next tick, False if
+        there is nothing new to send
+        """
+
+        if packet == self.car_info_sent.get(user):
+            # Changed and back within a tick
+            self.car_info.pop(user, None)
+            return False
+
+        self.car_info[user] = packet
+        return True
+
+    def flush_car_info(self) -> None:
+        """
+        Send the car info of every driver who changed since the last tick
+        """
+
+        car_info, self.car_info = self.car_info, {}
+        for user, packet in car_info.items():
+            self.send_to_all_user(packet)
+            self.car_info_sent[user] = packet
+            self.cache(PacketType.ServerData.value, packet)
+
+    def forget_car_info(self, user: Tuple[str, int]) -> None:
+
+        self.car_info.pop(user, None)
+        self.car_info_sent.pop(user, None)
+
+    def send_user_update(self) -> None:
+
+        buffer = []
+        buffer.append(PacketType.UpdateUsers.to_bytes())
+        buffer.append(struct.pack("!B", len(self.user_connected)))
+
+        for user in self.user_connected:
+
+            name = user[0].encode("utf-8")
+            lenght = struct.pack("!B", len(name))
+            driverID = struct.pack("!B", user[1])
+            buffer.append(lenght + name + driverID)
+
+        self.send_to_all_user(b"".join(buffer))
+        server_log.info(f"Send user update of room {self.name!r} {buffer}")
+
+
+class Rooms(dict):
+    """
+    Rooms of a server by name, shared by the TCP and UDP servers
+    """
+
+    def get_room(self, name: str) -> Room:
+
+        room = self.get(name)
+        if room is None:
+            server_log.info(f"New room {name!r}")
+            room = Room(name)
+            self[name] = room
+
+        return room
+
+
+def read_room(data: memoryview, offset: int) -> str:
+    """
+    Read the optional "!B" lenght prefixed room token at offset
+    """
+
+    if len(data) <= offset:
+        return DEFAULT_ROOM
+
+    lenght = data[offset]
+    return bytes(data[offset+1:offset+1+lenght]).decode("utf-8")
+
 
 class TCP_Server(Protocol):
 
-    def __init__(self, users: List[TCP_Server],
-                 strategies: List[PitStop],
-                 user_connected: List[Tuple[str, int]],
-                 queue: DataQueue) -> None:
+    def __init__(self, factory: TCP_Factory) -> None:
 
         super().__init__()
-        self.queue = queue
-        self.users = users
-        self.users.append(self)
-        self.user_connected: List[str, int] = user_connected
+        self.factory = factory
+        self.scheduler = factory.scheduler
+        self.connections = factory.connections
+        self.connections.append(self)
+        # Set by the Connect packet, nothing is relayed before
+        self.room: Optional[Room] = None
+        # Worker owning the room of the connection, when it isn't this one
+        self.owner: Optional[int] = None
 
-        self.user_change = False
         self._error = ""
         self.valid_user = False
-        self.sent_strat_history = False
-        self.timer = time.time()
 
         self.user: Tuple[str, int] = ()
+        # Negotiated in the Connect, see modules.Compression
+        self.compression = False
+        # Negotiated in the Connect, see modules.History
+        self.long_history = False
+        self.paged_history = False
+        self.decoder = FrameDecoder()
+        # Set when connected, every message goes through it
+        self.outbound: Optional[OutboundQueue] = None
+        self.heartbeat = Heartbeat(factory.clock)
+        # Metrics label, host:port of the client
+        self.peer = ""
+        self.traffic = server_metrics.client("tcp", self.peer)
+
+        self.dispatcher = PacketDispatcher("TCP_Server")
+        self.dispatcher.register(PacketType.Connect, self._on_connect)
+        self.dispatcher.register(PacketType.SmData, self._on_sm_data)
+        self.dispatcher.register(PacketType.Strategy, self._on_strategy)
+        self.dispatcher.register(PacketType.StrategyOK, self.send_to_all_user)
+        self.dispatcher.register(PacketType.TyreSets, self._on_tyre_sets)
+        self.dispatcher.register(PacketType.Ping, self._on_ping)
+        self.dispatcher.register(PacketType.Pong, self.heartbeat.on_pong)
+        self.dispatcher.register(PacketType.Compressed, self._on_compressed)
+        self.dispatcher.register(PacketType.StrategyPageRequest,
+                                 self._on_strategy_page_request)
+
+    def user_changed(self) -> None:
+        """
+        Broadcast the user list on the next reactor iteration, changes
+        made in the same iteration are sent once
+        """
+
+        self.scheduler.call_soon((USER_UPDATE, self.room),
+                                 self.room.send_user_update)
+
+    def send_room_state(self) -> None:
+        """
+        Send the strategy history (unless asked for by pages) and the last
+        packet of every TCP stream of the room in a single write, the
+        telemetry is sent when the UDP client joins (see UDP_Server.join)
+        """
+
+        if not self.connected:
+            return
 
-        self.strategies: List[PitStop] = strategies
-
-        self.loop_call = task.LoopingCall(self.server_loop)
-        self.loop_call.start(0.1)
-
-    def server_loop(self) -> None:
+        buffer = []
+        # Asked for by pages otherwise
+        if not self.paged_history:
+            packet = history_payload(self.room.strategies, self.long_history)
+            buffer.append(self.encode(PacketType.StategyHistory.to_bytes() +
+                                      packet))
 
-        if self.user_change:
-            self.update_user_connected()
-            self.user_change = False
+        for packet, last_value in self.room.last_values.items():
+            if packet not in CACHED_UDP:
+                buffer.append(self.encode(last_value))
 
-        # why the fuck I'm not allowed to send 2 TCP packet 1ms apart?
-        if (self.valid_user and not self.sent_strat_history
-                and time.time() > self.timer + 0.5):
+        for message in buffer:
+            self.traffic.sent(message[FRAME_HEADER.size], len(message))
 
-            self.sent_strat_history = True
-            header = PacketType.StategyHistory.to_bytes()
+        if not buffer:
+            return
 
-            packet = struct.pack("!B", len(self.strategies))
-            for strategy in self.strategies:
-                packet += strategy.to_bytes()
+        # Always delivered, the last values in it are replaced by the next
+        self.outbound.write(PacketType.StategyHistory.value,
+                            b"".join(buffer))
 
-            self.send_message(header + packet)
+    def connectionMade(self) -> None:
+        self.outbound = OutboundQueue(self.transport,
+                                      self.transport.abortConnection,
+                                      self.factory.clock)
+        peer = self.transport.getPeer()
+        self.peer = peer_name((peer.host, peer.port))
+        self.traffic.client = self.peer
+        server_log.info(f"New connection with {peer}")
 
-        for element in self.queue.q_in:
+    def dataReceived(self, data: bytes) -> None:
 
-            if element.data_type == NetworkQueue.Close:
-                self.close()
-                self.queue.q_in.remove(element)
-                break
+        self.heartbeat.seen()
 
-    def connectionMade(self) -> None:
-        server_log.info(f"New connection with {self.transport.getPeer()}")
+        frames = self.decoder.feed(data)
+        for index, packet in enumerate(frames):
 
-    def dataReceived(self, data: bytes) -> None:
+            if not packet:
+                # Nothing to count, record or dispatch
+                server_log.warning(f"Empty frame from {self.peer}")
+                continue
 
-        byte_offset = 0
-        while (len(data) != byte_offset):
+            self.traffic.received(packet[0], FRAME_HEADER.size + len(packet))
 
             try:
-                packet_size = struct.unpack("!H",
-                                        data[byte_offset:byte_offset+2])[0]
-                byte_offset += 2
-                self.decode_data(data[byte_offset:byte_offset+packet_size])
-                byte_offset += packet_size
+                self.decode_data(packet)
 
             except struct.error as msg:
                 server_log.warning(msg)
-                server_log.info(f"data was: {data}")
+                server_log.info(f"data was: {bytes(packet)}")
+
+            if self.owner is not None:
+                self.hand_off(frames[index:])
                 return
 
+            recorder = self.factory.recorder
+            if recorder is not None and packet[0] not in UNRECORDED:
+                room = None if self.room is None else self.room.name
+                recorder.record(RECORD_TCP, room, self.peer, packet)
+
+    def hand_off(self, frames: List[memoryview]) -> None:
+        """
+        Give the connection and what it sent from its Connect packet to
+        the worker owning its room
+        """
+
+        data = b"".join([frame(bytes(packet)) for packet in frames])
+        data += self.decoder.take()
+
+        server_log.info(f"Hand {self.transport.getPeer()} to worker"
+                        f" {self.owner}")
+        self.factory.router.hand_off(self.owner, self.transport, data)
+
     def send_to_all_user(self, data: bytes) -> None:
 
-        data_header = struct.pack("!H", len(data))
-        message = data_header + data
+        if not self.valid_user:
+            server_log.warning("Message from a connection not in a room")
+            return
 
-        for user in self.users:
-            user.transport.write(message)
+        self.room.send_to_all_user(data)
+
+    def encode(self, data: bytes) -> bytes:
+        """
+        Frame of data, compressed if negotiated
+        """
+
+        if self.compression:
+            data = compress(data) or data
+
+        return frame(data)
 
     def send_message(self, data: bytes) -> None:
 
-        data_header = struct.pack("!H", len(data))
-        message = data_header + data
-        self.transport.write(message)
+        message = self.encode(data)
+        self.traffic.sent(message[FRAME_HEADER.size], len(message))
+        self.outbound.write(data[0], message)
 
-    def decode_data(self, data: bytes) -> None:
+    def decode_data(self, data: memoryview) -> None:
 
-        packet = PacketType.from_bytes(data)
+        self.dispatcher.dispatch(data)
 
-        if packet == PacketType.Connect:
+    def _on_connect(self, data: memoryview) -> None:
+
+        lenght = data[1]
+        name = bytes(data[2:lenght+2]).decode("utf-8")
+        driverID = data[lenght+2]
+        room_name = read_room(data, lenght+3)
+        # Flags after the room, only sent by clients sending a room
+        flags = 0
+        if len(data) > lenght+3:
+            flags = read_flags(data, lenght+4+data[lenght+3])
+
+        router = self.factory.router
+        if router is not None and not self.valid_user:
+            self.owner = router.owner(room_name)
+            if self.owner is not None:
+                # dataReceived hands the connection off
+                return
 
-            lenght = data[1]
-            name = data[2:lenght+2].decode("utf-8")
-            driverID = data[lenght+2]
+        room = self.factory.rooms.get_room(room_name)
 
-            server_log.info(f"New user info, name: {name},"
-                            f" driverID: {driverID}")
+        server_log.info(f"New user info, name: {name},"
+                        f" driverID: {driverID}, room: {room.name!r}")
 
+        user_connected = room.user_connected
+        succes = False
+        if self.valid_user:
+            server_log.warning(f"User {self.user} is already connected.")
+            msg = "This connection is already in a room."
+
+        elif name in [user[0] for user in user_connected]:
+            server_log.warning(f"User {name} is already used.")
+            msg = "This username is already connected."
+
+        elif driverID in [user[1] for user in user_connected]:
+            server_log.warning(f"DriverID {driverID} is already used.")
+            msg = f"The driver ID {driverID} is already used."
+
+        elif room.reserved(name, driverID):
+            server_log.warning(f"User {name} or driverID {driverID} is kept"
+                               " for a returning user.")
+            msg = ("This username or driver ID is kept for a user"
+                   " reconnecting after a server restart.")
+
+        else:
+            server_log.info(f"Connection succes")
             self.user = (name, driverID)
-            succes = False
-            if name in [user[0] for user in self.user_connected]:
-                server_log.warning(f"User {name} is already used.")
-                msg = "This username is already connected."
+            self.room = room
+            room.users.append(self)
+            user_connected.append(self.user)
+            room.returning.pop(name, None)
+            history = self.factory.history
+            if history is not None:
+                history.join(room.name, name, driverID)
+            self.user_changed()
+            self.valid_user = True
+
+            # why the fuck I'm not allowed to send 2 TCP packet 1ms apart?
+            self.scheduler.call_later(STRATEGY_HISTORY_DELAY,
+                                      self.send_room_state)
+            succes = True
+            msg = "Connection succes"
+
+        header = PacketType.ConnectionReply.to_bytes()
+        info = msg.encode("utf-8")
+        packet = struct.pack("!?B", succes, len(info)) + info
+        if flags:
+            # Accepted flags, older clients don't expect them
+            packet += struct.pack(
+                "!B", flags & (COMPRESSION_FLAGS | HISTORY_FLAGS))
+
+        self.send_message(header + packet)
+
+        # The reply itself is never compressed
+        if succes:
+            self.compression = bool(flags & COMPRESSION_ZLIB)
+            self.long_history = bool(flags & LONG_HISTORY)
+            self.paged_history = bool(flags & PAGED_HISTORY)
+
+    def _on_compressed(self, data: memoryview) -> None:
+
+        try:
+            packet = decompress(data)
+
+        except zlib.error as error:
+            server_log.warning(f"Invalid compressed packet: {error}")
+            return
 
-            elif driverID in [user[1] for user in self.user_connected]:
-                server_log.warning(f"DriverID {driverID} is already used.")
-                msg = f"The driver ID {driverID} is already used."
+        if packet[:1] == COMPRESSED:
+            server_log.warning("Nested compressed packet")
+            return
 
-            else:
-                server_log.info(f"Connection succes")
-                self.user_connected.append(self.user)
-                self.user_change = True
-                self.valid_user = True
-                succes = True
-                msg = "Connection succes"
+        self.decode_data(memoryview(packet))
 
-            header = PacketType.ConnectionReply.to_bytes()
-            info = msg.encode("utf-8")
-            packet = struct.pack("!?B", succes, len(info)) + info
+    def _on_ping(self, data: memoryview) -> None:
 
-            self.send_message(header + packet)
+        pong = self.heartbeat.on_ping(data)
+        if pong is not None:
+            self.send_message(pong)
 
-        elif packet == PacketType.SmData:
+    def _on_sm_data(self, data: memoryview) -> None:
 
-            header = PacketType.ServerData.to_bytes()
-            self.send_to_all_user(header + data[1:])
+        if not self.valid_user:
+            server_log.warning("Message from a connection not in a room")
+            return
 
-        elif packet == PacketType.Strategy:
+        # Sent by the factory on its car info tick
+        packet = PacketType.ServerData.to_bytes() + data[1:]
+        if self.room.update_car_info(self.user, packet):
+            self.factory.car_info_rooms.add(self.room)
 
-            self.strategies.append(PitStop.from_bytes(data[1:]))
-            self.send_to_all_user(data)
+    def _on_strategy(self, data: memoryview) -> None:
 
-        elif packet == PacketType.StrategyOK:
-            self.send_to_all_user(data)
+        if not self.valid_user:
+            server_log.warning("Strategy from a connection not in a room")
+            return
 
-        elif packet == PacketType.TyreSets:
-            server_log.info("Received Tyre sets data")
-            self.send_to_all_user(data)
+        room = self.room
+        strategy = PitStop.from_bytes(data, 1)
+        room.strategies.append(strategy)
+        if self.factory.history is not None:
+            self.factory.history.strategy(room.name, room.epoch, strategy)
 
-        else:
-            server_log.warning(f"incorrect packet {packet}")
+        # Older clients read the PitStop only
+        end = 1 + PitStop.byte_size
+        self.send_to_all_user(bytes(data[:end]) +
+                              STRATEGY_ID.pack(len(room.strategies)) +
+                              bytes(data[end:]))
 
-    def update_user_connected(self) -> None:
+    def _on_strategy_page_request(self, data: memoryview) -> None:
 
-        buffer = []
-        buffer.append(PacketType.UpdateUsers.to_bytes())
-        buffer.append(struct.pack("!B", len(self.user_connected)))
+        if not self.valid_user:
+            server_log.warning("Strategy page request from a connection not"
+                               " in a room")
+            return
 
-        for user in self.user_connected:
+        room = self.room
+        epoch, after = HISTORY_REQUEST.unpack_from(data, 1)
+        if epoch != room.epoch or after > len(room.strategies):
+            # Knows the history of an other room, send it from the start
+            after = 0
 
-            name = user[0].encode("utf-8")
-            lenght = struct.pack("!B", len(name))
-            driverID = struct.pack("!B", user[1])
-            buffer.append(lenght + name + driverID)
+        self.send_message(PacketType.StrategyPage.to_bytes() +
+                          history_page(room.strategies, room.epoch, after))
 
-        self.send_to_all_user(b"".join(buffer))
-        server_log.info(f"Send user update {buffer}")
+    def _on_tyre_sets(self, data: memoryview) -> None:
+
+        server_log.info("Received Tyre sets data")
+        self.send_to_all_user(data)
+
+        if self.valid_user:
+            self.room.cache(PacketType.TyreSets.value, bytes(data))
 
     def connectionLost(self, reason: Failure):
 
         self._error = str(reason)
 
-        server_log.info(f"Lost connection with {self.transport.getPeer()}")
+        server_log.info(f"Lost connection with {self.transport.getPeer()}"
+                        f" ({self.heartbeat})")
+
+        self.connections.remove(self)
+        server_metrics.forget(self.traffic)
 
         if self.valid_user:
-            self.user_connected.remove(self.user)
-            self.user_change = True
+            self.room.users.remove(self)
+            self.room.user_connected.remove(self.user)
+            self.room.forget_car_info(self.user)
+            self.user_changed()
+            if self.factory.history is not None:
+                self.factory.history.leave(self.room.name, *self.user)
+
+            if not self.room.users:
+                # The session is over, don't show its state to the next one
+                self.room.last_values.clear()
+                if self.factory.relay is not None:
+                    self.factory.relay.room_closed(self.room.name)
 
     def close(self) -> None:
 
         if self.transport is not None:
             server_log.info("Close TCP SERVER")
             self.transport.loseConnection()
-            self.loop_call.stop()
 
 
 class TCP_Factory(ServerFactory):
 
-    def __init__(self, queue: DataQueue) -> None:
+    def __init__(self, rooms: Rooms, clock: IReactorTime = reactor,
+                 router: Optional[WorkerRouter] = None) -> None:
         super().__init__()
-        self._users: List[TCP_Server] = []
-        self._strategies: List[PitStop] = []
-        self.user_connected: List[Tuple[str, int]] = []
-        self.queue = queue
+        self.rooms = rooms
+        self.router = router
+        # Log of the packets received, see modules.Recorder
+        self.recorder: Optional[PacketRecorder] = None
+        # UDP relay process to tell about the rooms, see modules.Relay
+        self.relay: Optional[RelayLink] = None
+        # Strategy history and users kept on disk, see modules.History
+        self.history: Optional[HistoryLog] = None
+        # Every open connection, in a room or not yet
+        self.connections: List[TCP_Server] = []
+        self.clock = clock
+        self.scheduler = ConnectionScheduler(clock)
+
+        self.heartbeat_call = task.LoopingCall(self.heartbeat)
+        self.heartbeat_call.clock = clock
+        # Rooms with car info to send on the next tick
+        self.car_info_rooms: Set[Room] = set()
+        self.car_info_call = task.LoopingCall(self.flush_car_info)
+        self.car_info_call.clock = clock
 
     def buildProtocol(self, addr: IAddress):
 
-        return TCP_Server(self._users, self._strategies,
-                          self.user_connected, self.queue)
+        return TCP_Server(self)
+
+    def startFactory(self) -> None:
+
+        self.heartbeat_call.start(HEARTBEAT_INTERVAL, now=False)
+        self.car_info_call.start(CAR_INFO_INTERVAL, now=False)
+
+    def stopFactory(self) -> None:
+
+        if self.heartbeat_call.running:
+            self.heartbeat_call.stop()
+
+        if self.car_info_call.running:
+            self.car_info_call.stop()
+
+    def flush_car_info(self) -> None:
+        """
+        Send the car info changed since the last tick, the rooms without
+        any cost nothing
+        """
+
+        rooms, self.car_info_rooms = self.car_info_rooms, set()
+        for room in rooms:
+            room.flush_car_info()
+
+    def end_resume(self) -> None:
+        """
+        The users connected before the restart who didn't come back in
+        RESUME_GRACE left
+        """
+
+        for room in self.rooms.values():
+
+            for name, driverID in room.returning.items():
+                server_log.info(f"User {name} didn't reconnect to room"
+                                f" {room.name!r}")
+                if self.history is not None:
+                    self.history.leave(room.name, name, driverID)
+
+            room.returning.clear()
+
+    def heartbeat(self) -> None:
+        """
+        Ping the connections answering pings, drop the silent ones
+        """
+
+        for connection in list(self.connections):
+
+            heartbeat = connection.heartbeat
+            if not heartbeat.capable or connection.transport is None:
+                continue
+
+            if not heartbeat.alive:
+                server_log.info(f"{connection.transport.getPeer()} missed"
+                                f" {heartbeat.missed} heartbeats, dropping"
+                                " it")
+                # A dead peer never acknowledges what is still queued
+                connection.transport.abortConnection()
+                continue
+
+            connection.send_message(heartbeat.ping())
+
+    def close(self) -> None:
+
+        for user in self.connections:
+            self.scheduler.call_soon((CLOSE, user), user.close)
 
 
 class UDP_Server(DatagramProtocol):
 
-    def __init__(self, clients: List, queue: DataQueue) -> None:
+    def __init__(self, rooms: Rooms,
+                 router: Optional[WorkerRouter] = None,
+                 clock: IReactorTime = reactor) -> None:
         super().__init__()
-        self.clients = clients
-        self.queue = queue
-
-        self.udp_imnotdead_timer = time.time()
-        self.loop_call = task.LoopingCall(self.udp_server_loop)
-        self.loop_call.start(0.01)
+        self.rooms = rooms
+        self.router = router
+        self.clock = clock
+        self.recorder: Optional[PacketRecorder] = None
+        # Room of every known client address
+        self.clients: Dict[Tuple[str, int], Room] = {}
+        # Owner worker of the clients in the room of another worker
+        self.forward: Dict[Tuple[str, int], int] = {}
+        # Reception of the telemetry of every client, reported back to it
+        self.links: Dict[Tuple[str, int], LinkMonitor] = {}
+        # Liveness and metrics of every known address, local or forwarded
+        self.heartbeats: Dict[Tuple[str, int], Heartbeat] = {}
+        self.traffic: Dict[Tuple[str, int], Traffic] = {}
+        self.fanouts = 0
+
+        self.heartbeat_call = task.LoopingCall(self.heartbeat)
+        self.heartbeat_call.clock = clock
+        self.report_call = task.LoopingCall(self.report_links)
+        self.report_call.clock = clock
+        self.election_call = task.LoopingCall(self.elect)
+        self.election_call.clock = clock
+
+    def startProtocol(self) -> None:
+
+        self.heartbeat_call.start(HEARTBEAT_INTERVAL, now=False)
+        self.report_call.start(LINK_REPORT_INTERVAL, now=False)
+        self.election_call.start(ELECTION_INTERVAL, now=False)
 
     def datagramReceived(self, datagram: bytes, addr):
 
-        if addr not in self.clients:
-            self.clients.append(addr)
+        if not datagram:
+            return
+
+        connect = datagram[:1] == CONNECT_UDP
+        if connect:
+            self.route(addr, read_room(datagram, 1))
+
+        elif addr not in self.clients and addr not in self.forward:
+            if datagram not in LEGACY_UDP:
+                # Its room is unknown, the default one would leak it
+                self.transport.write(UDP_RENEW, addr)
+                return
+
+            # Old clients only say hello, they are in the default room
+            self.route(addr, DEFAULT_ROOM)
+
+        heartbeat = self.heartbeats[addr]
+        heartbeat.seen()
 
-        if datagram in (b"Hello UDP", b"I'm not a dead client"):
+        packet = datagram[0]
+        size = len(datagram)
+
+        owner = self.forward.get(addr)
+        if owner is not None:
+            self.traffic[addr].forwarded(packet, size)
+            self.router.forward(owner, addr, datagram)
             return
 
-        for client in self.clients:
-            self.transport.write(datagram, client)
+        self.traffic[addr].received(packet, size)
+        if packet == PING:
+            pong = heartbeat.on_ping(datagram)
+            if pong is not None:
+                self.send(pong, addr)
+
+            return
+
+        if packet == PONG:
+            heartbeat.on_pong(datagram)
+            return
+
+        if self.recorder is not None:
+            self.recorder.record(RECORD_UDP, self.clients[addr].name,
+                                 self.traffic[addr].client, datagram)
+
+        if connect or datagram in LEGACY_UDP:
+            return
+
+        room = self.clients[addr]
+        stream = SEQUENCED_UDP.get(packet)
+        if stream is not None:
+            now = self.clock.seconds()
+            link = self.links.get(addr)
+            if link is None:
+                link = LinkMonitor()
+                self.links[addr] = link
+
+            link.track(stream, datagram, now)
+
+            election = room.election
+            source = election.source
+            relayed = election.receive(addr, datagram, now)
+            if election.source != source:
+                self.source_changed(room, source)
+
+            if not relayed:
+                # Answer every claim, a lost notice costs one claim
+                self.send(SOURCE_STANDBY, addr)
+                return
+
+        self.relay(room, packet, datagram)
+
+    def relay(self, room: Room, packet: int, datagram: bytes) -> None:
+        """
+        Send datagram to every UDP client of room
+        """
+
+        if packet in CACHED_UDP:
+            room.cache(packet, datagram)
+
+        size = len(datagram)
+        write = self.transport.write
+        traffic = self.traffic
+
+        # Time one fan-out out of FANOUT_SAMPLING, the clock isn't free
+        self.fanouts += 1
+        timed = self.fanouts % FANOUT_SAMPLING == 0
+        if timed:
+            start = time.perf_counter()
+
+        for client in room.udp_clients:
+            write(datagram, client)
+
+            # Traffic.sent inlined, it runs for every relayed datagram
+            counters = traffic[client]
+            counters.out_packets[packet] += 1
+            counters.out_bytes[packet] += size
+
+        if timed:
+            server_metrics.udp_fanout.observe(time.perf_counter() - start)
+
+    def route(self, addr: Tuple[str, int], name: str) -> None:
+        """
+        Join room name here or forward addr to the worker owning it
+        """
+
+        if addr not in self.heartbeats:
+            self.heartbeats[addr] = Heartbeat(self.clock)
+            self.traffic[addr] = server_metrics.client("udp", peer_name(addr))
+
+        owner = None if self.router is None else self.router.owner(name)
+        if owner is None:
+            self.forward.pop(addr, None)
+            self.join(addr, name)
+
+        else:
+            self.leave(addr)
+            self.forward[addr] = owner
+
+    def join(self, addr: Tuple[str, int], name: str) -> Room:
+        """
+        Put addr in the UDP fan-out of room name, leaving its old room, and
+        send it the last telemetry of the room: the deltas relayed next need
+        their keyframe
+        """
 
-    def udp_server_loop(self) -> None:
+        room = self.clients.get(addr)
+        if room is not None and room.name == name:
+            return room
 
-        for element in self.queue.q_in:
+        self.leave(addr)
 
-            if element.data_type == NetworkQueue.Close:
-                self.close()
-                self.queue.q_in.remove(element)
-                break
+        room = self.rooms.get_room(name)
+        room.udp_clients.append(addr)
+        self.clients[addr] = room
+        server_log.info(f"UDP client {addr} joined room {name!r}")
 
-        if time.time() - self.udp_imnotdead_timer > 10:
-            for client in self.clients:
-                self.transport.write(b"I'm not a dead server", client)
-            self.udp_imnotdead_timer = time.time()
+        # Also TCP packets when the TCP server is in this process
+        for packet, datagram in room.last_values.items():
+            if packet in CACHED_UDP:
+                self.send(datagram, addr)
+
+        return room
+
+    def leave(self, addr: Tuple[str, int]) -> None:
+
+        room = self.clients.pop(addr, None)
+        if room is not None:
+            room.udp_clients.remove(addr)
+            room.election.forget(addr)
+
+        self.links.pop(addr, None)
+
+    def evict(self, addr: Tuple[str, int]) -> None:
+        """
+        Forget addr, it joins again with its next datagram
+        """
+
+        self.leave(addr)
+        self.forward.pop(addr, None)
+        self.heartbeats.pop(addr, None)
+        traffic = self.traffic.pop(addr, None)
+        if traffic is not None:
+            server_metrics.forget(traffic)
+
+    def send(self, datagram: bytes, addr: Tuple[str, int]) -> None:
+
+        self.traffic[addr].sent(datagram[0], len(datagram))
+        self.transport.write(datagram, addr)
+
+    def source_changed(self, room: Room,
+                       old: Optional[Tuple[str, int]]) -> None:
+        """
+        Tell the new telemetry source of room to stream and the old one to
+        stand by
+        """
+
+        source = room.election.source
+        server_log.info(f"Telemetry source of room {room.name!r}: {source}")
+
+        if source is not None:
+            self.send(SOURCE_ACTIVE, source)
+
+        if old is not None and self.clients.get(old) is room:
+            self.send(SOURCE_STANDBY, old)
+
+    def elect(self) -> None:
+        """
+        Replace the silent telemetry sources
+        """
+
+        now = self.clock.seconds()
+        for room in set(self.clients.values()):
+
+            election = room.election
+            source = election.source
+            keyframe = election.check(now)
+            if election.source == source:
+                continue
+
+            self.source_changed(room, source)
+            # The next keyframe of the new source can be a STANDBY_INTERVAL
+            # away, its last claim is one
+            if keyframe is not None:
+                self.relay(room, keyframe[0], keyframe)
+
+    def heartbeat(self) -> None:
+        """
+        Ping the clients, or say hello to the older ones, and evict the
+        silent ones
+        """
+
+        for addr, heartbeat in list(self.heartbeats.items()):
+
+            if not heartbeat.alive:
+                server_log.info(f"UDP client {addr} missed"
+                                f" {heartbeat.missed} heartbeats, evicted")
+                self.evict(addr)
+
+            elif addr in self.forward:
+                # Its owner pings it
+                continue
+
+            elif heartbeat.capable:
+                self.send(heartbeat.ping(), addr)
+
+            else:
+                self.send(b"I'm not a dead server", addr)
+
+    def report_links(self) -> None:
+
+        now = self.clock.seconds()
+        for addr, link in self.links.items():
+
+            report = link.report(now)
+            if report is not None:
+                self.send(LINK_REPORT + report, addr)
+
+            # Told again, in case the notice was lost
+            if self.clients[addr].election.source == addr:
+                self.send(SOURCE_ACTIVE, addr)
 
     def close(self) -> None:
         server_log.info("Close UDP SERVER")
         self.transport.loseConnection()
-        self.loop_call.stop()
+
+        for call in (self.heartbeat_call, self.report_call,
+                     self.election_call):
+            if call.running:
+                call.stop()
+
+
+def start_recording(path: Optional[str], tcp_factory: Optional[TCP_Factory],
+                    udp_server: Optional[UDP_Server],
+                    index: Optional[int] = None) -> Optional[PacketRecorder]:
+    """
+    Record the packets of the servers of this process in path (numbered by
+    worker index), the log is closed when the reactor stops
+    """
+
+    if path is None:
+        return None
+
+    if index is not None:
+        path = numbered_path(path, index)
+
+    recorder = PacketRecorder(path)
+    for server in (tcp_factory, udp_server):
+        if server is not None:
+            server.recorder = recorder
+
+    return recorder
+
+
+def start_history(path: Optional[str], tcp_factory: TCP_Factory,
+                  index: Optional[int] = None) -> Optional[HistoryLog]:
+    """
+    Restore the rooms kept in path (numbered by worker index) and keep them
+    there, the log is closed when the reactor stops, before the
+    connections close: they are still connected at the next start
+    """
+
+    if path is None:
+        return None
+
+    if index is not None:
+        path = numbered_path(path, index)
+
+    history = HistoryLog(path, tcp_factory.clock)
+    for name, state in history.rooms.items():
+
+        room = tcp_factory.rooms.get_room(name)
+        room.strategies = list(state.strategies)
+        if state.epoch:
+            room.epoch = state.epoch
+        room.returning = dict(state.roster)
+
+    tcp_factory.history = history
+    if any(room.returning for room in tcp_factory.rooms.values()):
+        tcp_factory.clock.callLater(RESUME_GRACE, tcp_factory.end_resume)
+
+    return history
 
 
 class ServerInstance:
 
-    def __init__(self, tcp_port: int, udp_port: int) -> None:
+    def __init__(self, tcp_port: int, udp_port: int,
+                 record: Optional[str] = None,
+                 history: Optional[str] = None) -> None:
 
-        self.udp_clients = []
-        self.data_queue = DataQueue([], [])
+        self.rooms = Rooms()
 
+        self.tcp_factory = TCP_Factory(self.rooms)
+        self.history = start_history(history, self.tcp_factory)
+        self.tcp_port: Optional[IListeningPort] = None
         self.tcp_endpoint = TCP4ServerEndpoint(reactor, tcp_port)
-        self.tcp_endpoint.listen(TCP_Factory(self.data_queue))
-        reactor.listenUDP(udp_port, UDP_Server(self.udp_clients,
-                                               self.data_queue))
+        deferred = self.tcp_endpoint.listen(self.tcp_factory)
+        deferred.addCallback(self._tcp_listening)
+
+        self.udp_server = UDP_Server(self.rooms)
+        reactor.listenUDP(udp_port, self.udp_server)
+
+        server_metrics.watch(self.tcp_factory, self.udp_server)
+
+        self.recorder = start_recording(record, self.tcp_factory,
+                                        self.udp_server)
+        if self.recorder is not None:
+            reactor.addSystemEventTrigger("before", "shutdown",
+                                          self.recorder.close)
+
+        if self.history is not None:
+            reactor.addSystemEventTrigger("before", "shutdown",
+                                          self.history.close)
+
+    def _tcp_listening(self, port: IListeningPort) -> None:
+
+        self.tcp_port = port
 
     def close(self) -> None:
-        self.data_queue.q_in.append(NetData(NetworkQueue.Close))
-        self.data_queue.q_in.append(NetData(NetworkQueue.Close))
+
+        if self.history is not None:
+            self.history.close()
+
+        self.tcp_factory.close()
+        if self.tcp_port is not None:
+            self.tcp_port.stopListening()
+
+        self.udp_server.close()
+        if self.recorder is not None:
+            self.recorder.close()
@@ -1,3 +1,4 @@
+import bisect
 import logging
 import math
 import multiprocessing
@@ -8,7 +9,7 @@ from dataclasses import astuple
 from datetime import datetime
 from functools import partial
 from tkinter import ttk
-from typing import List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import pydirectinput
 import win32com
@@ -313,7 +314,10 @@ class StrategyUI(tkinter.Frame):
         self.current_driver = ""
         self.driver_list = []
 
-        self.strategies = {}
+        # By ID, see modules.History
+        self.strategies: Dict[int, PitStop] = {}
+        # IDs in the order of cb_strat
+        self.strategy_ids: List[int] = []
 
         self.fuel = tkinter.DoubleVar()
         self.tyre_set = tkinter.IntVar(value=1)
@@ -361,7 +365,7 @@ class StrategyUI(tkinter.Frame):
         l_title = ttk.Label(f_previous_strat, text="Strategy history")
         l_title.grid(row=0, column=0, columnspan=2)
 
-        self.cb_strat = ttk.Combobox(f_previous_strat, values=[""],
+        self.cb_strat = ttk.Combobox(f_previous_strat, values=[],
                                      state="readonly")
         self.cb_strat.bind("<<ComboboxSelected>>", self._show_old_strat)
         self.cb_strat.grid(row=1, column=0, columnspan=2, padx=4, pady=2)
@@ -468,13 +472,12 @@ class StrategyUI(tkinter.Frame):
             log.warning("No strategy selected")
             return
 
-        selected_strat = self.cb_strat.get()
-
-        if selected_strat not in self.strategies:
-            log.warning(f"{selected_strat} not in strategies")
+        index = self.cb_strat.current()
+        if not 0 <= index < len(self.strategy_ids):
+            log.warning(f"{self.cb_strat.get()} not in strategies")
             return
 
-        strategy: PitStop = self.strategies[selected_strat]
+        strategy = self.strategies[self.strategy_ids[index]]
 
         self.old_fuel.set(strategy.fuel)
         self.old_tyre_set.set(strategy.tyre_set + 1)
@@ -789,15 +792,45 @@ class StrategyUI(tkinter.Frame):
         self.strategy = strat
         self.b_set_strat.config(state="disabled")
 
-    def save_strategy(self, strategy: PitStop) -> None:
+    @staticmethod
+    def strategy_label(strategy_id: int, strategy: PitStop) -> str:
+
+        return f"{strategy_id} - {strategy.timestamp}"
+
+    def save_strategies(self, strategies: List[Tuple[int, PitStop]]) -> None:
+        """
+        Add the (ID, strategy) to the history, in a single combobox update
+        """
+
+        labels = []
+        in_order = True
+        for strategy_id, strategy in strategies:
+
+            if strategy_id in self.strategies:
+                continue
 
-        time_key = strategy.timestamp
-        self.strategies[time_key] = strategy
-        self.cb_strat["value"] = (*self.cb_strat["value"], time_key)
+            self.strategies[strategy_id] = strategy
+            if self.strategy_ids and strategy_id < self.strategy_ids[-1]:
+                in_order = False
+
+            bisect.insort(self.strategy_ids, strategy_id)
+            labels.append(self.strategy_label(strategy_id, strategy))
+
+        if not labels:
+            return
+
+        if in_order:
+            self.cb_strat["value"] = (*self.cb_strat["value"], *labels)
+
+        else:
+            self.cb_strat["value"] = tuple(
+                self.strategy_label(strategy_id, self.strategies[strategy_id])
+                for strategy_id in self.strategy_ids)
 
     def clear_strategy_history(self) -> None:
 
         self.strategies.clear()
+        self.strategy_ids.clear()
         self.cb_strat["value"] = ()
 
     def is_strategy_applied(self, state: bool) -> None:
@@ -13,6 +13,8 @@ from pyaccsharedmemory import (ACC_RAIN_INTENSITY,
                                ACC_TRACK_GRIP_STATUS, CarDamage,
                                Wheels)
 
+from modules.Codec import (TELEMETRY, TELEMETRY_RT, TELEMETRY_RT_BATCH,
+                           TELEMETRY_RT_SAMPLE)
 from modules.Common import convert_to_rgb, rgbtohex, string_time_from_ms
 
 log = logging.getLogger(__name__)
@@ -366,12 +368,13 @@ class TelemetryRT:
     gear: int
     speed: float
 
-    byte_format: ClassVar[str] = "!3f i f"
-    byte_size: ClassVar[int] = struct.calcsize(byte_format)
+    byte_format: ClassVar[str] = TELEMETRY_RT.format
+    byte_size: ClassVar[int] = TELEMETRY_RT.size
 
     def to_bytes(self) -> bytes:
 
-        return struct.pack(self.byte_format, *astuple(self))
+        return TELEMETRY_RT.pack(self.gas, self.brake, self.streering_angle,
+                                 self.gear, self.speed)
 
     @classmethod
     def from_bytes(cls, data: bytes) -> TelemetryRT:
@@ -379,11 +382,52 @@ class TelemetryRT:
         if len(data) > cls.byte_size:
 
             log.warning(f"Telemetry: Warning got packet of {len(data)} bytes")
-            data = data[:cls.byte_size]
 
-        unpacked_data = struct.unpack(cls.byte_format, data)
+        return TelemetryRT(*TELEMETRY_RT.unpack_from(data))
 
-        return TelemetryRT(*unpacked_data)
+
+@dataclass
+class TelemetryRTBatch:
+    """
+    TelemetryRT sampled faster than they are sent, with the sender time of
+    each sample in ms
+    """
+
+    samples: List[Tuple[int, TelemetryRT]]
+
+    # Keep a batch in one unfragmented datagram
+    max_samples: ClassVar[int] = 60
+
+    def to_bytes(self) -> bytes:
+
+        base = self.samples[0][0]
+        buffer = [TELEMETRY_RT_BATCH.pack(base, len(self.samples))]
+        for timestamp, sample in self.samples:
+            buffer.append(TELEMETRY_RT_SAMPLE.pack(
+                (timestamp - base) % 65536, sample.gas, sample.brake,
+                sample.streering_angle, sample.gear, sample.speed))
+
+        return b"".join(buffer)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> TelemetryRTBatch:
+
+        base, count = TELEMETRY_RT_BATCH.unpack_from(data)
+
+        samples = []
+        for index in range(count):
+
+            offset = TELEMETRY_RT_BATCH.size + index * TELEMETRY_RT_SAMPLE.size
+            delta, *values = TELEMETRY_RT_SAMPLE.unpack_from(data, offset)
+            samples.append((base + delta, TelemetryRT(*values)))
+
+        return TelemetryRTBatch(samples)
+
+
+def _wheels(wheels: Wheels) -> Tuple[float, float, float, float]:
+
+    return (wheels.front_left, wheels.front_right,
+            wheels.rear_left, wheels.rear_right)
 
 
 @dataclass
@@ -423,52 +467,50 @@ class Telemetry:
     driver_stint_total_time_left: int
     current_tyreset: int
 
-    byte_format: ClassVar[str] = ("!B i 11f 3i 2? B i 12f ?"
-                                  " f B 2B 5f B 4f 2i ? 3f 2i")
-    byte_size: ClassVar[int] = struct.calcsize(byte_format)
+    # Driver name lenght (B) followed by the name and the fixed part
+    byte_format: ClassVar[str] = "!B " + TELEMETRY.format[1:]
+    byte_size: ClassVar[int] = 1 + TELEMETRY.size
 
     def to_bytes(self) -> bytes:
 
-        driver_bytes = self.driver.encode("utf-8")
-
-        buffer = [
-            struct.pack("!B", len(driver_bytes)),
-            driver_bytes,
-            struct.pack("!i", self.lap),
-            struct.pack("!f", self.fuel),
-            struct.pack("!f", self.fuel_per_lap),
-            struct.pack("!f", self.fuel_estimated_laps),
-            struct.pack("!4f", *astuple(self.pad_wear)),
-            struct.pack("!4f", *astuple(self.disc_wear)),
-            struct.pack("!i", self.lap_time),
-            struct.pack("!i", self.best_time),
-            struct.pack("!i", self.previous_time),
-            struct.pack("!?", self.in_pit),
-            struct.pack("!?", self.in_pit_lane),
-            struct.pack("!B", self.session.value),
-            struct.pack("!i", self.driver_stint_time_left),
-            struct.pack("!4f", *astuple(self.tyre_pressure)),
-            struct.pack("!4f", *astuple(self.tyre_temp)),
-            struct.pack("!4f", *astuple(self.brake_temp)),
-            struct.pack("!?", self.has_wet_tyres),
-            struct.pack("!f", self.session_left),
-            struct.pack("!B", self.grip.value),
-            struct.pack("!B", self.front_pad),
-            struct.pack("!B", self.rear_pad),
-            struct.pack("!5f", *astuple(self.damage)),
-            struct.pack("!B", self.condition.value),
-            struct.pack("!4f", *astuple(self.suspension_damage)),
-            struct.pack("!i", self.current_sector_index),
-            struct.pack("!i", self.last_sector_time),
-            struct.pack("!?", self.is_lap_valid),
-            struct.pack("!f", self.air_temp),
-            struct.pack("!f", self.road_temp),
-            struct.pack("!f", self.wind),
-            struct.pack("!i", self.driver_stint_total_time_left),
-            struct.pack("!i", self.current_tyreset),
-        ]
-
-        return b"".join(buffer)
+        driver_bytes = self.driver.encode("utf-8")[:255]
+        damage = self.damage
+
+        return bytes((len(driver_bytes),)) + driver_bytes + TELEMETRY.pack(
+            self.lap,
+            self.fuel,
+            self.fuel_per_lap,
+            self.fuel_estimated_laps,
+            *_wheels(self.pad_wear),
+            *_wheels(self.disc_wear),
+            self.lap_time,
+            self.best_time,
+            self.previous_time,
+            self.in_pit,
+            self.in_pit_lane,
+            self.session.value,
+            self.driver_stint_time_left,
+            *_wheels(self.tyre_pressure),
+            *_wheels(self.tyre_temp),
+            *_wheels(self.brake_temp),
+            self.has_wet_tyres,
+            self.session_left,
+            self.grip.value,
+            self.front_pad,
+            self.rear_pad,
+            damage.front, damage.rear, damage.left, damage.right,
+            damage.center,
+            self.condition.value,
+            *_wheels(self.suspension_damage),
+            self.current_sector_index,
+            self.last_sector_time,
+            self.is_lap_valid,
+            self.air_temp,
+            self.road_temp,
+            self.wind,
+            self.driver_stint_total_time_left,
+            self.current_tyreset,
+        )
 
     @classmethod
     def from_bytes(cls, data: bytes) -> Tuple[Optional[Telemetry], str]:
@@ -480,19 +522,15 @@ class Telemetry:
             psize = len(data)
             log.warning(f"Got packet of {psize} bytes,"
                         f" expected {expected_packet_size}")
-            data = data[:expected_packet_size]
 
         try:
-            raw_data = struct.unpack(
-                f"!{lenght}s i 11f 3i 2? B i 12f ? f B 2B 5f B 4f 2i ? 3f 2i",
-                data[1:])
+            rest = TELEMETRY.unpack_from(data, 1 + lenght)
 
         except struct.error as err:
             log.error(f"{err}")
             return (None, err)
 
-        name = raw_data[0].decode("utf-8")
-        rest = raw_data[1:]
+        name = str(data[1:1 + lenght], "utf-8")
 
         return (Telemetry(
             name,
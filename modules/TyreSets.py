@@ -9,12 +9,14 @@ import time
 import tkinter
 from dataclasses import dataclass
 from tkinter import ttk
-from typing import ClassVar, List, Optional
+from typing import ClassVar, List, Optional, Tuple
 from idlelib.tooltip import Hovertip
 
 from watchdog.events import FileModifiedEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 
+from modules.Codec import TYRE_SET, TYRES_SET
+
 DUMP_FILE = "swap_dump_carjson.json"
 DUMP_FOLDER = os.path.expanduser(
     "~/Documents/Assetto Corsa Competizione/Debug")
@@ -475,20 +477,17 @@ class TyreSetData:
     marble: float
     flatspot: float
 
-    byte_format: ClassVar[str] = ("! 3f 4f")
-    byte_size: ClassVar[int] = struct.calcsize(byte_format)
+    byte_format: ClassVar[str] = TYRE_SET.format
+    byte_size: ClassVar[int] = TYRE_SET.size
 
-    def to_bytes(self) -> bytes:
+    def values(self) -> Tuple:
 
-        buffer = [
-            struct.pack("!3f", *self.treadIMO),
-            struct.pack("!f", self.grain),
-            struct.pack("!f", self.blister),
-            struct.pack("!f", self.marble),
-            struct.pack("!f", self.flatspot),
-        ]
+        return (*self.treadIMO, self.grain, self.blister, self.marble,
+                self.flatspot)
 
-        return b"".join(buffer)
+    def to_bytes(self) -> bytes:
+
+        return TYRE_SET.pack(*self.values())
 
     @classmethod
     def from_bytes(cls, data: bytes) -> TyreSetData:
@@ -496,22 +495,20 @@ class TyreSetData:
         if len(data) > cls.byte_size:
             logger.warning(
                 f"Telemetry: Warning got packet of {len(data)} bytes")
-            data = data[:cls.byte_size]
 
         try:
-            raw_data = struct.unpack(cls.byte_format, data)
-            return TyreSetData(
-                raw_data[0:3],
-                raw_data[3],
-                raw_data[4],
-                raw_data[5],
-                raw_data[6],
-            )
+            return TyreSetData(*cls._split(TYRE_SET.unpack_from(data)))
 
         except struct.error:
             logging.warning("Error in TyreSetData.frombytes")
             return TyreSetData((0, 0, 0), 0, 0, 0, 0)
 
+    @staticmethod
+    def _split(raw_data: Tuple) -> Tuple:
+
+        return (raw_data[0:3], raw_data[3], raw_data[4], raw_data[5],
+                raw_data[6])
+
 
 @dataclass
 class TyresSetData:
@@ -521,29 +518,42 @@ class TyresSetData:
     RL: TyreSetData
     RR: TyreSetData
 
-    byte_size: ClassVar[int] = TyreSetData.byte_size * 4
+    byte_size: ClassVar[int] = TYRES_SET.size
 
     def to_bytes(self) -> bytes:
 
-        buffer = [
-            self.FL.to_bytes(),
-            self.FR.to_bytes(),
-            self.RL.to_bytes(),
-            self.RR.to_bytes(),
-        ]
+        return TYRES_SET.pack(*self.FL.values(), *self.FR.values(),
+                              *self.RL.values(), *self.RR.values())
 
-        return b"".join(buffer)
+    @classmethod
+    def from_bytes(cls, data: bytes, offset: int = 0) -> TyresSetData:
+
+        try:
+            raw_data = TYRES_SET.unpack_from(data, offset)
+
+        except struct.error:
+            logging.warning("Error in TyresSetData.frombytes")
+            raw_data = (0,) * 28
+
+        tyres = [TyreSetData(*TyreSetData._split(raw_data[index:index+7]))
+                 for index in range(0, 28, 7)]
+
+        return TyresSetData(*tyres)
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> TyresSetData:
+    def list_to_bytes(cls, tyre_sets: List[TyresSetData]) -> bytes:
+        """
+        Number of set (B) followed by every set
+        """
 
-        temp = []
-        byte_index = 0
-        for _ in range(4):
+        buffer = [bytes((len(tyre_sets),))]
+        for tyre_set in tyre_sets:
+            buffer.append(tyre_set.to_bytes())
 
-            temp.append(TyreSetData.from_bytes(
-                data[byte_index:byte_index+TyreSetData.byte_size]))
+        return b"".join(buffer)
 
-            byte_index += TyreSetData.byte_size
+    @classmethod
+    def list_from_bytes(cls, data: bytes) -> List[TyresSetData]:
 
-        return TyresSetData(*temp)
+        return [cls.from_bytes(data, 1 + index * cls.byte_size)
+                for index in range(data[0])]
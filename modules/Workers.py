@@ -0,0 +1,379 @@
+"""
+Headless server running on several worker processes.
+
+Every worker listens on the same TCP and UDP ports with SO_REUSEPORT, the
+kernel spreads the clients between them. A room is owned by a single worker
+(crc32 of its name), the worker receiving a client of a room it doesn't own
+passes it to the owner through the owner inbox, a unix datagram socket:
+
+- TCP connections are handed off after their Connect packet, the socket
+  itself is sent with SCM_RIGHTS along with the data already received.
+- UDP datagrams are forwarded with the client address, the owner relays
+  them from its own socket bound on the same port.
+
+Only the first worker of a client does this extra hop, the fan-out of a
+room is done once by its owner.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import socket
+import struct
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+import twisted
+from twisted.internet import reactor, tcp
+from twisted.internet.interfaces import (IListeningPort, IReadDescriptor,
+                                         ITCPTransport)
+from twisted.python.failure import Failure
+from zope.interface import implementer
+
+from modules.Metrics import serve_metrics, server_metrics
+from modules.Server import (TCP_Factory, UDP_Server, Rooms, start_history,
+                            start_recording)
+
+log = logging.getLogger(__name__)
+
+# Inbox message kinds
+HAND_OFF = b"T"
+FORWARD = b"U"
+# Forwarded datagram client address
+ADDRESS = struct.Struct("!4sH")
+# Biggest datagram plus what a TCP connection can send with its Connect
+INBOX_MESSAGE_SIZE = 2 ** 17
+# Inbox messages read per reactor iteration
+INBOX_BATCH = 256
+# Time given to the workers to stop by themselves
+SHUTDOWN_DELAY = 2
+# Last twisted major version close_descriptor was tested with
+TWISTED_TESTED = 26
+
+
+def room_owner(name: str, workers: int) -> int:
+
+    return zlib.crc32(name.encode("utf-8")) % workers
+
+
+def reuse_port_socket(kind: int, port: int) -> socket.socket:
+    """
+    Non blocking socket bound on port, shared with the other workers
+    """
+
+    sock = socket.socket(socket.AF_INET, kind)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("", port))
+
+    if kind == socket.SOCK_STREAM:
+        sock.listen(50)
+
+    sock.setblocking(False)
+
+    return sock
+
+
+def close_supported() -> bool:
+    """
+    If close_descriptor works with the twisted in use
+    """
+
+    if not isinstance(getattr(tcp._SocketCloser, "_shouldShutdown", None),
+                      bool):
+        return False
+
+    if twisted.version.major > TWISTED_TESTED:
+        log.warning(f"Hand offs untested with twisted {twisted.__version__},"
+                    f" check close_descriptor")
+
+    return True
+
+
+def close_descriptor(transport: ITCPTransport) -> None:
+    """
+    Close the descriptor of transport, its connection going on with the one
+    sent to another worker.
+
+    Twisted shuts the socket down before closing it, for every descriptor
+    of the connection: a duplicate sent beforehand would be shut down too.
+    There is no public way to skip it, the private flag of tcp._SocketCloser
+    is the only use of twisted internals, close_supported tells if it is
+    still there.
+    """
+
+    transport._shouldShutdown = False
+    transport.loseConnection()
+
+
+def workers_supported() -> bool:
+
+    return (hasattr(socket, "SO_REUSEPORT")
+            and hasattr(socket, "send_fds")
+            and close_supported())
+
+
+class WorkerRouter:
+    """
+    Send the clients of the rooms owned by the other workers to them
+    """
+
+    def __init__(self, index: int, inboxes: List[socket.socket]) -> None:
+
+        self.index = index
+        self.inboxes = inboxes
+        self.workers = len(inboxes)
+
+    def owner(self, name: str) -> Optional[int]:
+        """
+        Worker owning room name, None when it is this one
+        """
+
+        owner = room_owner(name, self.workers)
+        if owner == self.index:
+            return None
+
+        return owner
+
+    def hand_off(self, owner: int, transport: ITCPTransport,
+                 data: bytes) -> None:
+
+        try:
+            socket.send_fds(self.inboxes[owner], [HAND_OFF + data],
+                            [transport.fileno()])
+
+        except OSError as msg:
+            log.warning(f"Hand off to worker {owner} failed: {msg}")
+            transport.loseConnection()
+            return
+
+        # The owner has its own descriptor now
+        close_descriptor(transport)
+
+    def forward(self, owner: int, addr: Tuple[str, int],
+                datagram: bytes) -> None:
+
+        header = ADDRESS.pack(socket.inet_aton(addr[0]), addr[1])
+
+        try:
+            self.inboxes[owner].send(FORWARD + header + datagram)
+
+        except BlockingIOError:
+            # Inbox full, it is UDP, drop it
+            pass
+
+
+@implementer(IReadDescriptor)
+class WorkerInbox:
+    """
+    Receive the clients handed off and the datagrams forwarded to a worker
+    """
+
+    def __init__(self, inbox: socket.socket, factory: TCP_Factory,
+                 udp_server: UDP_Server) -> None:
+
+        self.inbox = inbox
+        self.factory = factory
+        self.udp_server = udp_server
+
+    def fileno(self) -> int:
+
+        return self.inbox.fileno()
+
+    def logPrefix(self) -> str:
+
+        return "WorkerInbox"
+
+    def doRead(self) -> None:
+
+        for _ in range(INBOX_BATCH):
+
+            try:
+                message, fds, _, _ = socket.recv_fds(
+                    self.inbox, INBOX_MESSAGE_SIZE, 1)
+
+            except BlockingIOError:
+                return
+
+            kind = message[:1]
+            if kind == FORWARD:
+                host, port = ADDRESS.unpack_from(message, 1)
+                addr = (socket.inet_ntoa(host), port)
+                self.udp_server.datagramReceived(
+                    message[1+ADDRESS.size:], addr)
+
+            elif kind == HAND_OFF and fds:
+                self._adopt(fds[0], message[1:])
+
+            else:
+                log.warning(f"Invalid inbox message {message[:16]}")
+                for fd in fds:
+                    os.close(fd)
+
+    def _adopt(self, fd: int, data: bytes) -> None:
+
+        try:
+            transport = reactor.adoptStreamConnection(fd, socket.AF_INET,
+                                                      self.factory)
+
+        finally:
+            # adoptStreamConnection works on a copy of the descriptor
+            os.close(fd)
+
+        if transport is not None and data:
+            transport.protocol.dataReceived(data)
+
+    def connectionLost(self, reason: Failure) -> None:
+
+        # Only happens when the reactor stops
+        log.debug(f"Inbox closed: {reason.value}")
+
+
+class WorkerServer:
+    """
+    ServerInstance of one worker, on sockets shared with the others
+    """
+
+    def __init__(self, index: int, tcp_port: int, udp_port: int,
+                 inbox: socket.socket, inboxes: List[socket.socket],
+                 record: Optional[str] = None,
+                 history: Optional[str] = None) -> None:
+
+        self.rooms = Rooms()
+        self.router = WorkerRouter(index, inboxes)
+
+        self.tcp_factory = TCP_Factory(self.rooms, router=self.router)
+        # Rooms are owned by the same worker as long as their number
+        # doesn't change
+        self.history = start_history(history, self.tcp_factory, index)
+        tcp_socket = reuse_port_socket(socket.SOCK_STREAM, tcp_port)
+        self.tcp_port: IListeningPort = reactor.adoptStreamPort(
+            tcp_socket.fileno(), socket.AF_INET, self.tcp_factory)
+        tcp_socket.close()
+
+        self.udp_server = UDP_Server(self.rooms, self.router)
+        udp_socket = reuse_port_socket(socket.SOCK_DGRAM, udp_port)
+        self.udp_port: IListeningPort = reactor.adoptDatagramPort(
+            udp_socket.fileno(), socket.AF_INET, self.udp_server)
+        udp_socket.close()
+
+        for sock in (inbox, *inboxes):
+            sock.setblocking(False)
+
+        self.inbox = WorkerInbox(inbox, self.tcp_factory, self.udp_server)
+        reactor.addReader(self.inbox)
+
+        server_metrics.watch(self.tcp_factory, self.udp_server)
+
+        self.recorder = start_recording(record, self.tcp_factory,
+                                        self.udp_server, index)
+        if self.recorder is not None:
+            reactor.addSystemEventTrigger("before", "shutdown",
+                                          self.recorder.close)
+
+        if self.history is not None:
+            reactor.addSystemEventTrigger("before", "shutdown",
+                                          self.history.close)
+
+    def close(self) -> None:
+
+        if self.history is not None:
+            self.history.close()
+
+        reactor.removeReader(self.inbox)
+        self.tcp_factory.close()
+        self.tcp_port.stopListening()
+        self.udp_server.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+def run_worker(index: int, tcp_port: int, udp_port: int,
+               inbox: socket.socket, inboxes: List[socket.socket],
+               metrics_port: Optional[int] = None,
+               record: Optional[str] = None,
+               history: Optional[str] = None) -> None:
+    """
+    Entry point of a worker process, its metrics are served on
+    metrics_port + index, its packets recorded in record and its rooms
+    kept in history, both numbered by index
+    """
+
+    WorkerServer(index, tcp_port, udp_port, inbox, inboxes, record, history)
+    log.info(f"Worker {index} running on pid {os.getpid()}")
+
+    if metrics_port is not None:
+        serve_metrics(metrics_port + index)
+
+    reactor.run()
+
+    log.info(f"Worker {index} exiting")
+
+
+class WorkerPool:
+    """
+    Start the worker processes and wait for them
+    """
+
+    def __init__(self, workers: int, tcp_port: int, udp_port: int,
+                 metrics_port: Optional[int] = None,
+                 record: Optional[str] = None,
+                 history: Optional[str] = None) -> None:
+
+        self.workers = workers
+        self.tcp_port = tcp_port
+        self.udp_port = udp_port
+        self.metrics_port = metrics_port
+        self.record = record
+        self.history = history
+
+        # The parent must not fork its reactor, workers start a fresh
+        # interpreter and get their sockets through multiprocessing
+        self._context = multiprocessing.get_context("spawn")
+        self.processes: List[multiprocessing.Process] = []
+
+    def start(self) -> None:
+
+        pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+                 for _ in range(self.workers)]
+        inboxes = [pair[1] for pair in pairs]
+
+        for index, pair in enumerate(pairs):
+
+            process = self._context.Process(
+                target=run_worker, name=f"worker-{index}",
+                args=(index, self.tcp_port, self.udp_port, pair[0], inboxes,
+                      self.metrics_port, self.record, self.history))
+            process.start()
+            self.processes.append(process)
+
+        for pair in pairs:
+            pair[0].close()
+            pair[1].close()
+
+    def join(self) -> None:
+
+        try:
+            for process in self.processes:
+                process.join()
+
+        except KeyboardInterrupt:
+            # ctrl C in a terminal reach the workers too, give them a bit
+            # of time before stopping the ones it didn't reach
+            deadline = time.monotonic() + SHUTDOWN_DELAY
+            for process in self.processes:
+                process.join(max(0, deadline - time.monotonic()))
+
+            self.terminate()
+
+    def terminate(self) -> None:
+
+        for process in self.processes:
+
+            if process.is_alive():
+                process.terminate()
+
+        for process in self.processes:
+            process.join()